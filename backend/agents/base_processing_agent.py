@@ -1,6 +1,14 @@
+from typing import Any, Awaitable, Callable
+
 from google.adk.agents import BaseAgent
 from google.adk.agents.invocation_context import InvocationContext
 from models.agent_models import ExplanationOutput
+from services.artifact_backfill import get_artifact_backfiller
+from services.artifact_publisher import ArtifactStatus, publish_artifact
+from services.deadline import get_job_deadlines
+from services.explanation_stream import get_explanation_streams
+
+from config import get_settings
 
 
 class BaseProcessingAgent(BaseAgent):
@@ -47,3 +55,76 @@ class BaseProcessingAgent(BaseAgent):
 
         explanation = ExplanationOutput.model_validate(explanation_data)
         return job_id, explanation
+
+    async def _get_explanation_field(
+        self, context: InvocationContext, field_name: str
+    ) -> tuple[str, Any]:
+        """
+        job_id と、解説データのうち指定したフィールドの値を取得する。
+        解説生成がストリーミングで実行中の場合は、レスポンス全体を待たずに
+        そのフィールドの値が確定した時点で返す。
+
+        Args:
+            context: セッション状態を含む呼び出しコンテキスト。
+            field_name: 取得するExplanationOutputのフィールド名。
+
+        Returns:
+            job_id（文字列）とフィールドの値を含むタプル。
+        """
+        job_id = context.session.state.get("job_id")
+        stream = get_explanation_streams().get(job_id) if job_id else None
+        if stream is None:
+            job_id, explanation = await self._get_common_data(context)
+            return job_id, getattr(explanation, field_name)
+
+        # フィールドの確定は、このステージの期限まで待つ
+        value = await stream.wait_for(
+            field_name, timeout=get_job_deadlines().remaining(job_id, self.name)
+        )
+        return job_id, value
+
+    async def _produce_artifact(
+        self, job_id: str, artifact: str, produce: Callable[[], Awaitable[str]]
+    ) -> str | None:
+        """
+        成果物を生成し、そのGCSパスを返す。
+        生成した成果物は、すぐにジョブドキュメントに書き込む。
+        並列に実行している他のステージや、ジョブの完了は待たない。
+        縮退運転が有効な場合は、`degradable_stage_timeout_seconds` まで生成を待つ。
+        ステージの期限の方が早い場合は、ステージの期限まで待つ。
+        それまでに生成できなかった、または失敗した場合はNoneを返す。
+        生成はバックグラウンドで続け、ジョブの完了後に補完する。
+        補完する生成の期限は `backfill_timeout_seconds` 後とする。
+        生成に失敗した場合は、成果物の状態を `failed` にしてから例外を送出する。
+
+        Args:
+            job_id: ジョブID。
+            artifact: 成果物の種類（"illustration" または "narration"）。
+            produce: 成果物を生成してGCSパスを返すコルーチンを作る関数。
+                補完で生成し直せるよう、呼び出しのたびに新しいコルーチンを返す。
+        """
+        settings = get_settings()
+        await publish_artifact(job_id, artifact, ArtifactStatus.generating)
+        try:
+            if not settings.degradation_enabled:
+                gcs_path = await produce()
+            else:
+                deadlines = get_job_deadlines()
+                wait_seconds = deadlines.remaining(
+                    job_id, self.name, cap=settings.degradable_stage_timeout_seconds
+                )
+                deadlines.detach_stage(
+                    job_id, self.name, settings.backfill_timeout_seconds
+                )
+                # 間に合わなかった場合の状態は、ArtifactBackfillerが書き込む
+                gcs_path = await get_artifact_backfiller().wait_or_backfill(
+                    job_id, artifact, produce, wait_seconds
+                )
+        except Exception:
+            await publish_artifact(job_id, artifact, ArtifactStatus.failed)
+            raise
+        if gcs_path is not None:
+            await publish_artifact(
+                job_id, artifact, ArtifactStatus.ready, gcs_path=gcs_path
+            )
+        return gcs_path
@@ -1,10 +1,20 @@
+from typing import AsyncGenerator
+
 from callback import (
     after_explainer_agent_callback,
+    after_explainer_model_callback,
+    before_explainer_model_callback,
     parse_and_store_llm_response_as_explanation,
+    publish_explanation_fields,
 )
 from google.adk.agents import LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models import BaseLlm, LLMRegistry
 from models.agent_models import ExplanationOutput
 from services.logging_service import get_logger
+from services.rate_limiter import RateLimitedLlm
+from services.stage_pool import PipelineStage, get_stage_pools
 
 from .config import GENERATE_CONFIG, MODEL_ID
 from .prompt import SYSTEM_INSTRUCTION_PROMPT
@@ -19,16 +29,32 @@ class ExplainerAgent(LlmAgent):
     `ExplanationOutput`スキーマで定義された構造化JSONオブジェクトを出力する。
     """
 
-    def __init__(self):
+    def __init__(self, llm: BaseLlm | None = None):
+        llm = llm or LLMRegistry.new_llm(MODEL_ID)
         super().__init__(
             name="ExplainerAgent",
             description="子供向けの解説、イラストプロンプト、親向けのヒントを生成します。",
-            model=MODEL_ID,
+            # 共有のモデルインスタンスが渡された場合はそれを使い、接続を使い回す。
+            # 呼び出しはインスタンス内のすべてのジョブで共有するレートリミッターに通す
+            model=RateLimitedLlm(llm=llm, model=llm.model),
             generate_content_config=GENERATE_CONFIG,
             instruction=SYSTEM_INSTRUCTION_PROMPT,
             output_key="explanation_data",
             output_schema=ExplanationOutput,
-            after_model_callback=parse_and_store_llm_response_as_explanation,
+            before_model_callback=before_explainer_model_callback,
+            after_model_callback=[
+                after_explainer_model_callback,
+                parse_and_store_llm_response_as_explanation,
+                publish_explanation_fields,
+            ],
             after_agent_callback=after_explainer_agent_callback,
         )
         self._logger = get_logger(__name__)
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        """解説ステージのワーカーを確保してから、Geminiで解説を生成する。"""
+        async with get_stage_pools().slot(PipelineStage.explain):
+            async for event in super()._run_async_impl(ctx):
+                yield event
@@ -44,14 +44,15 @@ SYSTEM_INSTRUCTION_PROMPT = """
 
 【フィールドの意味】
 - child_explanation: 子ども向けのやさしい説明（日本語、短文）。
-- child_explanation_ssml: 上記説明の SSML 版（<speak>…</speak>）。
-- parent_hint: 保護者向けの補足（日本語、1〜2文）。
 - illustration_prompt: 画像生成に渡す指示文（簡潔・安全・具体）。
+- child_explanation_ssml: 子ども向け説明の SSML 版（<speak>…</speak>）。
+- parent_hint: 保護者向けの補足（日本語、1〜2文）。
 - needs_clarification: 追加の確認が必要なら true、不要なら false。
 - clarification_question: 追質問（needs_clarification が true のときのみ1文、親向け）。
 
 【出力形式】
 - 必ず JSON のみを返す。キー名・型・必須性はスキーマに従う。
+- キーは【フィールドの意味】に記載した順に出力する。
 
 書き起こしテキスト:
 {transcribed_text}
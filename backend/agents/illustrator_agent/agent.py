@@ -1,3 +1,7 @@
+import json
+import posixpath
+import time
+from typing import Awaitable
 from urllib.parse import urlparse
 from uuid import uuid4
 
@@ -5,17 +9,36 @@ from agents.base_processing_agent import BaseProcessingAgent
 from google import genai
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event
+from google.api_core import exceptions as google_exceptions
 from google.genai import types
 from google.genai.types import Content, Part
 from models.agent_models import AgentProcessingError, IllustrationResult
 from services import storage_service
+from services.artifact_cache import ArtifactCache, content_key, get_artifact_cache
+from services.blocking_executor import run_blocking
+from services.deadline import get_job_deadlines
 from services.firestore_session_service import FirestoreSessionService
+from services.hedging import get_hedger
 from services.logging_service import get_logger
+from services.rate_limiter import get_rate_limiter
+from services.stage_pool import PipelineStage, get_stage_pools
+from services.temp_generation_sweeper import TEMP_GENERATIONS_PREFIX
+from services.timing_service import get_job_timing_tracker
 
-from config import AGENT_ERROR_MESSAGES, get_settings
+from config import AGENT_ERROR_MESSAGES, IllustrationPlacement, get_settings
 
 from .config import GENERATE_CONFIG_PARAMS, IMAGEN_MODEL_ID
 
+ILLUSTRATION_CACHE_NAME = "illustration"
+
+# キャッシュ用にコピーしたイラストを保存する、生成画像バケット内のプレフィックス
+ILLUSTRATION_CACHE_PREFIX = "illustration_cache"
+
+# 生成されるイラストを決定する設定を、キャッシュキー用に正規化したJSON文字列
+_MODEL_AND_GENERATE_CONFIG = json.dumps(
+    {"model": IMAGEN_MODEL_ID, **GENERATE_CONFIG_PARAMS}, sort_keys=True
+)
+
 
 class IllustratorAgent(BaseProcessingAgent):
     """
@@ -26,78 +49,40 @@ class IllustratorAgent(BaseProcessingAgent):
     Google Cloud Storageバケットに直接保存される。
     """
 
-    def __init__(self):
+    def __init__(self, genai_client: genai.Client):
         super().__init__(name="IllustratorAgent")
         self._settings = get_settings()
         self._model = IMAGEN_MODEL_ID
         self._logger = get_logger(__name__)
 
-        # Vertex AI APIを使用するクライアントを初期化
-        self._client = genai.Client(
-            vertexai=True,
-            project=self._settings.google_cloud_project,
-            location=self._settings.google_cloud_location,
-        )
+        # Vertex AI APIを使用する、プロセス全体で共有されるクライアント
+        self._client = genai_client
 
     async def _run_async_impl(self, context: InvocationContext):
         """
         プロンプトからイラストを生成し、Cloud Storageに保存する。
         """
-        job_id, explanation = await self._get_common_data(context)
+        job_id, prompt = await self._get_explanation_field(
+            context, "illustration_prompt"
+        )
         user_id = context.session.user_id
-        prompt = explanation.illustration_prompt
         self._logger.info(f"[{job_id}] イラスト生成を開始します。プロンプト: {prompt}")
 
         # 最終的な保存先のファイル名を定義
         destination_blob_name = f"{user_id}/{job_id}/{uuid4()}.png"
 
-        # APIへ渡す一時的な出力先「ディレクトリ」を定義
-        output_gcs_directory = (
-            f"gs://{self._settings.generated_image_bucket}/temp_generations/{job_id}/"
-        )
-
-        # 画像生成の設定
-        generate_config = types.GenerateImagesConfig(
-            output_gcs_uri=output_gcs_directory, **GENERATE_CONFIG_PARAMS
-        )
-
         try:
-            # Imagenモデルを呼び出して画像を生成
-            response = self._client.models.generate_images(
-                model=self._model, prompt=prompt, config=generate_config
-            )
-
-            if not response.generated_images:
-                raise ValueError("画像生成に失敗しました。")
-
-            generated_image = response.generated_images[0]
-            if not generated_image.image or not generated_image.image.gcs_uri:
-                raise ValueError("生成された画像にGCS URIが含まれていません。")
-
-            # 画像は一時的なGCSパスに保存される
-            temp_gcs_uri = generated_image.image.gcs_uri
-            self._logger.info(
-                f"[{job_id}] イラストを一時GCSパスに保存しました: {temp_gcs_uri}"
-            )
-
-            # 一時パスをパースしてバケットとBlob名を取得
-            parsed_uri = urlparse(temp_gcs_uri)
-            temp_bucket_name = parsed_uri.netloc
-            temp_blob_name = parsed_uri.path.lstrip("/")
-
-            # GCS内でファイルを目的のパスに移動
-            final_gcs_uri = await storage_service.rename_blob(
-                bucket_name=temp_bucket_name,
-                blob_name=temp_blob_name,
-                new_name=destination_blob_name,
+            # 縮退運転では、間に合わない場合はイラストなしで進め、
+            # 生成を続けて後から補完する
+            final_gcs_uri = await self._produce_artifact(
+                job_id,
+                "illustration",
+                lambda: self._illustrate(job_id, prompt, destination_blob_name),
             )
-            self._logger.info(
-                f"[{job_id}] イラストを目的のGCSパスに移動しました: {final_gcs_uri}"
-            )
-
-            result = IllustrationResult(
-                job_id=job_id,
-                image_gcs_path=final_gcs_uri,
+            result = (
+                IllustrationResult(job_id=job_id, image_gcs_path=final_gcs_uri)
+                if final_gcs_uri is not None
+                else None
             )
 
             # メモリ上のセッション状態をまず更新
@@ -130,10 +115,12 @@ class IllustratorAgent(BaseProcessingAgent):
                 raise
 
             # 状態更新を含まない、単純な完了イベントをyieldする
-            yield Event(
-                author=self.name,
-                content=Content(parts=[Part(text="イラストの生成に成功しました。")]),
+            message = (
+                "イラストの生成に成功しました。"
+                if result is not None
+                else "イラストは完了後に補完します。"
             )
+            yield Event(author=self.name, content=Content(parts=[Part(text=message)]))
 
         except Exception as e:
             self._logger.error(
@@ -146,3 +133,234 @@ class IllustratorAgent(BaseProcessingAgent):
                 ),
                 original_exception=e,
             ) from e
+
+    async def _illustrate(
+        self, job_id: str, prompt: str, destination_blob_name: str
+    ) -> str:
+        """
+        イラストをジョブの保存先に用意し、そのURIを返す。
+        同じプロンプトと生成設定から生成済みのイラストがあれば、Imagenの呼び出しを省略する。
+        """
+        cache_key = None
+        if self._settings.illustration_cache_enabled:
+            cache_key = illustration_cache_key(prompt)
+            final_gcs_uri = await self._reuse_cached_image(
+                job_id, cache_key, destination_blob_name
+            )
+            if final_gcs_uri is not None:
+                return final_gcs_uri
+
+        async with get_stage_pools().slot(PipelineStage.illustrate):
+            started_at = time.perf_counter()
+            final_gcs_uri = await self._generate_image(
+                job_id, prompt, destination_blob_name
+            )
+        if cache_key is not None:
+            # ジョブを待たせないよう、キャッシュへの登録はバックグラウンドで行う
+            _get_illustration_cache().run_in_background(
+                self._register_cached_image(
+                    cache_key, final_gcs_uri, time.perf_counter() - started_at
+                )
+            )
+        return final_gcs_uri
+
+    async def _generate_image(
+        self, job_id: str, prompt: str, destination_blob_name: str
+    ) -> str:
+        """
+        Imagenでイラストを生成し、ジョブの保存先に配置してそのURIを返す。
+        配置の方式は `ILLUSTRATION_PLACEMENT` で切り替える。
+        """
+        bucket_name = self._settings.generated_image_bucket
+        placement = self._settings.illustration_placement
+        if placement == IllustrationPlacement.inline:
+            # 出力先を指定しない場合、画像のバイト列がレスポンスに含まれる
+            generate_config = types.GenerateImagesConfig(**GENERATE_CONFIG_PARAMS)
+        elif placement == IllustrationPlacement.reference:
+            # ジョブの保存先「ディレクトリ」に直接書き込ませる
+            # （ファイル名はImagenが決める）
+            output_gcs_directory = (
+                f"gs://{bucket_name}/{posixpath.dirname(destination_blob_name)}/"
+            )
+            generate_config = types.GenerateImagesConfig(
+                output_gcs_uri=output_gcs_directory, **GENERATE_CONFIG_PARAMS
+            )
+        else:
+            # APIへ渡す一時的な出力先「ディレクトリ」を定義
+            output_gcs_directory = (
+                f"gs://{bucket_name}/{TEMP_GENERATIONS_PREFIX}{job_id}/"
+            )
+            generate_config = types.GenerateImagesConfig(
+                output_gcs_uri=output_gcs_directory, **GENERATE_CONFIG_PARAMS
+            )
+
+        limiter = get_rate_limiter("imagen")
+
+        def generate() -> Awaitable[types.GenerateImagesResponse]:
+            # Imagenモデルを呼び出して画像を生成
+            # （同期クライアントのためイベントループ外で実行）
+            return run_blocking(
+                self._client.models.generate_images,
+                model=self._model,
+                prompt=prompt,
+                # ステージの期限までの残り時間を、リクエストのタイムアウトとして渡す
+                config=generate_config.model_copy(
+                    update={"http_options": self._http_options(job_id)}
+                ),
+            )
+
+        async def generate_hedged() -> types.GenerateImagesResponse:
+            # 応答が遅い場合は2つ目のリクエストを送る（ヘッジ）。
+            # ヘッジは、採用されなかった画像が残らない配置に限る。
+            # inline は画像を保存せず、rename の一時パスはスイーパーが削除する。
+            # 2つ目は、レートリミッターのトークンを待たずに取れる場合だけ送る
+            if placement == IllustrationPlacement.reference:
+                return await generate()
+            return await get_hedger("imagen").call(
+                generate, job_id, can_hedge=limiter.try_acquire
+            )
+
+        timings = get_job_timing_tracker()
+        with timings.external_call(job_id, self.name, "imagen"):
+            response = await get_job_deadlines().within(
+                job_id, self.name, limiter.call(generate_hedged, job_id)
+            )
+
+        if not response.generated_images:
+            raise ValueError("画像生成に失敗しました。")
+
+        generated_image = response.generated_images[0]
+        if not generated_image.image:
+            raise ValueError("生成された画像が含まれていません。")
+
+        if placement == IllustrationPlacement.inline:
+            if not generated_image.image.image_bytes:
+                raise ValueError("生成された画像にバイト列が含まれていません。")
+            # GCSに1回でアップロード
+            with timings.external_call(job_id, self.name, "gcs"):
+                final_gcs_uri = await storage_service.upload_blob_from_memory(
+                    bucket_name=bucket_name,
+                    destination_blob_name=destination_blob_name,
+                    data=generated_image.image.image_bytes,
+                    content_type=GENERATE_CONFIG_PARAMS["output_mime_type"],
+                )
+            self._logger.info(
+                f"[{job_id}] イラストを目的のGCSパスにアップロードしました: "
+                f"{final_gcs_uri}"
+            )
+            return final_gcs_uri
+
+        if not generated_image.image.gcs_uri:
+            raise ValueError("生成された画像にGCS URIが含まれていません。")
+
+        if placement == IllustrationPlacement.reference:
+            # 画像はジョブの保存先に書き込まれているため、そのまま参照する
+            final_gcs_uri = generated_image.image.gcs_uri
+            self._logger.info(
+                f"[{job_id}] イラストを目的のGCSパスに保存しました: {final_gcs_uri}"
+            )
+            return final_gcs_uri
+
+        # 画像は一時的なGCSパスに保存される
+        temp_gcs_uri = generated_image.image.gcs_uri
+        self._logger.info(
+            f"[{job_id}] イラストを一時GCSパスに保存しました: {temp_gcs_uri}"
+        )
+
+        # 一時パスをパースしてバケットとBlob名を取得
+        parsed_uri = urlparse(temp_gcs_uri)
+        temp_bucket_name = parsed_uri.netloc
+        temp_blob_name = parsed_uri.path.lstrip("/")
+
+        # GCS内でファイルを目的のパスに移動
+        with timings.external_call(job_id, self.name, "gcs"):
+            final_gcs_uri = await storage_service.rename_blob(
+                bucket_name=temp_bucket_name,
+                blob_name=temp_blob_name,
+                new_name=destination_blob_name,
+            )
+        self._logger.info(
+            f"[{job_id}] イラストを目的のGCSパスに移動しました: {final_gcs_uri}"
+        )
+        return final_gcs_uri
+
+    def _http_options(self, job_id: str) -> types.HttpOptions:
+        """ステージの期限までの残り時間をタイムアウトとする、Imagenへのリクエストのオプション。"""
+        timeout = get_job_deadlines().remaining(job_id, self.name)
+        return types.HttpOptions(timeout=int(timeout * 1000))
+
+    async def _reuse_cached_image(
+        self, job_id: str, cache_key: str, destination_blob_name: str
+    ) -> str | None:
+        """
+        生成済みのイラストをキャッシュから探し、このジョブのパスにコピーしてそのURIを返す。
+        キャッシュ用のファイルは予算の超過時に削除されるため、常にコピーして使う。
+        見つからない場合やコピーに失敗した場合はNoneを返す。
+        """
+        cache = _get_illustration_cache()
+        try:
+            cached = await cache.lookup(cache_key)
+        except Exception as e:
+            self._logger.warning(
+                f"[{job_id}] イラストキャッシュの検索に失敗しました: {e}"
+            )
+            return None
+        if cached is None:
+            return None
+
+        try:
+            with get_job_timing_tracker().external_call(job_id, self.name, "gcs"):
+                gcs_path = await storage_service.copy_blob(
+                    cached.gcs_uri, destination_blob_name
+                )
+        except google_exceptions.NotFound:
+            self._logger.warning(
+                f"[{job_id}] キャッシュされたイラストが見つからないため、"
+                f"エントリを破棄します: {cached.gcs_uri}"
+            )
+            await cache.invalidate(cache_key, cached.gcs_uri)
+            return None
+        except Exception as e:
+            self._logger.warning(
+                f"[{job_id}] キャッシュされたイラストのコピーに失敗したため、"
+                f"イラストを生成します: {e}"
+            )
+            return None
+
+        self._logger.info(
+            f"[{job_id}] 生成済みのイラストをコピーして再利用します: {cached.gcs_uri} "
+            f"-> {gcs_path}"
+        )
+        return gcs_path
+
+    async def _register_cached_image(
+        self, cache_key: str, gcs_path: str, generation_seconds: float
+    ) -> None:
+        """
+        生成したイラストをキャッシュ専用のパスにコピーし、キャッシュに登録する。
+        ジョブのファイルはユーザーの操作で削除される可能性があるため、コピーを登録する。
+        """
+        cached_uri = await storage_service.copy_blob(
+            gcs_path, f"{ILLUSTRATION_CACHE_PREFIX}/{cache_key}/{uuid4()}.png"
+        )
+        size_bytes = await storage_service.get_blob_size(cached_uri)
+        await _get_illustration_cache().register(
+            cache_key,
+            cached_uri,
+            size_bytes=size_bytes,
+            generation_seconds=generation_seconds,
+        )
+
+
+def illustration_cache_key(prompt: str) -> str:
+    """プロンプト、モデル、生成設定から、生成されるイラストのキャッシュキーを生成する。"""
+    return content_key(prompt, _MODEL_AND_GENERATE_CONFIG)
+
+
+def _get_illustration_cache() -> ArtifactCache:
+    settings = get_settings()
+    return get_artifact_cache(
+        ILLUSTRATION_CACHE_NAME,
+        variety=settings.illustration_cache_variety,
+        storage_budget_bytes=settings.illustration_cache_budget_bytes,
+    )
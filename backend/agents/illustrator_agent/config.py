@@ -4,7 +4,7 @@ from google.genai import types
 IMAGEN_MODEL_ID = "imagen-4.0-fast-generate-001"
 
 # 画像生成の基本設定
-# この辞書は、agent.pyで動的に`output_gcs_uri`が追加されてから利用されます。
+# この辞書は、agent.pyで配置の方式に応じて`output_gcs_uri`が追加されてから利用されます。
 GENERATE_CONFIG_PARAMS = {
     # 生成する画像の数
     "number_of_images": 1,
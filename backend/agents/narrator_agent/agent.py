@@ -1,19 +1,42 @@
+import time
 from uuid import uuid4
 
 from agents.base_processing_agent import BaseProcessingAgent
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event
-from google.cloud.texttospeech import SynthesisInput, TextToSpeechClient
+from google.api_core import exceptions as google_exceptions
+from google.cloud.texttospeech import (
+    AudioConfig,
+    SynthesisInput,
+    TextToSpeechClient,
+    VoiceSelectionParams,
+)
 from google.genai.types import Content, Part
 from models.agent_models import AgentProcessingError, NarrationResult
+from services.artifact_cache import ArtifactCache, content_key, get_artifact_cache
+from services.blocking_executor import run_blocking
+from services.deadline import get_job_deadlines
 from services.firestore_session_service import FirestoreSessionService
+from services.hedging import get_hedger
 from services.logging_service import get_logger
-from services.storage_service import upload_blob_from_memory
+from services.rate_limiter import get_rate_limiter
+from services.stage_pool import PipelineStage, get_stage_pools
+from services.storage_service import copy_blob, get_blob_size, upload_blob_from_memory
+from services.timing_service import get_job_timing_tracker
 
 from config import AGENT_ERROR_MESSAGES, get_settings
 
 from .config import AUDIO_CONFIG, OPERATION_TIMEOUT, VOICE_SELECTION_PARAMS
 
+NARRATION_CACHE_NAME = "narration"
+# キャッシュ用の音声を保持するパス（音声バケット内）
+NARRATION_CACHE_PREFIX = "narration_cache"
+
+# 合成される音声を決定する設定を、キャッシュキー用に正規化したJSON文字列
+_VOICE_AND_AUDIO_CONFIG = VoiceSelectionParams.to_json(
+    VOICE_SELECTION_PARAMS, indent=None, sort_keys=True
+) + AudioConfig.to_json(AUDIO_CONFIG, indent=None, sort_keys=True)
+
 
 class NarratorAgent(BaseProcessingAgent):
     """
@@ -24,33 +47,24 @@ class NarratorAgent(BaseProcessingAgent):
     Google Cloud Storageバケットにアップロードする。
     """
 
-    def __init__(self):
+    def __init__(self, tts_client: TextToSpeechClient):
         super().__init__(name="NarratorAgent")
         self._settings = get_settings()
-        self._client = TextToSpeechClient()
+        # プロセス全体で共有されるクライアントを使用する
+        self._client = tts_client
         self._logger = get_logger(__name__)
 
     async def _run_async_impl(self, context: InvocationContext):
         """
         SSMLテキストから音声を生成し、Cloud Storageに保存する。
         """
-        job_id, explanation = await self._get_common_data(context)
-        ssml_text = explanation.child_explanation_ssml
+        job_id, ssml_text = await self._get_explanation_field(
+            context, "child_explanation_ssml"
+        )
 
         self._logger.info(f"[{job_id}] 音声合成を開始します (SSML): {ssml_text}")
 
         try:
-            synthesis_input = SynthesisInput(ssml=ssml_text)
-
-            # Text-to-Speech APIを呼び出し
-            response = self._client.synthesize_speech(
-                input=synthesis_input,
-                voice=VOICE_SELECTION_PARAMS,
-                audio_config=AUDIO_CONFIG,
-                timeout=OPERATION_TIMEOUT,
-            )
-
-            # GCSにアップロード
             user_id = context.session.user_id
             if not user_id:
                 raise ValueError("セッションからユーザーIDが取得できませんでした。")
@@ -58,16 +72,17 @@ class NarratorAgent(BaseProcessingAgent):
             file_name = f"{job_id}-{uuid4()}.mp3"
             destination_blob_name = f"{user_id}/{job_id}/{file_name}"
 
-            gcs_path = await upload_blob_from_memory(
-                bucket_name=self._settings.processed_audio_bucket,
-                destination_blob_name=destination_blob_name,
-                data=response.audio_content,
-                content_type="audio/mpeg",
+            # 縮退運転では、間に合わない場合は音声なしで進め、合成を続けて後から補完する
+            gcs_path = await self._produce_artifact(
+                job_id,
+                "narration",
+                lambda: self._narrate(job_id, ssml_text, destination_blob_name),
             )
-
-            self._logger.info(f"[{job_id}] 音声合成が完了しました: {gcs_path}")
-
-            result = NarrationResult(job_id=job_id, final_audio_gcs_path=gcs_path)
+            if gcs_path is None:
+                result = None
+            else:
+                self._logger.info(f"[{job_id}] 音声合成が完了しました: {gcs_path}")
+                result = NarrationResult(job_id=job_id, final_audio_gcs_path=gcs_path)
 
             # メモリ上のセッション状態をまず更新
             context.session.state["narration"] = result
@@ -99,12 +114,12 @@ class NarratorAgent(BaseProcessingAgent):
                 raise
 
             # 状態更新を含まない、単純な完了イベントをyieldする
-            yield Event(
-                author=self.name,
-                content=Content(
-                    parts=[Part(text="ナレーションの生成に成功しました。")]
-                ),
+            message = (
+                "ナレーションの生成に成功しました。"
+                if result is not None
+                else "ナレーションは完了後に補完します。"
             )
+            yield Event(author=self.name, content=Content(parts=[Part(text=message)]))
 
         except Exception as e:
             self._logger.error(
@@ -118,3 +133,138 @@ class NarratorAgent(BaseProcessingAgent):
                 ),
                 original_exception=e,
             ) from e
+
+    async def _narrate(
+        self, job_id: str, ssml_text: str, destination_blob_name: str
+    ) -> str:
+        """SSMLテキストから合成した音声をジョブの保存先に用意し、そのGCSパスを返す。"""
+        timings = get_job_timing_tracker()
+        # 同じSSMLと音声設定から合成済みの音声があれば、合成とアップロードを省略する
+        cache_key = None
+        if self._settings.tts_cache_enabled:
+            cache_key = narration_cache_key(ssml_text)
+            gcs_path = await self._reuse_cached_audio(
+                job_id, cache_key, destination_blob_name
+            )
+            if gcs_path is not None:
+                return gcs_path
+
+        synthesis_input = SynthesisInput(ssml=ssml_text)
+
+        limiter = get_rate_limiter("tts")
+
+        def synthesize():
+            # Text-to-Speech APIを呼び出し
+            # （同期クライアントのためイベントループ外で実行）
+            return run_blocking(
+                self._client.synthesize_speech,
+                input=synthesis_input,
+                voice=VOICE_SELECTION_PARAMS,
+                audio_config=AUDIO_CONFIG,
+                timeout=get_job_deadlines().remaining(
+                    job_id, self.name, cap=OPERATION_TIMEOUT
+                ),
+            )
+
+        async def synthesize_hedged():
+            # 合成は冪等なため、応答が遅い場合は2つ目のリクエストを送る（ヘッジ）。
+            # 2つ目はレートリミッターのトークンを待たずに取れる場合だけ送る
+            return await get_hedger("tts").call(
+                synthesize, job_id, can_hedge=limiter.try_acquire
+            )
+
+        async with get_stage_pools().slot(PipelineStage.narrate):
+            started_at = time.perf_counter()
+            with timings.external_call(job_id, self.name, "tts"):
+                # レート制限とヘッジの待ちを含めて、ステージの期限までに終える
+                response = await get_job_deadlines().within(
+                    job_id, self.name, limiter.call(synthesize_hedged, job_id)
+                )
+            synthesis_seconds = time.perf_counter() - started_at
+
+            # GCSにアップロード
+            with timings.external_call(job_id, self.name, "gcs"):
+                gcs_path = await upload_blob_from_memory(
+                    bucket_name=self._settings.processed_audio_bucket,
+                    destination_blob_name=destination_blob_name,
+                    data=response.audio_content,
+                    content_type="audio/mpeg",
+                )
+
+        if cache_key is not None:
+            # ジョブを待たせないよう、キャッシュへの登録はバックグラウンドで行う
+            _get_narration_cache().run_in_background(
+                self._register_cached_audio(cache_key, gcs_path, synthesis_seconds)
+            )
+
+        return gcs_path
+
+    async def _reuse_cached_audio(
+        self, job_id: str, cache_key: str, destination_blob_name: str
+    ) -> str | None:
+        """
+        合成済みの音声をキャッシュから探し、このジョブのパスにコピーしてそのGCSパスを返す。
+        キャッシュ用のファイルは予算の超過時に削除されるため、常にコピーして使う。
+        見つからない場合やコピーに失敗した場合はNoneを返す。
+        """
+        cache = _get_narration_cache()
+        try:
+            cached = await cache.lookup(cache_key)
+        except Exception as e:
+            self._logger.warning(f"[{job_id}] 音声キャッシュの検索に失敗しました: {e}")
+            return None
+        if cached is None:
+            return None
+
+        try:
+            with get_job_timing_tracker().external_call(job_id, self.name, "gcs"):
+                gcs_path = await copy_blob(cached.gcs_uri, destination_blob_name)
+        except google_exceptions.NotFound:
+            self._logger.warning(
+                f"[{job_id}] キャッシュされた音声が見つからないため、"
+                f"エントリを破棄します: {cached.gcs_uri}"
+            )
+            await cache.invalidate(cache_key, cached.gcs_uri)
+            return None
+        except Exception as e:
+            self._logger.warning(
+                f"[{job_id}] キャッシュされた音声のコピーに失敗したため、"
+                f"音声を合成します: {e}"
+            )
+            return None
+
+        self._logger.info(
+            f"[{job_id}] 合成済みの音声をコピーして再利用します: {cached.gcs_uri} -> "
+            f"{gcs_path}"
+        )
+        return gcs_path
+
+    async def _register_cached_audio(
+        self, cache_key: str, gcs_path: str, synthesis_seconds: float
+    ) -> None:
+        """
+        合成した音声をキャッシュ専用のパスにコピーし、キャッシュに登録する。
+        ジョブのファイルはユーザーの操作で削除される可能性があるため、コピーを登録する。
+        """
+        cached_uri = await copy_blob(
+            gcs_path, f"{NARRATION_CACHE_PREFIX}/{cache_key}/{uuid4()}.mp3"
+        )
+        size_bytes = await get_blob_size(cached_uri)
+        await _get_narration_cache().register(
+            cache_key,
+            cached_uri,
+            size_bytes=size_bytes,
+            generation_seconds=synthesis_seconds,
+        )
+
+
+def narration_cache_key(ssml_text: str) -> str:
+    """SSML、声の設定、出力音声の設定から、合成される音声のキャッシュキーを生成する。"""
+    return content_key(ssml_text, _VOICE_AND_AUDIO_CONFIG)
+
+
+def _get_narration_cache() -> ArtifactCache:
+    return get_artifact_cache(
+        NARRATION_CACHE_NAME,
+        storage_budget_bytes=get_settings().tts_cache_budget_bytes,
+    )
@@ -1,3 +1,4 @@
+from callback import store_answer_in_cache
 from google.adk.agents import BaseAgent
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event
@@ -8,11 +9,11 @@ from models.agent_models import (
     ExplanationOutput,
     ExplanationResult,
     FinalJobData,
-    IllustrationResult,
-    NarrationResult,
 )
+from services.artifact_backfill import get_artifact_backfiller
 from services.firestore_service import update_job_status
 from services.logging_service import get_logger
+from services.stage_pool import PipelineStage, get_stage_pools
 
 from config import AGENT_ERROR_MESSAGES
 
@@ -20,12 +21,19 @@ from config import AGENT_ERROR_MESSAGES
 class ResultWriterAgent(BaseAgent):
     """
     ワークフローの最終エージェント。結果をFirestoreに書き込む。
-    生成されたすべての成果物（文字起こし、解説、画像パス、音声パス）を
-    収集・構造化し、Firestoreドキュメントを 'completed' ステータスと最終データで更新する。
+    文字起こしと解説を構造化し、Firestoreドキュメントを 'completed' ステータスと
+    最終データで更新する。イラストと音声は各ステージが書き込み済みのため、扱わない。
+    各ステージが書き込み済みのフィールドは書き込みバッファが除外するため、
+    通常は未書き込みの解説のフィールドとステータスだけが書き込まれる。
     """
 
     def __init__(self, db_client: firestore.AsyncClient):
-        super().__init__(name="ResultWriterAgent")
+        super().__init__(
+            name="ResultWriterAgent",
+            # 結果の書き込みに成功した回答を、
+            # 次の同じ質問のために回答キャッシュに登録する
+            after_agent_callback=store_answer_in_cache,
+        )
         self._logger = get_logger(__name__)
         self._db_client = db_client
 
@@ -37,10 +45,10 @@ class ResultWriterAgent(BaseAgent):
 
         try:
             transcribed_text: str = state["transcribed_text"]
-            explanation_data: ExplanationOutput = state["explanation_data"]
-            illustration = IllustrationResult.model_validate(state["illustration"])
-            narration = NarrationResult.model_validate(state["narration"])
-
+            # 再開したジョブでは、永続化されたセッションから辞書として読み込まれる
+            explanation_data = ExplanationOutput.model_validate(
+                state["explanation_data"]
+            )
             explanation = ExplanationResult(
                 job_id=job_id,
                 original_text=transcribed_text,
@@ -53,13 +61,16 @@ class ResultWriterAgent(BaseAgent):
                 childExplanation=explanation.child_explanation,
                 parentHint=explanation.parent_hint,
                 illustrationPrompt=explanation.illustration_prompt,
-                imageGcsPath=illustration.image_gcs_path,
-                finalAudioGcsPath=narration.final_audio_gcs_path,
             )
             # Firestoreに完了ステータスと最終データを書き込み
-            await update_job_status(
-                self._db_client, job_id, "completed", final_data_model.model_dump()
-            )
+            async with get_stage_pools().slot(PipelineStage.write):
+                await update_job_status(
+                    self._db_client,
+                    job_id,
+                    "completed",
+                    final_data_model.model_dump(),
+                )
+            get_artifact_backfiller().finalize(job_id, completed=True)
 
             final_message = f"ジョブ {job_id} のワークフローが正常に完了しました。"
             self._logger.info(
@@ -1,4 +1,10 @@
+import asyncio
+import threading
+from typing import Callable, Iterator
+from urllib.parse import urlparse
+
 from callback import after_transcriber_agent_callback
+from dependencies import get_firestore_client
 from google.adk.agents import BaseAgent
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event
@@ -6,25 +12,48 @@ from google.cloud.speech_v2 import SpeechClient
 from google.cloud.speech_v2.types import cloud_speech
 from google.genai.types import Content, Part
 from models.agent_models import AgentProcessingError
+from services import storage_service
+from services.blocking_executor import run_blocking
+from services.deadline import get_job_deadlines
+from services.firestore_service import update_job_data
 from services.logging_service import get_logger
+from services.rate_limiter import get_rate_limiter
+from services.stage_pool import PipelineStage, get_stage_pools
+from services.timing_service import get_job_timing_tracker
+
+from config import AGENT_ERROR_MESSAGES, TranscriptionMode, get_settings
 
-from config import AGENT_ERROR_MESSAGES, get_settings
+from .config import (
+    OPERATION_TIMEOUT,
+    RECOGNITION_CONFIG,
+    STREAMING_CHUNK_BYTES,
+    STREAMING_RECOGNITION_CONFIG,
+)
 
-from .config import OPERATION_TIMEOUT, RECOGNITION_CONFIG
+SPEECH_ACTIVITY_END = (
+    cloud_speech.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_END
+)
 
 
 class TranscriberAgent(BaseAgent):
     """
     Google Cloud Speech-to-Textを使用して音声ファイルをテキストに書き起こすエージェント。
+
+    設定 `transcription_mode` により、書き起こしの方式を切り替える。
+    batch では、`long` モデルでファイル全体を一括認識する。
+    streaming では、GCSからチャンクごとに読み出した音声を `short` モデルで認識し、
+    途中経過の書き起こしをジョブドキュメントに書き込む。
+    発話の終了を検知した時点で、確定した書き起こしを後続のエージェントに渡す。
     """
 
-    def __init__(self):
+    def __init__(self, speech_client: SpeechClient):
         super().__init__(
             name="TranscriberAgent",
             after_agent_callback=after_transcriber_agent_callback,
         )
         self._settings = get_settings()
-        self._speech_client = SpeechClient()
+        # プロセス全体で共有されるクライアントを使用する
+        self._speech_client = speech_client
         self._logger = get_logger(__name__)
 
     async def _run_async_impl(self, context: InvocationContext):
@@ -42,22 +71,19 @@ class TranscriberAgent(BaseAgent):
         self._logger.info(f"[{job_id}] 音声の文字起こしを開始します: {gcs_uri}")
 
         try:
-            # Speech-to-Textへのリクエストを作成
-            request = cloud_speech.RecognizeRequest(
-                recognizer=f"projects/{self._settings.google_cloud_project}/locations/global/recognizers/_",
-                config=RECOGNITION_CONFIG,
-                uri=gcs_uri,
-            )
-
-            # APIを呼び出し
-            response = self._speech_client.recognize(
-                request=request, timeout=OPERATION_TIMEOUT
-            )
-
-            # 結果から書き起こしテキストを抽出
-            transcript = "".join(
-                result.alternatives[0].transcript for result in response.results
-            )
+            # APIを呼び出し（同期クライアントのためイベントループ外で実行）
+            async with get_stage_pools().slot(PipelineStage.transcribe):
+                with get_job_timing_tracker().external_call(
+                    job_id, self.name, "speech"
+                ):
+                    # レート制限の待ちを含めて、ステージの期限までに書き起こしを終える
+                    transcript = await get_job_deadlines().within(
+                        job_id,
+                        self.name,
+                        get_rate_limiter("speech").call(
+                            lambda: self._transcribe(job_id, gcs_uri), job_id
+                        ),
+                    )
 
             if not transcript:
                 self._logger.warning(
@@ -126,3 +152,135 @@ class TranscriberAgent(BaseAgent):
                 ),
                 original_exception=e,
             ) from e
+
+    @property
+    def _recognizer(self) -> str:
+        project = self._settings.google_cloud_project
+        return f"projects/{project}/locations/global/recognizers/_"
+
+    async def _transcribe(self, job_id: str, gcs_uri: str) -> str:
+        """設定 `transcription_mode` の方式で、GCS上の音声ファイルを書き起こす。"""
+        if self._settings.transcription_mode == TranscriptionMode.streaming:
+            return await self._transcribe_streaming(job_id, gcs_uri)
+        return await self._transcribe_batch(job_id, gcs_uri)
+
+    async def _transcribe_batch(self, job_id: str, gcs_uri: str) -> str:
+        """`long` モデルの一括認識で、GCS上の音声ファイル全体を書き起こす。"""
+        # Speech-to-Textへのリクエストを作成
+        request = cloud_speech.RecognizeRequest(
+            recognizer=self._recognizer,
+            config=RECOGNITION_CONFIG,
+            uri=gcs_uri,
+        )
+        response = await run_blocking(
+            self._speech_client.recognize,
+            request=request,
+            timeout=get_job_deadlines().remaining(
+                job_id, self.name, cap=OPERATION_TIMEOUT
+            ),
+        )
+
+        # 結果から書き起こしテキストを抽出
+        return "".join(result.alternatives[0].transcript for result in response.results)
+
+    async def _transcribe_streaming(self, job_id: str, gcs_uri: str) -> str:
+        """
+        GCS上の音声ファイルをチャンクごとに読み出してストリーミング認識に送り、書き起こす。
+        途中経過の書き起こしはジョブドキュメントの `interimTranscript` に書き込む。
+        """
+        loop = asyncio.get_running_loop()
+        interim_queue: asyncio.Queue[str | None] = asyncio.Queue()
+
+        def publish(text: str | None) -> None:
+            # 認識はワーカースレッドで行われるため、イベントループ側のキューに渡す
+            loop.call_soon_threadsafe(interim_queue.put_nowait, text)
+
+        async def publish_interim_transcripts() -> None:
+            db_client = get_firestore_client()
+            first = True
+            while (text := await interim_queue.get()) is not None:
+                try:
+                    # 最初の途中経過はすぐにUIに表示させ、以降はまとめて書き込む
+                    await update_job_data(
+                        db=db_client,
+                        job_id=job_id,
+                        data={"interimTranscript": text},
+                        immediate=first,
+                    )
+                    first = False
+                except Exception as e:
+                    self._logger.warning(
+                        f"[{job_id}] 途中経過の書き起こしの書き込みに失敗しました: {e}"
+                    )
+
+        timeout = get_job_deadlines().remaining(
+            job_id, self.name, cap=OPERATION_TIMEOUT
+        )
+        publisher = asyncio.create_task(publish_interim_transcripts())
+        try:
+            transcript = await run_blocking(
+                self._streaming_recognize, gcs_uri, publish, timeout
+            )
+        except BaseException:
+            # 認識が失敗した場合は終了の合図が届かないことがあるため、
+            # 途中経過の書き込みを止める
+            publisher.cancel()
+            raise
+        await publisher
+        return transcript
+
+    def _streaming_recognize(
+        self, gcs_uri: str, publish: Callable[[str | None], None], timeout: float
+    ) -> str:
+        """
+        ストリーミング認識を実行し、確定した書き起こしを返す（ワーカースレッドで実行される）。
+        発話の終了を検知した時点で音声の送信を打ち切り、次の確定結果で認識を終える。
+        """
+        parsed_uri = urlparse(gcs_uri)
+        bucket_name = parsed_uri.netloc
+        blob_name = parsed_uri.path.lstrip("/")
+        speech_ended = threading.Event()
+
+        def requests() -> Iterator[cloud_speech.StreamingRecognizeRequest]:
+            yield cloud_speech.StreamingRecognizeRequest(
+                recognizer=self._recognizer,
+                streaming_config=STREAMING_RECOGNITION_CONFIG,
+            )
+            for chunk in storage_service.iter_blob_chunks(
+                bucket_name, blob_name, chunk_size=STREAMING_CHUNK_BYTES
+            ):
+                if speech_ended.is_set():
+                    return
+                yield cloud_speech.StreamingRecognizeRequest(audio=chunk)
+
+        finals: list[str] = []
+        responses = None
+        try:
+            responses = self._speech_client.streaming_recognize(
+                requests=requests(), timeout=timeout
+            )
+            for response in responses:
+                if response.speech_event_type == SPEECH_ACTIVITY_END:
+                    speech_ended.set()
+
+                finished = False
+                for result in response.results:
+                    if not result.alternatives:
+                        continue
+                    text = result.alternatives[0].transcript
+                    if result.is_final:
+                        finals.append(text)
+                        finished = speech_ended.is_set()
+                    elif text:
+                        publish("".join(finals) + text)
+
+                if finished or (speech_ended.is_set() and finals):
+                    break
+        finally:
+            # 残りの応答は不要なため、ストリームを閉じる
+            cancel = getattr(responses, "cancel", None)
+            if cancel is not None:
+                cancel()
+            publish(None)
+
+        return "".join(finals)
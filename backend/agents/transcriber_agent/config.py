@@ -10,5 +10,23 @@ RECOGNITION_CONFIG = cloud_speech.RecognitionConfig(
     language_codes=["ja-JP"],
 )
 
+# ストリーミング認識の設定（短い発話向けに、最初の結果が返るまでの時間を優先する）
+STREAMING_RECOGNITION_CONFIG = cloud_speech.StreamingRecognitionConfig(
+    config=cloud_speech.RecognitionConfig(
+        auto_decoding_config=cloud_speech.AutoDetectDecodingConfig(),
+        # shortは数秒〜数十秒の短い発話向けで、低レイテンシ
+        model="short",
+        language_codes=["ja-JP"],
+    ),
+    streaming_features=cloud_speech.StreamingRecognitionFeatures(
+        # 途中経過の書き起こしと、発話の終了イベントを受け取る
+        interim_results=True,
+        enable_voice_activity_events=True,
+    ),
+)
+
+# ストリーミング認識で1回のリクエストに含める音声データのサイズ（上限は25,600バイト）
+STREAMING_CHUNK_BYTES: int = 25_600
+
 # API呼び出しのタイムアウト時間（秒）
 OPERATION_TIMEOUT: int = 180
@@ -0,0 +1,19 @@
+"""
+ネットワークに接続せずに実行できるオフラインベンチマーク群。
+
+`backend` ディレクトリから `python -m bench.<module>` として実行する。
+Settings の必須項目はベンチマーク用のダミー値で補完される（既存の環境変数が優先）。
+"""
+
+import os
+
+_BENCH_ENV_DEFAULTS = {
+    "GOOGLE_CLOUD_PROJECT": "bench-project",
+    "AUDIO_UPLOAD_BUCKET": "bench-audio-upload",
+    "PROCESSED_AUDIO_BUCKET": "bench-processed-audio",
+    "GENERATED_IMAGE_BUCKET": "bench-generated-image",
+    "FIRESTORE_COLLECTION": "jobs",
+}
+
+for _key, _value in _BENCH_ENV_DEFAULTS.items():
+    os.environ.setdefault(_key, _value)
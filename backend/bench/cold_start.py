@@ -0,0 +1,264 @@
+"""
+インスタンスのコールドスタートのオフラインベンチマーク。
+
+新しいPythonプロセスを起動するたびに、`main` のimportから `lifespan` の起動、
+最初の `/invoke` への応答（ACK）、パイプラインの準備完了、
+最初のジョブの完了までを計測する。
+外部サービスはすべてフェイクに置き換えるが、SDKのimportは本番と同じく実際に行う。
+フェイクのimportもSDKに依存するため、本番のクライアント生成と同じくパイプラインの構築時まで遅らせる。
+
+- time-to-first-ACK: プロセスの起動から最初の `/invoke` が204を返すまで
+- pipeline ready: プロセスの起動からパイプラインの準備が完了するまで
+- first job: プロセスの起動から最初のジョブが完了するまで
+
+- first job latency: 最初の `/invoke` のACKからそのジョブが完了するまで
+
+`PIPELINE_BACKGROUND_LOAD=false`（構築の完了を待ってから受付を開始する）の場合と、
+`WARMUP_ON_STARTUP=true` で起動し、起動プローブと同様に `/warmup` の完了を待ってから
+最初のジョブを投入する場合（min-instancesで待機していたインスタンスに相当）と比較する。
+
+実行例:
+    python -m bench.cold_start --samples 5 --setup-latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import bench  # noqa: F401  ベンチマーク用の環境変数を設定する
+
+# エージェントが FirestoreSessionService を前提としているため、
+# フェイクのFirestore上で動かす
+os.environ.setdefault("SESSION_SERVICE", "firestore")
+
+JOB_ID = "cold-start-job"
+USER_ID = "cold-start-user"
+TERMINAL_STATUSES = ("completed", "error")
+STEPS = (
+    "main_imported",
+    "listening",
+    "pipeline_ready",
+    "warmed_up",
+    "first_ack",
+    "first_job",
+    "first_job_latency",
+)
+# (表示名, 環境変数, 最初のジョブの前に /warmup を呼び出すかどうか)
+SCENARIOS = (
+    ("blocking load", {"PIPELINE_BACKGROUND_LOAD": "false"}, False),
+    ("background load", {"PIPELINE_BACKGROUND_LOAD": "true"}, False),
+    (
+        "background load + warmup",
+        {"PIPELINE_BACKGROUND_LOAD": "true", "WARMUP_ON_STARTUP": "true"},
+        True,
+    ),
+)
+
+
+def _install_lazy_fakes(args: argparse.Namespace, on_job_done) -> None:
+    """
+    共有レジストリのクライアントを、初めて生成される時点でフェイクを読み込むファクトリに差し替える。
+    ジョブが使う音声ファイルとジョブドキュメントもその時点で用意する。
+    """
+    from functools import lru_cache
+
+    from dependencies import get_client_registry
+
+    from config import get_settings
+
+    @lru_cache
+    def factories() -> dict:
+        from bench.fakes import FakeBackendConfig, fake_client_factories
+
+        return fake_client_factories(
+            FakeBackendConfig(
+                setup_latency=args.setup_latency,
+                connect_latency=args.connect_latency,
+                call_latency=args.call_latency,
+            ),
+        )
+
+    def create(name: str):
+        from bench.events import audio_blob_name
+        from bench.fakes import FAKE_AUDIO
+
+        client = factories()[name]()
+        settings = get_settings()
+        if name == "storage":
+            client.seed(
+                settings.audio_upload_bucket,
+                audio_blob_name(JOB_ID, USER_ID),
+                FAKE_AUDIO,
+            )
+        elif name == "firestore":
+            job_path = f"{settings.firestore_collection}/{JOB_ID}"
+            client.seed(job_path, {"status": "initializing", "userId": USER_ID})
+
+            def on_write(path: str, data: dict) -> None:
+                if path == job_path and data.get("status") in TERMINAL_STATUSES:
+                    on_job_done()
+
+            client.add_write_hook(on_write)
+        return client
+
+    registry = get_client_registry()
+    for name in ("speech", "tts", "genai", "gemini", "storage", "firestore"):
+        registry.set_factory(name, lambda name=name: create(name))
+
+
+async def _child_main(args: argparse.Namespace) -> dict[str, float]:
+    from services.startup_profile import get_startup_profile
+
+    profile = get_startup_profile()
+    # アプリケーションのimport（計測対象）
+    import httpx
+    from bench.events import storage_cloudevent
+    from main import app
+
+    from config import get_settings
+
+    loop = asyncio.get_running_loop()
+    job_done = loop.create_future()
+
+    def on_job_done() -> None:
+        loop.call_soon_threadsafe(
+            lambda: job_done.done() or job_done.set_result(profile.elapsed())
+        )
+
+    _install_lazy_fakes(args, on_job_done)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            warmup = None
+            if args.warmup:
+                response = await client.get("/warmup")
+                response.raise_for_status()
+                warmup = response.json()
+            headers, body = storage_cloudevent(
+                JOB_ID, USER_ID, get_settings().audio_upload_bucket
+            )
+            response = await client.post("/invoke", headers=headers, json=body)
+            if response.status_code != 204:
+                raise RuntimeError(f"/invoke returned {response.status_code}")
+            profile.mark("first_ack")
+            first_job = await asyncio.wait_for(job_done, timeout=args.job_timeout)
+            snapshot = (await client.get("/startup-profile")).json()
+
+    marks = snapshot["marks"]
+    return {
+        **marks,
+        "first_job": first_job,
+        "first_job_latency": first_job - marks["first_ack"],
+        "imports": snapshot["imports"],
+        "warmup": warmup,
+    }
+
+
+def _run_child(args: argparse.Namespace, env: dict[str, str], warmup: bool) -> dict:
+    command = [
+        sys.executable,
+        "-W",
+        "ignore",
+        "-m",
+        "bench.cold_start",
+        "--child",
+        "--setup-latency",
+        str(args.setup_latency),
+        "--connect-latency",
+        str(args.connect_latency),
+        "--call-latency",
+        str(args.call_latency),
+        "--job-timeout",
+        str(args.job_timeout),
+        *(["--warmup"] if warmup else []),
+    ]
+    output = subprocess.run(
+        command, env={**os.environ, **env}, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--samples", type=int, default=5, help="起動するプロセスの数")
+    parser.add_argument(
+        "--setup-latency", type=float, default=0.05, help="クライアント生成コスト（秒）"
+    )
+    parser.add_argument(
+        "--connect-latency",
+        type=float,
+        default=0.3,
+        help="各バックエンドへの最初の呼び出しで接続の確立にかかる時間（秒）",
+    )
+    parser.add_argument(
+        "--call-latency",
+        type=float,
+        default=0.05,
+        help="API呼び出し1回のレイテンシ（秒）",
+    )
+    parser.add_argument(
+        "--job-timeout",
+        type=float,
+        default=120.0,
+        help="最初のジョブの完了を待つ上限（秒）",
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        import logging
+
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(asyncio.run(_child_main(args))))
+        return
+
+    from bench.stats import percentile
+
+    for label, env, warmup in SCENARIOS:
+        started = time.perf_counter()
+        samples = [_run_child(args, env, warmup) for _ in range(args.samples)]
+        print(
+            f"{label} ({' '.join(f'{k}={v}' for k, v in env.items())}) "
+            f"samples={args.samples} ({time.perf_counter() - started:.1f}s)"
+        )
+        for step in STEPS:
+            values = [sample[step] for sample in samples if step in sample]
+            if not values:
+                continue
+            print(
+                f"  {step:<15} "
+                + " ".join(
+                    f"p{pct}={percentile(values, pct) * 1000:8.1f}ms"
+                    for pct in (50, 90)
+                )
+            )
+        imports = samples[-1]["imports"]
+        if imports:
+            print(
+                "  deferred imports (last sample): "
+                + " ".join(
+                    f"{name}={value * 1000:.0f}ms" for name, value in imports.items()
+                )
+            )
+        if samples[-1]["warmup"]:
+            backends = samples[-1]["warmup"]["backends"]
+            print(
+                "  warmup (last sample): "
+                + " ".join(
+                    f"{name}={result['seconds'] * 1000:.0f}ms"
+                    + ("" if result["ok"] else "(failed)")
+                    for name, result in backends.items()
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
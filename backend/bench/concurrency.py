@@ -0,0 +1,101 @@
+"""
+遅いフェイククライアントを使い、同期API呼び出しがイベントループを塞がないことを確認するベンチマーク。
+
+Speech-to-Text, Text-to-Speech, Imagen の呼び出しを N ジョブ分同時に実行し、
+- inline:   イベントループ上で直接呼び出す（従来の方式）
+- executor: BlockingCallExecutor 経由で呼び出す（現在の方式）
+の総所要時間と、その間のイベントループの最大遅延（/invoke のACK遅延に相当）を比較する。
+executor 方式では N ジョブが約 1 ジョブ分の時間で完了する。
+
+実行例:
+    python -m bench.concurrency --jobs 8 --call-latency 0.5
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import bench  # noqa: F401  ベンチマーク用の環境変数を設定する
+from bench.fakes import (
+    FakeBackendConfig,
+    FakeGenaiClient,
+    FakeSpeechClient,
+    FakeTextToSpeechClient,
+)
+from services.blocking_executor import BlockingCallExecutor
+
+
+async def _job_inline(speech, tts, genai) -> None:
+    speech.recognize(request=None)
+    tts.synthesize_speech()
+    genai.models.generate_images(prompt="")
+
+
+async def _job_executor(executor: BlockingCallExecutor, speech, tts, genai) -> None:
+    await executor.run(speech.recognize, request=None)
+    await asyncio.gather(
+        executor.run(tts.synthesize_speech),
+        executor.run(genai.models.generate_images, prompt=""),
+    )
+
+
+async def _measure_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """イベントループが指定間隔で応答できた時間からの最大遅延を計測する。"""
+    max_lag = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - started - interval)
+    return max_lag
+
+
+async def _run(jobs_factory) -> tuple[float, float]:
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*jobs_factory())
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await lag_task
+
+
+async def main(jobs: int, call_latency: float, max_workers: int) -> None:
+    config = FakeBackendConfig(setup_latency=0.0, call_latency=call_latency)
+    speech = FakeSpeechClient(config)
+    tts = FakeTextToSpeechClient(config)
+    genai = FakeGenaiClient(config)
+    executor = BlockingCallExecutor(max_workers=max_workers, name="bench")
+
+    inline_elapsed, inline_lag = await _run(
+        lambda: [_job_inline(speech, tts, genai) for _ in range(jobs)]
+    )
+    executor_elapsed, executor_lag = await _run(
+        lambda: [_job_executor(executor, speech, tts, genai) for _ in range(jobs)]
+    )
+    executor.shutdown()
+
+    one_job = 2 * call_latency
+    print(
+        f"jobs={jobs} call_latency={call_latency * 1000:.0f}ms "
+        f"max_workers={max_workers} (ideal single job={one_job:.2f}s)"
+    )
+    print(
+        f"  inline:   total={inline_elapsed:6.2f}s "
+        f"max_loop_lag={inline_lag * 1000:8.1f}ms"
+    )
+    print(
+        f"  executor: total={executor_elapsed:6.2f}s "
+        f"max_loop_lag={executor_lag * 1000:8.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--call-latency", type=float, default=0.5)
+    parser.add_argument("--max-workers", type=int, default=32)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    asyncio.run(main(args.jobs, args.call_latency, args.max_workers))
@@ -0,0 +1,28 @@
+"""ベンチマークから `/invoke` に投入する合成CloudEventの組み立て。"""
+
+
+def audio_blob_name(job_id: str, user_id: str) -> str:
+    return f"{user_id}/{job_id}/recording.webm"
+
+
+def storage_object_data(job_id: str, user_id: str, bucket: str) -> dict:
+    """Cloud StorageのCloudEventの `data` に相当するペイロードを組み立てる。"""
+    return {
+        "bucket": bucket,
+        "name": audio_blob_name(job_id, user_id),
+        "metadata": {"job_id": job_id, "user_id": user_id},
+    }
+
+
+def storage_cloudevent(job_id: str, user_id: str, bucket: str) -> tuple[dict, dict]:
+    """Eventarc が送信するバイナリモードのCloudEvent（ヘッダーとボディ）を作る。"""
+    name = audio_blob_name(job_id, user_id)
+    headers = {
+        "ce-id": job_id,
+        "ce-source": f"//storage.googleapis.com/projects/_/buckets/{bucket}",
+        "ce-specversion": "1.0",
+        "ce-type": "google.cloud.storage.object.v1.finalized",
+        "ce-subject": f"objects/{name}",
+        "content-type": "application/json",
+    }
+    return headers, storage_object_data(job_id, user_id, bucket)
@@ -0,0 +1,407 @@
+"""
+ベンチマーク用の Firestore AsyncClient のフェイク実装。
+
+パイプラインが使用する範囲（ドキュメントの set/get/update/delete、サブコレクション、
+where/order_by/limit の単純なクエリ、count集計、トランザクション、バッチ書き込み、
+SERVER_TIMESTAMP/Increment/DELETE_FIELD）をインメモリで再現する。
+コレクションごとの読み取り・書き込み・ラウンドトリップ数を記録し、
+ジョブあたりのFirestore操作数を比較できるようにする。
+"""
+
+import copy
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable
+from uuid import uuid4
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore_v1 import transforms
+
+if TYPE_CHECKING:
+    from bench.fakes import FakeBackendConfig
+
+# 書き込みのたびに呼び出されるフック: (ドキュメントパス, 書き込み後のデータ)
+WriteHook = Callable[[str, dict[str, Any]], None]
+
+
+def _collection_of(path: str) -> str:
+    """ドキュメントパスから、サブコレクションを含むコレクション名を取り出す。"""
+    parts = path.split("/")
+    return "/".join(parts[0:-1:2])
+
+
+def _apply_value(current: Any, value: Any) -> Any:
+    if value is transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, transforms.Increment):
+        return (current or 0) + value.value
+    if isinstance(value, dict):
+        base = current if isinstance(current, dict) else {}
+        return _merge(dict(base), value)
+    return copy.deepcopy(value)
+
+
+def _merge(target: dict[str, Any], data: dict[str, Any]) -> dict[str, Any]:
+    for key, value in data.items():
+        if value is transforms.DELETE_FIELD:
+            target.pop(key, None)
+        else:
+            target[key] = _apply_value(target.get(key), value)
+    return target
+
+
+def _resolve_sentinels(data: dict[str, Any]) -> dict[str, Any]:
+    return _merge({}, data)
+
+
+def _apply_update(target: dict[str, Any], data: dict[str, Any]) -> dict[str, Any]:
+    """ドット区切りのフィールドパスを解釈して更新を適用する。"""
+    for field_path, value in data.items():
+        *parents, leaf = field_path.split(".")
+        node = target
+        for part in parents:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        if value is transforms.DELETE_FIELD:
+            node.pop(leaf, None)
+        elif isinstance(value, dict):
+            # update() ではネストした辞書はマージせずに置き換える
+            node[leaf] = _resolve_sentinels(value)
+        else:
+            node[leaf] = _apply_value(node.get(leaf), value)
+    return target
+
+
+def _get_field(data: dict[str, Any], field_path: str) -> Any:
+    node: Any = data
+    for part in field_path.split("."):
+        if not isinstance(node, dict):
+            return None
+        node = node.get(part)
+    return node
+
+
+def _sort_key(value: Any) -> tuple:
+    # 値がないドキュメントは末尾に並べる
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return (value is None, value if value is not None else 0)
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: dict | None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> dict[str, Any] | None:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        return _get_field(self._data or {}, field_path)
+
+
+class _FakeQueryBase:
+    def __init__(
+        self,
+        client: "FakeFirestoreClient",
+        path: str,
+        filters: tuple = (),
+        orders: tuple = (),
+        limit_count: int | None = None,
+    ):
+        self._client = client
+        self._path = path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit_count
+
+    def _derive(self, **kwargs) -> "FakeQuery":
+        params = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit_count": self._limit,
+            **kwargs,
+        }
+        return FakeQuery(self._client, self._path, **params)
+
+    def where(self, field_path: str, op_string: str, value: Any) -> "FakeQuery":
+        if op_string != "==":
+            raise NotImplementedError(f"Unsupported operator: {op_string}")
+        return self._derive(filters=self._filters + ((field_path, value),))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._derive(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._derive(limit_count=count)
+
+    async def get(self, transaction=None) -> list[FakeDocumentSnapshot]:
+        await self._client._round_trip(self._path)
+        docs = self._client._query(self._path, self._filters, self._orders, self._limit)
+        self._client._count(self._path, "reads", max(len(docs), 1))
+        return docs
+
+    async def stream(self, transaction=None):
+        for doc in await self.get(transaction=transaction):
+            yield doc
+
+    def count(self, alias: str | None = None) -> "FakeAggregationQuery":
+        return FakeAggregationQuery(self, alias)
+
+
+class FakeAggregationQuery:
+    def __init__(self, query: _FakeQueryBase, alias: str | None):
+        self._query = query
+        self._alias = alias
+
+    async def get(self, transaction=None) -> list[list[SimpleNamespace]]:
+        query = self._query
+        await query._client._round_trip(query._path)
+        docs = query._client._query(
+            query._path, query._filters, query._orders, query._limit
+        )
+        # 本番と同様、集計クエリは1回の読み取りとして数える
+        query._client._count(query._path, "reads")
+        return [[SimpleNamespace(alias=self._alias, value=len(docs))]]
+
+
+class FakeQuery(_FakeQueryBase):
+    pass
+
+
+class FakeCollectionReference(_FakeQueryBase):
+    def __init__(self, client: "FakeFirestoreClient", path: str):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: str | None = None) -> "FakeDocumentReference":
+        return FakeDocumentReference(
+            self._client, f"{self._path}/{document_id or uuid4().hex}"
+        )
+
+
+class FakeDocumentReference:
+    def __init__(self, client: "FakeFirestoreClient", path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    async def get(self, field_paths=None, transaction=None) -> FakeDocumentSnapshot:
+        # トランザクション内の読み取りもラウンドトリップとして数える
+        await self._client._round_trip(self.path)
+        self._client._count(self.path, "reads")
+        return self._client._snapshot(self.path)
+
+    async def set(self, document_data: dict, merge: bool = False) -> None:
+        await self._client._round_trip(self.path)
+        self._client._write(self.path, "set", document_data, merge=merge)
+
+    async def update(self, field_updates: dict) -> None:
+        await self._client._round_trip(self.path)
+        self._client._write(self.path, "update", field_updates)
+
+    async def delete(self) -> None:
+        await self._client._round_trip(self.path)
+        self._client._write(self.path, "delete", None)
+
+
+class FakeWriteBatch:
+    """WriteBatch のフェイク。commit 時に1回のラウンドトリップでまとめて適用する。"""
+
+    def __init__(self, client: "FakeFirestoreClient"):
+        self._client = client
+        self._writes: list[tuple[str, str, dict | None, bool]] = []
+
+    def create(self, reference: FakeDocumentReference, document_data: dict):
+        self._writes.append((reference.path, "create", document_data, False))
+
+    def set(self, reference: FakeDocumentReference, document_data: dict, merge=False):
+        self._writes.append((reference.path, "set", document_data, merge))
+
+    def update(self, reference: FakeDocumentReference, field_updates: dict):
+        self._writes.append((reference.path, "update", field_updates, False))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._writes.append((reference.path, "delete", None, False))
+
+    async def commit(self) -> list:
+        writes, self._writes = self._writes, []
+        if writes:
+            await self._client._round_trip(writes[0][0])
+        # バッチは不可分のため、作成先がすでに存在する場合は何も書き込まずに失敗する
+        for path, op, _, _ in writes:
+            if op == "create" and self._client.read(path) is not None:
+                raise google_exceptions.AlreadyExists(
+                    f"Document already exists: {path}"
+                )
+        for path, op, data, merge in writes:
+            self._client._write(path, op, data, merge=merge)
+        return []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    AsyncTransaction のフェイク。
+    `firestore.async_transactional` が参照する内部属性・メソッドを備える。
+    読み取りは即時、書き込みは commit 時にまとめて適用する（競合は発生しない）。
+    """
+
+    def __init__(self, client: "FakeFirestoreClient", max_attempts: int = 5):
+        super().__init__(client)
+        self._id: bytes | None = None
+        self._read_only = False
+        self._max_attempts = max_attempts
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._id = None
+
+    async def _begin(self, retry_id: bytes | None = None) -> None:
+        # BeginTransaction もラウンドトリップとして数える
+        await self._client._round_trip("(transactions)/begin")
+        self._id = b"fake-transaction"
+
+    async def _rollback(self) -> None:
+        self._clean_up()
+
+    async def _commit(self) -> list:
+        result = await self.commit()
+        self._clean_up()
+        return result
+
+
+class FakeFirestoreClient:
+    """firestore.AsyncClient のフェイク。"""
+
+    def __init__(self, config: "FakeBackendConfig"):
+        self._config = config
+        self._docs: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._write_hooks: list[WriteHook] = []
+        self.ops: Counter[tuple[str, str]] = Counter()
+        self.counting = True
+
+    # --- 公開API（本番クライアント互換） ---
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def document(self, path: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self, path)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False):
+        transaction = FakeTransaction(self, max_attempts=max_attempts)
+        transaction._read_only = read_only
+        return transaction
+
+    def close(self) -> None:
+        pass
+
+    # --- ベンチマーク用のAPI ---
+
+    def add_write_hook(self, hook: WriteHook) -> None:
+        """ドキュメントが書き込まれるたびに呼び出されるフックを登録する。"""
+        self._write_hooks.append(hook)
+
+    def seed(self, path: str, data: dict[str, Any]) -> None:
+        """操作数に数えずにドキュメントを書き込む。"""
+        with self._lock:
+            self._docs[path] = _resolve_sentinels(data)
+
+    def read(self, path: str) -> dict[str, Any] | None:
+        """操作数に数えずにドキュメントを読み取る。"""
+        with self._lock:
+            data = self._docs.get(path)
+            return copy.deepcopy(data) if data is not None else None
+
+    def reset_counts(self) -> None:
+        self.ops.clear()
+
+    def counts_by_collection(self) -> dict[str, dict[str, int]]:
+        """コレクションごとの操作数（reads/writes/round_trips）を返す。"""
+        result: dict[str, dict[str, int]] = {}
+        for (collection, kind), count in self.ops.items():
+            result.setdefault(collection, {})[kind] = count
+        return result
+
+    # --- 内部処理 ---
+
+    def _count(self, path: str, kind: str, amount: int = 1) -> None:
+        if self.counting:
+            with self._lock:
+                self.ops[(_collection_of(path), kind)] += amount
+
+    async def _round_trip(self, path: str) -> None:
+        self._count(path, "round_trips")
+        await self._config.asleep("firestore")
+
+    def _snapshot(self, path: str) -> FakeDocumentSnapshot:
+        with self._lock:
+            data = self._docs.get(path)
+            data = copy.deepcopy(data) if data is not None else None
+        return FakeDocumentSnapshot(FakeDocumentReference(self, path), data)
+
+    def _write(
+        self, path: str, op: str, data: dict | None, merge: bool = False
+    ) -> None:
+        self._count(path, "writes")
+        with self._lock:
+            if op == "delete":
+                self._docs.pop(path, None)
+                return
+            current = self._docs.get(path)
+            if op == "update":
+                if current is None:
+                    raise google_exceptions.NotFound(f"No document to update: {path}")
+                new = _apply_update(copy.deepcopy(current), data or {})
+            elif merge and current is not None:
+                new = _merge(copy.deepcopy(current), data or {})
+            else:
+                new = _resolve_sentinels(data or {})
+            self._docs[path] = new
+            snapshot = copy.deepcopy(new)
+        for hook in self._write_hooks:
+            hook(path, snapshot)
+
+    def _query(
+        self, path: str, filters: tuple, orders: tuple, limit: int | None
+    ) -> list[FakeDocumentSnapshot]:
+        depth = path.count("/") + 2
+        prefix = f"{path}/"
+        with self._lock:
+            items = [
+                (doc_path, copy.deepcopy(data))
+                for doc_path, data in self._docs.items()
+                if doc_path.startswith(prefix) and doc_path.count("/") + 1 == depth
+            ]
+        items = [
+            (doc_path, data)
+            for doc_path, data in items
+            if all(_get_field(data, f) == v for f, v in filters)
+        ]
+        for field_path, direction in reversed(orders):
+            items.sort(
+                key=lambda item: _sort_key(_get_field(item[1], field_path)),
+                reverse=direction == "DESCENDING",
+            )
+        if limit is not None:
+            items = items[:limit]
+        return [
+            FakeDocumentSnapshot(FakeDocumentReference(self, doc_path), data)
+            for doc_path, data in items
+        ]
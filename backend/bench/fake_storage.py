@@ -0,0 +1,163 @@
+"""
+ベンチマーク用の google.cloud.storage.Client のフェイク実装。
+
+オブジェクトはプロセス内の辞書に保持し、API呼び出しごとのレイテンシと失敗を再現する。
+操作の種類ごとの呼び出し回数を記録する。
+"""
+
+import io
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from google.api_core import exceptions as google_exceptions
+
+if TYPE_CHECKING:
+    from bench.fakes import FakeBackendConfig
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.content_type: str | None = None
+
+    @property
+    def _client(self) -> "FakeStorageClient":
+        return self.bucket.client
+
+    @property
+    def size(self) -> int | None:
+        obj = self._client._objects.get((self.bucket.name, self.name))
+        return len(obj[0]) if obj else None
+
+    @property
+    def time_created(self) -> datetime | None:
+        return self._client._created.get((self.bucket.name, self.name))
+
+    def upload_from_string(self, data, content_type: str | None = None, **kwargs):
+        self._client._call("upload")
+        if isinstance(data, str):
+            data = data.encode()
+        self.content_type = content_type
+        self._client._put(self.bucket.name, self.name, bytes(data), content_type)
+
+    def download_as_bytes(self, **kwargs) -> bytes:
+        self._client._call("download")
+        return self._client._get(self.bucket.name, self.name)[0]
+
+    def open(self, mode: str = "rb", chunk_size: int | None = None, **kwargs):
+        if mode != "rb":
+            raise NotImplementedError(f"Unsupported mode: {mode}")
+        return io.BytesIO(self.download_as_bytes())
+
+    def exists(self, **kwargs) -> bool:
+        self._client._call("exists")
+        return (self.bucket.name, self.name) in self._client._objects
+
+    def reload(self, **kwargs) -> None:
+        self._client._call("reload")
+        _, self.content_type = self._client._get(self.bucket.name, self.name)
+
+    def delete(self, **kwargs) -> None:
+        self._client._call("delete")
+        self._client._pop(self.bucket.name, self.name)
+
+
+class FakeBucket:
+    def __init__(self, client: "FakeStorageClient", name: str):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name: str) -> FakeBlob:
+        return FakeBlob(self, blob_name)
+
+    def get_blob(self, blob_name: str) -> FakeBlob | None:
+        blob = self.blob(blob_name)
+        return blob if blob.exists() else None
+
+    def copy_blob(
+        self,
+        blob: FakeBlob,
+        destination_bucket: "FakeBucket",
+        new_name: str | None = None,
+    ) -> FakeBlob:
+        self.client._call("copy")
+        data, content_type = self.client._get(self.name, blob.name)
+        new_name = new_name or blob.name
+        self.client._put(destination_bucket.name, new_name, data, content_type)
+        return destination_bucket.blob(new_name)
+
+    def rename_blob(self, blob: FakeBlob, new_name: str) -> FakeBlob:
+        # 本番と同様、コピーと削除の2回のAPI呼び出しとして扱う
+        new_blob = self.copy_blob(blob, self, new_name)
+        if new_name != blob.name:
+            blob.delete()
+        return new_blob
+
+    def list_blobs(self, prefix: str | None = None, **kwargs) -> list[FakeBlob]:
+        self.client._call("list")
+        with self.client._lock:
+            names = [
+                name
+                for bucket_name, name in self.client._objects
+                if bucket_name == self.name and name.startswith(prefix or "")
+            ]
+        return [self.blob(name) for name in sorted(names)]
+
+
+class FakeStorageClient:
+    """google.cloud.storage.Client のフェイク。"""
+
+    def __init__(self, config: "FakeBackendConfig"):
+        time.sleep(config.setup_latency)
+        self._config = config
+        self._objects: dict[tuple[str, str], tuple[bytes, str | None]] = {}
+        self._created: dict[tuple[str, str], datetime] = {}
+        self._lock = threading.Lock()
+        self.ops: Counter[str] = Counter()
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        return FakeBucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name, prefix: str | None = None, **kwargs):
+        name = getattr(bucket_or_name, "name", bucket_or_name)
+        return self.bucket(name).list_blobs(prefix=prefix)
+
+    def close(self) -> None:
+        pass
+
+    def seed(self, bucket_name: str, blob_name: str, data: bytes, content_type=None):
+        """操作数やレイテンシに含めずにオブジェクトを書き込む。"""
+        self._put(bucket_name, blob_name, data, content_type)
+
+    @property
+    def total_bytes(self) -> int:
+        """保持しているオブジェクトの合計サイズ。"""
+        with self._lock:
+            return sum(len(data) for data, _ in self._objects.values())
+
+    def _call(self, op: str) -> None:
+        with self._lock:
+            self.ops[op] += 1
+        self._config.sleep("gcs")
+
+    def _put(self, bucket: str, name: str, data: bytes, content_type: str | None):
+        with self._lock:
+            self._objects[(bucket, name)] = (data, content_type)
+            self._created[(bucket, name)] = datetime.now(timezone.utc)
+
+    def _get(self, bucket: str, name: str) -> tuple[bytes, str | None]:
+        with self._lock:
+            obj = self._objects.get((bucket, name))
+        if obj is None:
+            raise google_exceptions.NotFound(f"No such object: {bucket}/{name}")
+        return obj
+
+    def _pop(self, bucket: str, name: str) -> None:
+        with self._lock:
+            self._created.pop((bucket, name), None)
+            if self._objects.pop((bucket, name), None) is None:
+                raise google_exceptions.NotFound(f"No such object: {bucket}/{name}")
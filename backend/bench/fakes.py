@@ -0,0 +1,372 @@
+"""
+ベンチマーク用のGoogle Cloudクライアントのフェイク実装。
+
+各フェイクは本番クライアントと同じメソッド名・戻り値の形を持ち、
+クライアント生成時のコスト（gRPCチャネル確立や認証トークン取得）、
+API呼び出しのレイテンシ、および一定確率での失敗を再現する。
+同期クライアントのレイテンシは `time.sleep`、
+非同期クライアントは `asyncio.sleep` で再現する。
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from types import SimpleNamespace
+from typing import AsyncGenerator
+from uuid import uuid4
+
+from bench.fake_firestore import FakeFirestoreClient
+from bench.fake_storage import FakeStorageClient
+from google.adk.models import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.api_core import exceptions as google_exceptions
+from google.cloud.speech_v2.types import cloud_speech
+from google.genai import errors as genai_errors
+from google.genai import types
+from pydantic import Field
+from services.client_registry import ClientFactory
+
+# 子供がよくする質問のサンプル（書き起こし結果として使用する）
+SAMPLE_QUESTIONS = [
+    "なんで空は青いの",
+    "どうして星は光るの",
+    "なんで雨がふるの",
+    "どうしてお月さまは形がかわるの",
+    "なんで海はしょっぱいの",
+]
+
+# WebMシグネチャ＋ダミーデータ（約64KB、数秒の発話に相当）
+FAKE_AUDIO = b"\x1aE\xdf\xa3" + b"\x00" * (64 * 1024)
+# PNGシグネチャ＋ダミーデータ（約256KB）
+FAKE_PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * (256 * 1024)
+# MP3ヘッダ＋ダミーデータ（約32KB）
+FAKE_MP3 = b"ID3" + b"\x00" * (32 * 1024)
+
+
+@dataclass
+class FakeBackendConfig:
+    """フェイクバックエンドの振る舞いを制御する設定。"""
+
+    # クライアント生成時のコスト
+    setup_latency: float = 0.05
+    # 最初のAPI呼び出し時のコスト
+    # （チャネル確立、認証トークンの取得、TLSハンドシェイク）。
+    # 実際のSDKはこれらを最初の呼び出しまで遅らせる。確立中に届いた呼び出しも完了を待つ
+    connect_latency: float = 0.0
+    # 1回のAPI呼び出しにかかる時間
+    call_latency: float = 0.0
+    # レイテンシのばらつき（call_latency に対する割合。0.5なら±50%）
+    jitter: float = 0.0
+    # 応答が極端に遅くなる呼び出しの割合と、その場合のレイテンシの倍率（ロングテール）
+    tail_rate: float = 0.0
+    tail_multiplier: float = 10.0
+    # API呼び出しが失敗する確率
+    failure_rate: float = 0.0
+    # `quota_window` 秒あたりに受け付ける呼び出し数（0は無制限）。
+    # 超えた呼び出しはクォータ超過で失敗する
+    quota: int = 0
+    quota_window: float = 60.0
+
+    def __post_init__(self):
+        self._connected_at: float | None = None
+        self._connect_lock = threading.Lock()
+        self._accepted_at: deque[float] = deque()
+        # クォータ超過で失敗させた呼び出しの数
+        self.quota_errors = 0
+
+    def connect_delay(self) -> float:
+        """接続の確立が完了するまでの残り秒数。最初の呼び出しで確立を開始する。"""
+        with self._connect_lock:
+            now = time.monotonic()
+            if self._connected_at is None:
+                self._connected_at = now + self.connect_latency
+            return max(0.0, self._connected_at - now)
+
+    def latency(self) -> float:
+        latency = self.call_latency
+        if self.jitter:
+            latency = max(
+                0.0, latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+            )
+        if self.tail_rate and random.random() < self.tail_rate:
+            latency *= self.tail_multiplier
+        return latency
+
+    def check_quota(self, backend: str) -> None:
+        """
+        直近 `quota_window` 秒の呼び出し数がクォータを超える場合、
+        本番と同じ例外で失敗する。
+        """
+        if not self.quota:
+            return
+        with self._connect_lock:
+            now = time.monotonic()
+            while self._accepted_at and self._accepted_at[0] <= now - self.quota_window:
+                self._accepted_at.popleft()
+            if len(self._accepted_at) < self.quota:
+                self._accepted_at.append(now)
+                return
+            self.quota_errors += 1
+        message = f"fake {backend} quota exceeded"
+        if backend in ("gemini", "imagen", "embedding"):
+            raise genai_errors.ClientError(
+                429,
+                {
+                    "error": {
+                        "code": 429,
+                        "message": message,
+                        "status": "RESOURCE_EXHAUSTED",
+                    }
+                },
+            )
+        raise google_exceptions.ResourceExhausted(message)
+
+    def maybe_fail(self, backend: str) -> None:
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise google_exceptions.ServiceUnavailable(f"fake {backend} failure")
+
+    def sleep(self, backend: str) -> None:
+        """同期クライアント用：レイテンシを再現し、一定確率で失敗する。"""
+        self.check_quota(backend)
+        time.sleep(self.connect_delay() + self.latency())
+        self.maybe_fail(backend)
+
+    async def asleep(self, backend: str) -> None:
+        """非同期クライアント用：レイテンシを再現し、一定確率で失敗する。"""
+        self.check_quota(backend)
+        await asyncio.sleep(self.connect_delay() + self.latency())
+        self.maybe_fail(backend)
+
+
+@dataclass
+class FakeBackends:
+    """バックエンドごとのフェイク設定をまとめたもの。"""
+
+    speech: FakeBackendConfig = field(default_factory=FakeBackendConfig)
+    tts: FakeBackendConfig = field(default_factory=FakeBackendConfig)
+    imagen: FakeBackendConfig = field(default_factory=FakeBackendConfig)
+    gemini: FakeBackendConfig = field(default_factory=FakeBackendConfig)
+    gcs: FakeBackendConfig = field(default_factory=FakeBackendConfig)
+    firestore: FakeBackendConfig = field(default_factory=FakeBackendConfig)
+
+    @classmethod
+    def uniform(cls, config: FakeBackendConfig) -> "FakeBackends":
+        """すべてのバックエンドに同じ設定を使う。接続の状態はバックエンドごとに持つ。"""
+        return cls(
+            speech=replace(config),
+            tts=replace(config),
+            imagen=replace(config),
+            gemini=replace(config),
+            gcs=replace(config),
+            firestore=replace(config),
+        )
+
+
+class FakeSpeechClient:
+    """google.cloud.speech_v2.SpeechClient のフェイク。"""
+
+    def __init__(self, config: FakeBackendConfig):
+        time.sleep(config.setup_latency)
+        self._config = config
+
+    def list_recognizers(self, request=None, timeout=None):
+        self._config.sleep("speech")
+        return []
+
+    def recognize(self, request=None, timeout=None):
+        self._config.sleep("speech")
+        alternative = SimpleNamespace(transcript=random.choice(SAMPLE_QUESTIONS))
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])])
+
+    def streaming_recognize(self, requests=None, timeout=None):
+        """
+        音声チャンクを受け取るたびに途中経過を返し、送信が終わった時点で
+        発話終了イベントと確定結果を返す。
+        """
+        question = random.choice(SAMPLE_QUESTIONS)
+        chunks = 0
+        for request in requests:
+            if not request.audio:
+                continue
+            chunks += 1
+            yield _streaming_response(question[: chunks * 2], is_final=False)
+        self._config.sleep("speech")
+        yield SimpleNamespace(
+            results=[],
+            speech_event_type=cloud_speech.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_END,
+        )
+        yield _streaming_response(question, is_final=True)
+
+
+def _streaming_response(transcript: str, is_final: bool) -> SimpleNamespace:
+    alternative = SimpleNamespace(transcript=transcript)
+    return SimpleNamespace(
+        results=[SimpleNamespace(alternatives=[alternative], is_final=is_final)],
+        speech_event_type=cloud_speech.StreamingRecognizeResponse.SpeechEventType.SPEECH_EVENT_TYPE_UNSPECIFIED,
+    )
+
+
+class FakeTextToSpeechClient:
+    """google.cloud.texttospeech.TextToSpeechClient のフェイク。"""
+
+    def __init__(self, config: FakeBackendConfig):
+        time.sleep(config.setup_latency)
+        self._config = config
+
+    def list_voices(self, language_code=None, timeout=None):
+        self._config.sleep("tts")
+        return SimpleNamespace(voices=[])
+
+    def synthesize_speech(
+        self, input=None, voice=None, audio_config=None, timeout=None
+    ):
+        self._config.sleep("tts")
+        return SimpleNamespace(audio_content=FAKE_MP3)
+
+
+class _FakeGenaiModels:
+    def __init__(self, config: FakeBackendConfig, storage: FakeStorageClient | None):
+        self._config = config
+        self._storage = storage
+
+    def generate_images(self, model=None, prompt=None, config=None):
+        self._config.sleep("imagen")
+        output_gcs_uri = getattr(config, "output_gcs_uri", None)
+        if output_gcs_uri and self._storage is not None:
+            # 本番と同様、指定されたプレフィックスの下に画像を書き込む
+            bucket_name, _, prefix = output_gcs_uri.removeprefix("gs://").partition("/")
+            blob_name = f"{prefix}{uuid4().hex}.png"
+            self._storage.bucket(bucket_name).blob(blob_name).upload_from_string(
+                FAKE_PNG, content_type="image/png"
+            )
+            image = SimpleNamespace(
+                gcs_uri=f"gs://{bucket_name}/{blob_name}", image_bytes=None
+            )
+        else:
+            image = SimpleNamespace(gcs_uri=None, image_bytes=FAKE_PNG)
+        return SimpleNamespace(generated_images=[SimpleNamespace(image=image)])
+
+    def get(self, model=None, config=None):
+        self._config.sleep("imagen")
+        return SimpleNamespace(name=model)
+
+    def embed_content(self, model=None, contents=None, config=None):
+        self._config.sleep("embedding")
+        text = contents if isinstance(contents, str) else str(contents)
+        return SimpleNamespace(
+            embeddings=[SimpleNamespace(values=fake_embedding(text))]
+        )
+
+
+def fake_embedding(text: str, dimensions: int = 64) -> list[float]:
+    """文字bigramのハッシュから、似た文ほど近くなる決定的な埋め込みベクトルを生成する。"""
+    vector = [0.0] * dimensions
+    for i in range(len(text) - 1):
+        digest = hashlib.blake2b(text[i : i + 2].encode(), digest_size=4).digest()
+        vector[int.from_bytes(digest, "big") % dimensions] += 1.0
+    return vector
+
+
+class FakeGenaiClient:
+    """google.genai.Client のフェイク（Imagenと埋め込みの呼び出しのみ）。"""
+
+    def __init__(
+        self, config: FakeBackendConfig, storage: FakeStorageClient | None = None
+    ):
+        time.sleep(config.setup_latency)
+        self.models = _FakeGenaiModels(config, storage)
+
+    def close(self):
+        pass
+
+
+def fake_explanation_json(question: str) -> str:
+    """ExplanationOutputスキーマに沿った解説JSONを生成する。"""
+    return json.dumps(
+        {
+            "child_explanation": f"「{question}」のひみつをおしえるね。",
+            "illustration_prompt": f"{question}を説明する、絵本のようなイラスト",
+            "child_explanation_ssml": (
+                f"<speak><p>{question}のひみつをおしえるね。</p></speak>"
+            ),
+            "parent_hint": "どうしてだと思う？いっしょに考えてみよう。",
+            "needs_clarification": False,
+        },
+        ensure_ascii=False,
+    )
+
+
+class FakeGemini(BaseLlm):
+    """
+    ExplainerAgentが使用するGeminiモデルのフェイク。
+    システムインストラクションに埋め込まれた書き起こしテキストから解説JSONを生成する。
+    `stream=True` の場合は、JSONを複数の部分レスポンスに分割して返す。
+    """
+
+    model: str = "gemini-2.5-flash"
+    config: FakeBackendConfig = Field(default_factory=FakeBackendConfig)
+    stream_chunks: int = 6
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        instruction = str(llm_request.config.system_instruction or "")
+        question = next(
+            (q for q in SAMPLE_QUESTIONS if q in instruction), SAMPLE_QUESTIONS[0]
+        )
+        text = fake_explanation_json(question)
+
+        if not stream:
+            await self.config.asleep("gemini")
+            yield LlmResponse(
+                content=types.Content(role="model", parts=[types.Part(text=text)])
+            )
+            return
+
+        self.config.check_quota("gemini")
+        await asyncio.sleep(self.config.connect_delay())
+        chunk_size = -(-len(text) // self.stream_chunks)
+        for start in range(0, len(text), chunk_size):
+            await asyncio.sleep(self.config.latency() / self.stream_chunks)
+            yield LlmResponse(
+                content=types.Content(
+                    role="model",
+                    parts=[types.Part(text=text[start : start + chunk_size])],
+                ),
+                partial=True,
+            )
+        self.config.maybe_fail("gemini")
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)])
+        )
+
+
+def fake_client_factories(
+    backends: FakeBackends | FakeBackendConfig,
+) -> dict[str, ClientFactory]:
+    """ClientRegistry に渡すフェイククライアントのファクトリを返す。"""
+    if isinstance(backends, FakeBackendConfig):
+        backends = FakeBackends.uniform(backends)
+
+    # 画像生成結果を同じストレージに書き込めるよう、GCSのフェイクは共有する
+    storage: list[FakeStorageClient] = []
+
+    def _storage() -> FakeStorageClient:
+        if not storage:
+            storage.append(FakeStorageClient(backends.gcs))
+        return storage[0]
+
+    return {
+        "speech": lambda: FakeSpeechClient(backends.speech),
+        "tts": lambda: FakeTextToSpeechClient(backends.tts),
+        "genai": lambda: FakeGenaiClient(backends.imagen, _storage()),
+        "gemini": lambda: FakeGemini(config=backends.gemini),
+        "storage": _storage,
+        "firestore": lambda: FakeFirestoreClient(backends.firestore),
+    }
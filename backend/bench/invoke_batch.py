@@ -0,0 +1,105 @@
+"""
+`/invoke` と `/invoke/batch` の受付コストを比較するベンチマーク。
+
+同じ N 件のイベントを、1件ずつ `/invoke` に送信した場合と、`--batch-size` 件ずつ
+`/invoke/batch` に送信した場合の、総所要時間とイベント1件あたりの受付時間を計測する。
+パイプラインは何もしないものに置き換え、ジョブスケジューラへの投入までを計測対象とする。
+
+実行例:
+    python -m bench.invoke_batch --events 2000 --batch-size 500
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import bench  # noqa: F401  ベンチマーク用の環境変数を設定する
+import httpx
+from bench.events import storage_cloudevent, storage_object_data
+from main import app
+from services.job_scheduler import JobScheduler
+
+from config import get_settings
+
+USER_ID = "bench-user"
+
+
+class _NoopPipeline:
+    async def run(self, event_data: dict) -> None:
+        return None
+
+
+async def _send_single(
+    client: httpx.AsyncClient, job_ids: list[str], bucket: str
+) -> None:
+    for job_id in job_ids:
+        headers, body = storage_cloudevent(job_id, USER_ID, bucket)
+        response = await client.post("/invoke", headers=headers, json=body)
+        response.raise_for_status()
+
+
+async def _send_batch(
+    client: httpx.AsyncClient, job_ids: list[str], bucket: str, batch_size: int
+) -> None:
+    for start in range(0, len(job_ids), batch_size):
+        items = [
+            storage_object_data(job_id, USER_ID, bucket)
+            for job_id in job_ids[start : start + batch_size]
+        ]
+        response = await client.post("/invoke/batch", json=items)
+        response.raise_for_status()
+        if response.json()["accepted"] != len(items):
+            raise RuntimeError(f"not all events were accepted: {response.json()}")
+
+
+async def main(events: int, batch_size: int) -> None:
+    logging.disable(logging.CRITICAL)
+    bucket = get_settings().audio_upload_bucket
+
+    # lifespanを使わず、スケジューラとパイプラインだけを用意する
+    scheduler = JobScheduler(max_concurrency=8, max_queue_size=events)
+    scheduler.start()
+    pipeline = asyncio.get_running_loop().create_future()
+    pipeline.set_result(_NoopPipeline())
+    app.state.scheduler = scheduler
+    app.state.pipeline = pipeline
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        print(f"events={events} batch_size={batch_size}")
+        for label, send in (
+            ("single /invoke", lambda ids: _send_single(client, ids, bucket)),
+            (
+                "/invoke/batch",
+                lambda ids: _send_batch(client, ids, bucket, batch_size),
+            ),
+        ):
+            job_ids = [f"{label}-{i}" for i in range(events)]
+            started = time.perf_counter()
+            await send(job_ids)
+            elapsed = time.perf_counter() - started
+            print(
+                f"  {label:<15} total={elapsed * 1000:9.1f}ms "
+                f"per_event={elapsed / events * 1e6:8.1f}us"
+            )
+            # 次の計測の前にキューを空にする
+            while scheduler.queue_length or scheduler.in_flight:
+                await asyncio.sleep(0.01)
+
+    await scheduler.drain(timeout=5.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=2000, help="送信するイベントの数")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="/invoke/batch の1回に含めるイベント数",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.events, args.batch_size))
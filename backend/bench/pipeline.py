@@ -0,0 +1,550 @@
+"""
+パイプライン全体のオフラインベンチマーク。
+
+Speech / TTS / Imagen / Gemini / GCS / Firestore をすべてフェイクに置き換え、
+本番と同じ `lifespan` で構築したアプリケーションの `/invoke` に、
+合成したCloudEventをバースト投入する。
+各ジョブのステータスが completed / error になるまでを計測し、以下を出力する。
+
+- スループット（完了ジョブ数/秒）
+- ジョブのエンドツーエンドのレイテンシ（p50/p90/p99）
+- 音声と画像がジョブドキュメントに書き込まれるまでのレイテンシ（p50/p90/p99）
+- 成功・失敗・受付拒否の件数
+- ジョブあたりのFirestore操作数（コレクション別）
+- 回答キャッシュの検索結果（ANSWER_CACHE_BACKEND を指定した場合）
+- 成果物キャッシュ（合成済みの音声など）の検索結果
+- 重複して配信したイベントのうち、実行を省略したものの件数
+  （`--duplicate-rate` を指定した場合）
+- ImagenとTTSのヘッジの割合と、2つ目のリクエストが採用された割合
+  （IMAGEN_HEDGING_ENABLED / TTS_HEDGING_ENABLED を指定した場合）
+- 成果物なしで完了させたジョブの数と、完了後の補完の結果
+  （DEGRADATION_ENABLED を指定した場合）
+- ピークRSS
+
+実行例:
+    python -m bench.pipeline --jobs 64 --burst-size 16 --burst-interval 0.5 \\
+        --call-latency 0.2 --gemini-latency 1.0 --failure-rate 0.01
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import resource
+from dataclasses import dataclass, field
+
+import bench  # noqa: F401  ベンチマーク用の環境変数を設定する
+
+# エージェントが FirestoreSessionService を前提としているため、
+# フェイクのFirestore上で動かす
+os.environ.setdefault("SESSION_SERVICE", "firestore")
+
+import httpx  # noqa: E402
+from bench.events import audio_blob_name, storage_cloudevent  # noqa: E402
+from bench.fake_firestore import FakeFirestoreClient  # noqa: E402
+from bench.fakes import (  # noqa: E402
+    FAKE_AUDIO,
+    FakeBackendConfig,
+    FakeBackends,
+    fake_client_factories,
+)
+from bench.stats import percentile  # noqa: E402
+from dependencies import get_client_registry  # noqa: E402
+from main import app  # noqa: E402
+from services.artifact_publisher import ARTIFACT_FIELDS  # noqa: E402
+from services.hedging import get_hedger  # noqa: E402
+from services.metrics_service import get_metrics_registry  # noqa: E402
+from services.stage_pool import get_stage_pools  # noqa: E402
+
+from config import get_settings  # noqa: E402
+
+TERMINAL_STATUSES = ("completed", "error")
+SESSION_OPERATIONS = ("create_session", "get_session", "update_session", "append_event")
+ARTIFACT_CACHES = ("narration", "illustration")
+ARTIFACT_CACHE_RESULTS = ("memory_hit", "persistent_hit", "miss")
+RATE_LIMITED_BACKENDS = ("speech", "gemini", "imagen", "tts")
+HEDGED_BACKENDS = ("imagen", "tts")
+DEGRADABLE_ARTIFACTS = ("illustration", "narration")
+BACKFILL_RESULTS = ("completed", "failed", "abandoned")
+
+
+@dataclass
+class BenchResult:
+    jobs: int
+    elapsed: float
+    latencies: list[float] = field(default_factory=list)
+    # 成果物ごとの、ジョブの投入からGCSパスが書き込まれるまでのレイテンシ
+    artifact_latencies: dict[str, list[float]] = field(default_factory=dict)
+    statuses: dict[str, int] = field(default_factory=dict)
+    rejected: int = 0
+    timed_out: int = 0
+    firestore_ops: dict[str, dict[str, int]] = field(default_factory=dict)
+    session_ops: dict[str, float] = field(default_factory=dict)
+    gcs_ops: dict[str, int] = field(default_factory=dict)
+    session_cache: dict[str, float] = field(default_factory=dict)
+    answer_cache: dict[str, float] = field(default_factory=dict)
+    artifact_cache: dict[str, dict[str, float]] = field(default_factory=dict)
+    artifact_cache_saved_seconds: dict[str, float] = field(default_factory=dict)
+    duplicates_sent: int = 0
+    duplicates_suppressed: dict[str, float] = field(default_factory=dict)
+    # レート制限の対象のバックエンドごとの、クォータ超過の回数、待った延べ秒数、
+    # 最終的な上限
+    rate_limits: dict[str, dict[str, float]] = field(default_factory=dict)
+    # ヘッジの対象のバックエンドごとの、呼び出し数、ヘッジした数、2つ目が採用された数
+    hedges: dict[str, dict[str, float]] = field(default_factory=dict)
+    # 縮退運転の対象の成果物ごとの、成果物なしで完了させた数と補完の結果
+    degraded: dict[str, dict[str, float]] = field(default_factory=dict)
+    # ステージごとのワーカー数、待ち行列の最大長、平均待ち時間、平均使用率
+    stages: dict[str, dict[str, float]] = field(default_factory=dict)
+    peak_rss_mb: float = 0.0
+
+    @property
+    def finished(self) -> int:
+        return len(self.latencies)
+
+
+def _peak_rss_mb() -> float:
+    # Linuxでは KB、macOSでは bytes 単位で返る
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if os.uname().sysname == "Darwin" else rss / 1024
+
+
+async def run_benchmark(
+    backends: FakeBackends,
+    jobs: int,
+    burst_size: int,
+    burst_interval: float,
+    job_timeout: float,
+    duplicate_rate: float = 0.0,
+) -> BenchResult:
+    settings = get_settings()
+
+    # 共有レジストリが最初に使われる前に、すべてのクライアントをフェイクに差し替える
+    registry = get_client_registry()
+    for name, factory in fake_client_factories(backends).items():
+        registry.set_factory(name, factory)
+    firestore: FakeFirestoreClient = registry.firestore
+
+    loop = asyncio.get_running_loop()
+    started_at: dict[str, float] = {}
+    done: dict[str, asyncio.Future[tuple[str, float]]] = {}
+    artifact_ready_at: dict[str, dict[str, float]] = {
+        artifact: {} for artifact in ARTIFACT_FIELDS
+    }
+    job_prefix = f"{settings.firestore_collection}/"
+
+    def on_write(path: str, data: dict) -> None:
+        # ジョブドキュメントが終了状態になった時点を完了時刻とする
+        if not path.startswith(job_prefix) or path.count("/") != 1:
+            return
+        job_id = path.removeprefix(job_prefix)
+        # 成果物のGCSパスが最初に書き込まれた時点を、その成果物を利用できる時刻とする
+        for artifact, (path_field, _) in ARTIFACT_FIELDS.items():
+            if data.get(path_field):
+                artifact_ready_at[artifact].setdefault(job_id, loop.time())
+        future = done.get(job_id)
+        status = data.get("status")
+        if future is not None and not future.done() and status in TERMINAL_STATUSES:
+            future.set_result((status, loop.time()))
+
+    firestore.add_write_hook(on_write)
+
+    # アップロードされた音声と、Cloud Functionが作成するジョブドキュメントを用意する
+    # （操作数には含めない）
+    job_ids = [f"bench-job-{i:05d}" for i in range(jobs)]
+    for i, job_id in enumerate(job_ids):
+        user_id = f"bench-user-{i % 8}"
+        registry.storage.seed(
+            settings.audio_upload_bucket, audio_blob_name(job_id, user_id), FAKE_AUDIO
+        )
+        firestore.seed(
+            f"{settings.firestore_collection}/{job_id}",
+            {"status": "initializing", "userId": user_id},
+        )
+
+    result = BenchResult(jobs=jobs, elapsed=0.0)
+    peak_queue: dict[str, int] = {}
+
+    async def sample_stage_queues() -> None:
+        while True:
+            for stage, stats in get_stage_pools().stats().items():
+                peak_queue[stage] = max(peak_queue.get(stage, 0), stats["queue_length"])
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.create_task(sample_stage_queues())
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            # 先頭から指定した割合のジョブは、実行中と完了後にもう一度ずつ配信する
+            duplicated = job_ids[: int(jobs * duplicate_rate)]
+
+            async def redeliver(i: int, job_id: str) -> None:
+                headers, body = storage_cloudevent(
+                    job_id, f"bench-user-{i % 8}", settings.audio_upload_bucket
+                )
+                await client.post("/invoke", headers=headers, json=body)
+                result.duplicates_sent += 1
+
+            async def post(i: int, job_id: str) -> None:
+                headers, body = storage_cloudevent(
+                    job_id, f"bench-user-{i % 8}", settings.audio_upload_bucket
+                )
+                done[job_id] = loop.create_future()
+                started_at[job_id] = loop.time()
+                response = await client.post("/invoke", headers=headers, json=body)
+                if response.status_code != 204:
+                    result.rejected += 1
+                    done.pop(job_id).cancel()
+                elif job_id in duplicated:
+                    await redeliver(i, job_id)
+
+            bench_started = loop.time()
+            for start in range(0, jobs, burst_size):
+                burst = job_ids[start : start + burst_size]
+                await asyncio.gather(
+                    *(post(start + i, job_id) for i, job_id in enumerate(burst))
+                )
+                if start + burst_size < jobs:
+                    await asyncio.sleep(burst_interval)
+
+            # 受け付けたジョブの完了を待つ
+            pending = list(done.items())
+            if pending:
+                await asyncio.wait(
+                    [future for _, future in pending], timeout=job_timeout
+                )
+            result.elapsed = loop.time() - bench_started
+
+            # 完了したジョブへの遅れた再配信
+            await asyncio.gather(
+                *(redeliver(i, job_id) for i, job_id in enumerate(duplicated))
+            )
+            scheduler = app.state.scheduler
+            while scheduler.queue_length or scheduler.in_flight:
+                await asyncio.sleep(0.05)
+
+            sampler.cancel()
+            for job_id, future in pending:
+                if not future.done():
+                    result.timed_out += 1
+                    continue
+                status, finished_at = future.result()
+                result.statuses[status] = result.statuses.get(status, 0) + 1
+                result.latencies.append(finished_at - started_at[job_id])
+                for artifact, ready_at in artifact_ready_at.items():
+                    if job_id in ready_at:
+                        result.artifact_latencies.setdefault(artifact, []).append(
+                            ready_at[job_id] - started_at[job_id]
+                        )
+
+    result.firestore_ops = firestore.counts_by_collection()
+    result.gcs_ops = dict(registry.storage.ops)
+    session_counter = get_metrics_registry().get("coco_session_operations_total")
+    if session_counter is not None:
+        result.session_ops = {
+            op: session_counter.value(operation=op) for op in SESSION_OPERATIONS
+        }
+    registry_metrics = get_metrics_registry()
+    result.session_cache = {
+        kind: metric.value() if metric is not None else 0.0
+        for kind, metric in (
+            ("hits", registry_metrics.get("coco_session_cache_hits_total")),
+            ("misses", registry_metrics.get("coco_session_cache_misses_total")),
+        )
+    }
+    answer_lookups = registry_metrics.get("coco_answer_cache_lookups_total")
+    if answer_lookups is not None:
+        result.answer_cache = {
+            kind: answer_lookups.value(result=kind)
+            for kind in ("exact", "similar", "miss")
+        }
+    artifact_lookups = registry_metrics.get("coco_artifact_cache_lookups_total")
+    if artifact_lookups is not None:
+        result.artifact_cache = {
+            cache: {
+                kind: artifact_lookups.value(cache=cache, result=kind)
+                for kind in ARTIFACT_CACHE_RESULTS
+            }
+            for cache in ARTIFACT_CACHES
+        }
+    saved_seconds = registry_metrics.get("coco_artifact_cache_saved_seconds_total")
+    if saved_seconds is not None:
+        result.artifact_cache_saved_seconds = {
+            cache: saved_seconds.value(cache=cache) for cache in ARTIFACT_CACHES
+        }
+    suppressed = registry_metrics.get("coco_job_duplicates_suppressed_total")
+    if suppressed is not None:
+        result.duplicates_suppressed = {
+            reason: suppressed.value(reason=reason)
+            for reason in ("in_flight", "finished")
+        }
+    for backend in RATE_LIMITED_BACKENDS:
+        result.rate_limits[backend] = {
+            metric: registry_metrics.get(name).value(backend=backend)
+            for metric, name in (
+                ("quota_errors", "coco_backend_quota_errors_total"),
+                ("give_ups", "coco_backend_quota_give_ups_total"),
+                ("throttled", "coco_backend_throttled_seconds_total"),
+                ("limit", "coco_backend_rate_limit"),
+            )
+        }
+    for backend in HEDGED_BACKENDS:
+        result.hedges[backend] = get_hedger(backend).stats()
+    degraded = registry_metrics.get("coco_jobs_degraded_total")
+    backfills = registry_metrics.get("coco_artifact_backfills_total")
+    if degraded is not None and backfills is not None:
+        for artifact in DEGRADABLE_ARTIFACTS:
+            result.degraded[artifact] = {
+                "deadline": degraded.value(artifact=artifact, reason="deadline"),
+                "error": degraded.value(artifact=artifact, reason="error"),
+            } | {
+                kind: backfills.value(artifact=artifact, result=kind)
+                for kind in BACKFILL_RESULTS
+            }
+    wait_seconds = registry_metrics.get("coco_stage_wait_seconds")
+    busy_seconds = registry_metrics.get("coco_stage_busy_seconds_total")
+    for stage, stats in get_stage_pools().stats().items():
+        waits = wait_seconds.count(stage=stage)
+        result.stages[stage] = {
+            "workers": stats["workers"],
+            "peak_queue": peak_queue.get(stage, 0),
+            "mean_wait": wait_seconds.sum(stage=stage) / waits if waits else 0.0,
+            "utilization": busy_seconds.value(stage=stage)
+            / (stats["workers"] * result.elapsed)
+            if result.elapsed
+            else 0.0,
+        }
+    result.peak_rss_mb = _peak_rss_mb()
+    return result
+
+
+def print_report(result: BenchResult, backends: FakeBackends) -> None:
+    accepted = result.jobs - result.rejected
+    print(
+        f"jobs={result.jobs} accepted={accepted} rejected={result.rejected} "
+        f"timed_out={result.timed_out} statuses={result.statuses}"
+    )
+    for name in ("speech", "gemini", "imagen", "tts", "gcs", "firestore"):
+        config: FakeBackendConfig = getattr(backends, name)
+        print(
+            f"  backend {name:<9} latency={config.call_latency * 1000:7.1f}ms "
+            f"jitter={config.jitter:.2f} failure_rate={config.failure_rate:.3f} "
+            f"tail={config.tail_rate:.3f}x{config.tail_multiplier:g}"
+        )
+    throughput = result.finished / result.elapsed if result.elapsed else 0.0
+    print(f"  elapsed     {result.elapsed:8.2f}s  throughput {throughput:.2f} jobs/s")
+    print(
+        "  latency     "
+        + " ".join(
+            f"p{pct}={percentile(result.latencies, pct) * 1000:.1f}ms"
+            for pct in (50, 90, 99)
+        )
+    )
+    for artifact, latencies in result.artifact_latencies.items():
+        print(
+            f"  {artifact:<12} "
+            + " ".join(
+                f"p{pct}={percentile(latencies, pct) * 1000:.1f}ms"
+                for pct in (50, 90, 99)
+            )
+        )
+    per_job = max(accepted, 1)
+    print("  firestore ops per job:")
+    for collection, counts in sorted(result.firestore_ops.items()):
+        print(
+            f"    {collection:<28} "
+            + " ".join(
+                f"{kind}={counts.get(kind, 0) / per_job:6.2f}"
+                for kind in ("reads", "writes", "round_trips")
+            )
+        )
+    if result.gcs_ops:
+        print(
+            "  gcs ops per job: "
+            + " ".join(
+                f"{op}={count / per_job:.2f}"
+                for op, count in sorted(result.gcs_ops.items())
+            )
+        )
+    if result.session_ops:
+        print(
+            "  session service calls per job: "
+            + " ".join(
+                f"{op}={count / per_job:.2f}"
+                for op, count in result.session_ops.items()
+            )
+        )
+    print(
+        f"  session cache hits={result.session_cache['hits']:.0f} "
+        f"misses={result.session_cache['misses']:.0f}"
+    )
+    if any(result.answer_cache.values()):
+        print(
+            "  answer cache "
+            + " ".join(
+                f"{kind}={count:.0f}" for kind, count in result.answer_cache.items()
+            )
+        )
+    for cache, counts in result.artifact_cache.items():
+        if any(counts.values()):
+            print(
+                f"  {cache} cache "
+                + " ".join(f"{kind}={count:.0f}" for kind, count in counts.items())
+                + f" saved={result.artifact_cache_saved_seconds.get(cache, 0.0):.2f}s"
+            )
+    if result.duplicates_sent:
+        print(
+            f"  duplicates sent={result.duplicates_sent} suppressed "
+            + " ".join(
+                f"{reason}={count:.0f}"
+                for reason, count in result.duplicates_suppressed.items()
+            )
+        )
+    for backend, stats in result.rate_limits.items():
+        if not any(stats.values()):
+            continue
+        print(
+            f"  rate limit {backend:<7} quota_errors={stats['quota_errors']:.0f} "
+            f"give_ups={stats['give_ups']:.0f} throttled={stats['throttled']:.2f}s "
+            f"limit={stats['limit']:.1f}/min"
+        )
+    for backend, stats in result.hedges.items():
+        if not stats["requests"]:
+            continue
+        print(
+            f"  hedging {backend:<6} requests={stats['requests']:.0f} "
+            f"hedged={stats['hedged']:.0f} ({stats['hedge_rate'] * 100:.1f}%) "
+            f"wins={stats['wins']:.0f} ({stats['win_rate'] * 100:.1f}%)"
+        )
+    for artifact, stats in result.degraded.items():
+        if not any(stats.values()):
+            continue
+        print(
+            f"  degraded {artifact:<12} deadline={stats['deadline']:.0f} "
+            f"error={stats['error']:.0f} backfilled={stats['completed']:.0f} "
+            f"failed={stats['failed']:.0f} abandoned={stats['abandoned']:.0f}"
+        )
+    print(f"  job concurrency={get_settings().job_max_concurrency} stages:")
+    for stage, stats in result.stages.items():
+        print(
+            f"    {stage:<10} workers={stats['workers']:3.0f} "
+            f"peak_queue={stats['peak_queue']:3.0f} "
+            f"mean_wait={stats['mean_wait'] * 1000:7.1f}ms "
+            f"utilization={stats['utilization'] * 100:5.1f}%"
+        )
+    print(f"  peak RSS    {result.peak_rss_mb:8.1f}MB")
+
+
+def _backend_config(
+    args: argparse.Namespace,
+    latency: float | None,
+    failure_rate: float | None,
+    quota: int,
+) -> FakeBackendConfig:
+    return FakeBackendConfig(
+        setup_latency=args.setup_latency,
+        call_latency=args.call_latency if latency is None else latency,
+        jitter=args.jitter,
+        tail_rate=args.tail_rate,
+        tail_multiplier=args.tail_multiplier,
+        failure_rate=args.failure_rate if failure_rate is None else failure_rate,
+        quota=quota,
+        quota_window=args.quota_window,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, default=32)
+    parser.add_argument("--burst-size", type=int, default=8)
+    parser.add_argument(
+        "--burst-interval", type=float, default=0.5, help="バースト間の間隔（秒）"
+    )
+    parser.add_argument(
+        "--job-timeout",
+        type=float,
+        default=300.0,
+        help="全ジョブの完了を待つ上限（秒）",
+    )
+    parser.add_argument(
+        "--setup-latency", type=float, default=0.05, help="クライアント生成コスト（秒）"
+    )
+    parser.add_argument(
+        "--call-latency",
+        type=float,
+        default=0.05,
+        help="API呼び出し1回のレイテンシ（秒）",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.2, help="レイテンシのばらつき"
+    )
+    parser.add_argument(
+        "--tail-rate",
+        type=float,
+        default=0.0,
+        help="応答が極端に遅くなる呼び出しの割合",
+    )
+    parser.add_argument(
+        "--tail-multiplier",
+        type=float,
+        default=10.0,
+        help="応答が極端に遅くなる呼び出しのレイテンシの倍率",
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="API呼び出しが失敗する確率"
+    )
+    parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.0,
+        help="実行中と完了後にもう一度ずつ配信する（Eventarcの重複配信を再現する）ジョブの割合",
+    )
+    backend_names = ("speech", "gemini", "imagen", "tts", "gcs", "firestore")
+    for name in backend_names:
+        parser.add_argument(f"--{name}-latency", type=float, default=None)
+        parser.add_argument(f"--{name}-failure-rate", type=float, default=None)
+        parser.add_argument(
+            f"--{name}-quota",
+            type=int,
+            default=0,
+            help="--quota-window 秒あたりに受け付ける呼び出し数（0は無制限）",
+        )
+    parser.add_argument(
+        "--quota-window",
+        type=float,
+        default=60.0,
+        help="フェイクのクォータを数える期間（秒）",
+    )
+    args = parser.parse_args()
+
+    backends = FakeBackends(
+        **{
+            name: _backend_config(
+                args,
+                getattr(args, f"{name}_latency"),
+                getattr(args, f"{name}_failure_rate"),
+                getattr(args, f"{name}_quota"),
+            )
+            for name in backend_names
+        }
+    )
+
+    # 失敗率を指定した場合のエラーログは想定内のため、すべて抑制する
+    logging.disable(logging.CRITICAL)
+    result = asyncio.run(
+        run_benchmark(
+            backends,
+            jobs=args.jobs,
+            burst_size=args.burst_size,
+            burst_interval=args.burst_interval,
+            job_timeout=args.job_timeout,
+            duplicate_rate=args.duplicate_rate,
+        )
+    )
+    print_report(result, backends)
+
+
+if __name__ == "__main__":
+    main()
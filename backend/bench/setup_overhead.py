@@ -0,0 +1,92 @@
+"""
+ジョブあたりのパイプライン準備コストを計測するベンチマーク。
+
+- before: ジョブごとにクライアント、エージェント、Runnerを構築する（従来の方式）
+- after:  起動時に構築した共有Runnerを使い回す（現在の方式）
+
+いずれもセッション作成までを1ジョブの準備コストとして計測する。
+
+実行例:
+    python -m bench.setup_overhead --jobs 200 --setup-latency 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import bench  # noqa: F401  ベンチマーク用の環境変数を設定する
+from bench.fakes import FakeBackendConfig, fake_client_factories
+from bench.stats import summarize_ms
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from pipeline import APP_NAME, build_root_agent
+from services.client_registry import ClientRegistry
+
+
+def _build_runner(
+    config: FakeBackendConfig, session_service: InMemorySessionService
+) -> Runner:
+    clients = ClientRegistry(fake_client_factories(config))
+    # ResultWriterAgentは実行しないため、Firestoreクライアントは不要
+    root_agent = build_root_agent(None, clients)  # type: ignore[arg-type]
+    return Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
+
+
+async def _create_session(
+    runner: Runner, job_id: str, user_id: str = "bench-user"
+) -> None:
+    await runner.session_service.create_session(
+        app_name=APP_NAME,
+        user_id=user_id,
+        session_id=job_id,
+        state={"job_id": job_id, "gcs_uri": f"gs://bench/{job_id}.webm"},
+    )
+
+
+async def measure_per_job_build(config: FakeBackendConfig, jobs: int) -> list[float]:
+    """ジョブごとにパイプラインを構築する場合の準備時間を計測する。"""
+    session_service = InMemorySessionService()
+    samples = []
+    for i in range(jobs):
+        started = time.perf_counter()
+        runner = _build_runner(config, session_service)
+        await _create_session(runner, f"before-{i}")
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def measure_shared_pipeline(config: FakeBackendConfig, jobs: int) -> list[float]:
+    """共有Runnerを使い回す場合の準備時間を計測する。"""
+    runner = _build_runner(config, InMemorySessionService())
+    samples = []
+    for i in range(jobs):
+        started = time.perf_counter()
+        await _create_session(runner, f"after-{i}")
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def main(jobs: int, setup_latency: float) -> None:
+    config = FakeBackendConfig(setup_latency=setup_latency)
+    before = await measure_per_job_build(config, jobs)
+    after = await measure_shared_pipeline(config, jobs)
+
+    print(f"jobs={jobs} client_setup_latency={setup_latency * 1000:.1f}ms")
+    print(f"  before (per-job build): {summarize_ms(before)}")
+    print(f"  after  (shared runner): {summarize_ms(after)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument(
+        "--setup-latency",
+        type=float,
+        default=0.05,
+        help="フェイククライアント1つあたりの生成コスト（秒）",
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    asyncio.run(main(args.jobs, args.setup_latency))
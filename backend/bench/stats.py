@@ -0,0 +1,21 @@
+"""ベンチマーク結果の集計ユーティリティ。"""
+
+import math
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """最近傍法でサンプルのパーセンタイル値を求める。"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize_ms(samples: list[float]) -> str:
+    """秒単位のサンプルを p50/p99/max のミリ秒表記に整形する。"""
+    return (
+        f"p50={percentile(samples, 50) * 1000:8.2f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.2f}ms "
+        f"max={max(samples, default=0.0) * 1000:8.2f}ms"
+    )
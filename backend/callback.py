@@ -1,15 +1,47 @@
+import asyncio
+from uuid import uuid4
+
 from dependencies import get_firestore_client
 from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
 from google.adk.models.llm_response import LlmResponse
-from models.agent_models import AgentProcessingError, ExplanationOutput
+from google.api_core import exceptions as google_exceptions
+from google.genai.types import Content, HttpOptions, Part
+from models.agent_models import (
+    AgentProcessingError,
+    ExplanationOutput,
+    IllustrationResult,
+    NarrationResult,
+)
 from pydantic import BaseModel
+from services import storage_service
+from services.answer_cache import AnswerCache, get_answer_cache
+from services.artifact_publisher import ArtifactStatus, publish_artifact
+from services.deadline import get_job_deadlines
+from services.explanation_stream import get_explanation_streams
 from services.firestore_service import update_job_data
 from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+from services.stage_checkpoint import STAGE_OUTPUT_KEYS, get_stage_checkpoints
+from services.timing_service import get_job_timing_tracker
 
-from config import AGENT_ERROR_MESSAGES
+from config import AGENT_ERROR_MESSAGES, get_settings
 
 logger = get_logger(__name__)
 
+_metrics = get_metrics_registry()
+_STAGES_RESUMED = _metrics.counter(
+    "coco_job_stages_resumed_total",
+    "以前の実行で完了していたため、再実行を省略したステージの数",
+    ("stage",),
+)
+
+# 成果物を生成するステージと、その成果物の種類、セッション状態の値のモデル
+_ARTIFACT_STAGES = {
+    "IllustratorAgent": ("illustration", IllustrationResult),
+    "NarratorAgent": ("narration", NarrationResult),
+}
+
 
 # --------------------------------------
 # エージェント実行前のコールバック
@@ -18,7 +50,8 @@ async def before_agent_callback(
     callback_context: CallbackContext,
 ) -> None:
     """
-    エージェントの実行が開始される前に呼び出され、エージェントの実行開始をログに記録する。
+    エージェントの実行が開始される前に呼び出され、エージェントの実行開始をログに記録し、
+    ステージの処理時間の計測を開始して、ステージの期限を設定する。
     """
     agent_name = getattr(callback_context, "agent_name", None)
     state_obj = getattr(callback_context, "state", None)
@@ -28,6 +61,8 @@ async def before_agent_callback(
 
     job_id = state.get("job_id", "unknown")
     logger.info(f"[{job_id}] エージェント '{agent_name}' を開始します。")
+    get_job_timing_tracker().start_stage(job_id, str(agent_name))
+    get_job_deadlines().start_stage(job_id, str(agent_name))
 
     return None
 
@@ -39,7 +74,7 @@ async def after_agent_callback(
     callback_context: CallbackContext,
 ) -> None:
     """
-    エージェントが終了した後に呼び出され、エージェントの実行終了をログに記録する。
+    エージェントが終了した後に呼び出され、エージェントの実行終了と処理時間をログに記録する。
     """
     agent_name = getattr(callback_context, "agent_name", "unknown")
     state_obj = getattr(callback_context, "state", None)
@@ -48,11 +83,49 @@ async def after_agent_callback(
     state = state_obj.to_dict() if state_obj else {}
 
     job_id = state.get("job_id", "unknown")
-    logger.info(f"[{job_id}] エージェント '{agent_name}' を終了します。")
+    duration = get_job_timing_tracker().end_stage(job_id, str(agent_name))
+    if duration is None:
+        logger.info(f"[{job_id}] エージェント '{agent_name}' を終了します。")
+    else:
+        logger.info(
+            f"[{job_id}] エージェント '{agent_name}' を終了します。"
+            f"処理時間: {duration:.3f}s"
+        )
 
     return None
 
 
+# --------------------------------------
+# パイプライン全体の実行後のコールバック
+# --------------------------------------
+async def after_pipeline_callback(
+    callback_context: CallbackContext,
+) -> None:
+    """
+    ルートエージェントの終了後に呼び出され、ジョブ全体の処理時間を記録する。
+    設定で有効な場合は、ステージごとの処理時間の内訳をジョブドキュメントに書き込む。
+    """
+    state = callback_context.state.to_dict()
+    job_id = state.get("job_id")
+    if not job_id:
+        return
+
+    timings = get_job_timing_tracker().finish_job(job_id)
+    if not timings:
+        return
+    logger.info(f"[{job_id}] ジョブ全体の処理時間: {timings['totalSeconds']:.3f}s")
+
+    if not get_settings().record_job_timings:
+        return
+    try:
+        db_client = get_firestore_client()
+        await update_job_data(db=db_client, job_id=job_id, data={"timings": timings})
+    except Exception as e:
+        logger.warning(
+            f"[{job_id}] Firestoreへの処理時間の内訳の書き込みに失敗しました: {e}"
+        )
+
+
 # --------------------------------------
 # TranscriberAgent実行後のコールバック
 # --------------------------------------
@@ -83,8 +156,12 @@ async def after_transcriber_agent_callback(
             f"[{job_id}] jobsコレクションに音声の文字起こしデータを書き込みます..."
         )
         db_client = get_firestore_client()
+        # 最初の進捗としてUIにすぐ表示させるため、バッファせずに書き込む
         await update_job_data(
-            db=db_client, job_id=job_id, data={"transcribedText": transcribed_text}
+            db=db_client,
+            job_id=job_id,
+            data={"transcribedText": transcribed_text},
+            immediate=True,
         )
         logger.info(
             f"[{job_id}] jobsコレクションへの音声の文字起こしデータ書き込みが完了しました。"
@@ -95,6 +172,38 @@ async def after_transcriber_agent_callback(
         )
 
 
+# --------------------------------------
+# ExplainerAgentのモデル呼び出し前後のコールバック
+# --------------------------------------
+async def before_explainer_model_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> None:
+    """
+    Gemini呼び出しの開始時刻を記録し、ステージの期限までの残り時間をリクエストの
+    タイムアウトとして渡す。before_model_callbackとして使用する。
+    """
+    job_id = callback_context.state.get("job_id", "unknown")
+    timeout = get_job_deadlines().remaining(job_id, "ExplainerAgent")
+    http_options = llm_request.config.http_options or HttpOptions()
+    http_options.timeout = int(timeout * 1000)
+    llm_request.config.http_options = http_options
+    get_job_timing_tracker().begin_external(job_id, "ExplainerAgent", "gemini")
+    return None
+
+
+async def after_explainer_model_callback(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> None:
+    """Gemini呼び出しの待ち時間を記録する。after_model_callbackとして使用する。"""
+    # ストリーミング時は部分レスポンスごとに呼び出されるため、
+    # 最終レスポンスで計測を終える
+    if llm_response.partial:
+        return None
+    job_id = callback_context.state.get("job_id", "unknown")
+    get_job_timing_tracker().end_external(job_id, "ExplainerAgent", "gemini")
+    return None
+
+
 # --------------------------------------
 # ExplainerAgent実行後のコールバック
 # --------------------------------------
@@ -106,6 +215,10 @@ async def parse_and_store_llm_response_as_explanation(
     after_model_callbackとして使用する。
     """
 
+    # ストリーミング時の部分レスポンスはJSONの断片のため、最終レスポンスのみをパースする
+    if llm_response.partial:
+        return None
+
     state = callback_context.state
     job_id = state.get("job_id", "unknown")
 
@@ -148,11 +261,41 @@ async def parse_and_store_llm_response_as_explanation(
     return None
 
 
+async def publish_explanation_fields(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> None:
+    """
+    ストリーミング中のLLMの出力を逐次パースし、値が確定したフィールドを
+    後続のエージェントに配信する。after_model_callbackとして、
+    `parse_and_store_llm_response_as_explanation` の後に使用する。
+    ストリームが開かれていないジョブ（ストリーミング無効時）では何もしない。
+    """
+    job_id = callback_context.state.get("job_id")
+    stream = get_explanation_streams().get(job_id) if job_id else None
+    if stream is None:
+        return None
+
+    if not llm_response.partial:
+        # 最終レスポンスはパース済みのため、未配信のフィールドをまとめて配信する
+        explanation_data = callback_context.state.get("explanation_data")
+        if explanation_data is not None:
+            stream.complete(ExplanationOutput.model_validate(explanation_data))
+        return None
+
+    if not (llm_response.content and llm_response.content.parts):
+        return None
+    text = "".join(part.text or "" for part in llm_response.content.parts)
+    for name in stream.feed(text):
+        logger.info(f"[{job_id}] 解説データの '{name}' が確定しました。")
+    return None
+
+
 async def after_explainer_agent_callback(
     callback_context: CallbackContext,
 ) -> None:
     """
     ExplainerAgentの実行後に呼び出され、生成された解説データをFirestoreに書き込む。
+    書き込みはバッファされ、直後の更新（イラストや最終ステータス）とまとめて書き込まれる。
     """
     state = callback_context.state.to_dict()
 
@@ -188,7 +331,218 @@ async def after_explainer_agent_callback(
         db_client = get_firestore_client()
         await update_job_data(db=db_client, job_id=job_id, data=update_data)
         logger.info(
-            f"[{job_id}] jobsコレクションへの解説データ書き込みが完了しました。"
+            f"[{job_id}] jobsコレクションへの解説データ書き込みを予約しました。"
         )
     except Exception as e:
         logger.warning(f"[{job_id}] Firestoreへの解説データ書き込みに失敗しました: {e}")
+
+
+# --------------------------------------
+# 完了済みステージのスキップ
+# --------------------------------------
+async def skip_completed_stage(
+    callback_context: CallbackContext,
+) -> Content | None:
+    """
+    各ステージの実行前に呼び出され、そのステージの有効な成果物がすでにセッション状態にあれば
+    ステージをスキップする。重複して配信されたジョブ、期限切れのリースを引き継いだジョブ、
+    `/jobs/{job_id}/resume` で再実行したジョブを、
+    以前の実行で完了したステージの次から再開する。
+    上流のステージを今回生成し直した場合は、成果物があってもスキップしない。
+    """
+    agent_name = callback_context.agent_name
+    output_key = STAGE_OUTPUT_KEYS.get(agent_name)
+    if output_key is None:
+        return None
+
+    state = callback_context.state
+    job_id = state.get("job_id", "unknown")
+    if not await get_stage_checkpoints().reusable_output(
+        job_id, agent_name, state.to_dict()
+    ):
+        return None
+
+    if agent_name == "ExplainerAgent":
+        # ストリーミング中のフィールドを待っている後続のステージに、
+        # 保存済みの解説データを配信する
+        stream = get_explanation_streams().get(job_id)
+        if stream is not None:
+            stream.complete(ExplanationOutput.model_validate(state[output_key]))
+    elif agent_name in _ARTIFACT_STAGES and state.get(output_key) is not None:
+        # スキップしたステージに代わって、保存済みの成果物をジョブドキュメントに書き込む
+        artifact, model = _ARTIFACT_STAGES[agent_name]
+        await _publish_restored_artifact(
+            job_id, artifact, model.model_validate(state[output_key])
+        )
+
+    # スキップしたステージでは after_agent_callback が呼ばれないため、ここで計測を終える
+    get_job_timing_tracker().end_stage(job_id, agent_name)
+    _STAGES_RESUMED.inc(stage=agent_name)
+    logger.info(
+        f"[{job_id}] 以前の実行で完了しているため、"
+        f"エージェント '{agent_name}' をスキップします。"
+    )
+    return Content(
+        parts=[Part(text="以前の実行で完了しているため、処理をスキップしました。")]
+    )
+
+
+# --------------------------------------
+# 回答キャッシュのコールバック
+# --------------------------------------
+async def skip_stage_on_answer_cache_hit(
+    callback_context: CallbackContext,
+) -> Content | None:
+    """
+    解説生成・イラスト生成・音声合成の各ステージの実行前に呼び出され、
+    同じ質問に対するキャッシュ済みの回答があれば、その成果物をstateに格納してステージをスキップする。
+    検索は最初のステージで一度だけ行い、結果をstateの `answer_cache_hit` に記録する。
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return None
+
+    state = callback_context.state
+    job_id = state.get("job_id", "unknown")
+    agent_name = callback_context.agent_name
+
+    hit = state.get("answer_cache_hit")
+    if hit is None:
+        hit = await _restore_cached_answer(callback_context, cache, job_id)
+        state["answer_cache_hit"] = hit
+    if not hit:
+        return None
+
+    # スキップしたステージでは after_agent_callback が呼ばれないため、ここで計測を終える
+    get_job_timing_tracker().end_stage(job_id, agent_name)
+    logger.info(
+        f"[{job_id}] キャッシュ済みの回答を使用するため、"
+        f"エージェント '{agent_name}' をスキップします。"
+    )
+    return Content(
+        parts=[
+            Part(text="キャッシュ済みの回答を使用するため、処理をスキップしました。")
+        ]
+    )
+
+
+async def _restore_cached_answer(
+    callback_context: CallbackContext, cache: AnswerCache, job_id: str
+) -> bool:
+    """
+    キャッシュ済みの回答を検索し、見つかった場合は成果物をこのジョブのパスにコピーして
+    stateに格納する。Storageのルールでは所有者しかファイルを読めないため、
+    他のユーザーのジョブで生成されたファイルをそのまま参照することはできない。
+    """
+    transcribed_text = callback_context.state.get("transcribed_text")
+    if not transcribed_text:
+        return False
+
+    try:
+        answer = await cache.lookup(transcribed_text)
+    except Exception as e:
+        logger.warning(f"[{job_id}] 回答キャッシュの検索に失敗しました: {e}")
+        return False
+    if answer is None:
+        logger.info(f"[{job_id}] 回答キャッシュに一致する質問はありませんでした。")
+        return False
+
+    user_id = callback_context._invocation_context.user_id
+    timings = get_job_timing_tracker()
+    try:
+        with timings.external_call(job_id, callback_context.agent_name, "gcs"):
+            image_gcs_path, final_audio_gcs_path = await asyncio.gather(
+                storage_service.copy_blob(
+                    answer.image_gcs_path, f"{user_id}/{job_id}/{uuid4()}.png"
+                ),
+                storage_service.copy_blob(
+                    answer.final_audio_gcs_path,
+                    f"{user_id}/{job_id}/{job_id}-{uuid4()}.mp3",
+                ),
+            )
+    except Exception as e:
+        logger.warning(
+            f"[{job_id}] キャッシュ済みの成果物のコピーに失敗したため、"
+            f"回答を生成します: {e}"
+        )
+        if isinstance(e, google_exceptions.NotFound):
+            # 元のファイルが削除されている回答は、以降も再利用できない
+            await cache.invalidate(answer.question, reason="missing_artifact")
+        return False
+
+    state = callback_context.state
+    state["explanation_data"] = answer.explanation
+    state["illustration"] = IllustrationResult(
+        job_id=job_id, image_gcs_path=image_gcs_path
+    )
+    state["narration"] = NarrationResult(
+        job_id=job_id, final_audio_gcs_path=final_audio_gcs_path
+    )
+    # 成果物を生成するステージはスキップされるため、ここでジョブドキュメントに書き込む
+    await _publish_restored_artifact(job_id, "illustration", state["illustration"])
+    await _publish_restored_artifact(job_id, "narration", state["narration"])
+    logger.info(
+        f"[{job_id}] 回答キャッシュにヒットしました。質問: '{answer.transcribed_text}'"
+    )
+    return True
+
+
+async def _publish_restored_artifact(
+    job_id: str, artifact: str, result: IllustrationResult | NarrationResult
+) -> None:
+    """
+    以前の実行や回答キャッシュから復元した成果物を、生成済みとしてジョブドキュメントに書き込む。
+    続く結果の書き込みとまとめるため、即座には書き込まない。
+    """
+    gcs_path = (
+        result.image_gcs_path
+        if isinstance(result, IllustrationResult)
+        else result.final_audio_gcs_path
+    )
+    await publish_artifact(
+        job_id, artifact, ArtifactStatus.ready, gcs_path=gcs_path, immediate=False
+    )
+
+
+async def store_answer_in_cache(
+    callback_context: CallbackContext,
+) -> None:
+    """
+    ResultWriterAgentの実行後に呼び出され、新たに生成した解説・イラスト・ナレーションを
+    回答キャッシュに登録する。登録に失敗してもジョブの結果には影響しない。
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return
+
+    state = callback_context.state
+    job_id = state.get("job_id", "unknown")
+    if state.get("answer_cache_hit"):
+        return
+    if state.get("illustration") is None or state.get("narration") is None:
+        # 縮退運転で成果物が揃わなかった回答は、他のジョブで再利用しない
+        logger.info(
+            f"[{job_id}] 成果物が揃っていない回答のため、回答キャッシュに登録しません。"
+        )
+        return
+
+    try:
+        explanation = ExplanationOutput.model_validate(state["explanation_data"])
+        if explanation.needs_clarification:
+            # 質問の意図が確認できていない回答は、他のジョブで再利用しない
+            logger.info(
+                f"[{job_id}] 追加の確認が必要な回答のため、"
+                "回答キャッシュに登録しません。"
+            )
+            return
+        illustration = IllustrationResult.model_validate(state["illustration"])
+        narration = NarrationResult.model_validate(state["narration"])
+        await cache.store(
+            transcribed_text=state["transcribed_text"],
+            explanation=explanation,
+            image_gcs_path=illustration.image_gcs_path,
+            final_audio_gcs_path=narration.final_audio_gcs_path,
+        )
+        logger.info(f"[{job_id}] 回答キャッシュに登録しました。")
+    except Exception as e:
+        logger.warning(f"[{job_id}] 回答キャッシュへの登録に失敗しました: {e}")
@@ -12,6 +12,40 @@ class SessionService(str, Enum):
     firestore = "firestore"
 
 
+class TranscriptionMode(str, Enum):
+    """音声文字起こしの方式を定義するEnum"""
+
+    batch = "batch"
+    streaming = "streaming"
+
+
+class StorageBackendType(str, Enum):
+    """成果物を保存するオブジェクトストレージの種別を定義するEnum"""
+
+    gcs = "gcs"
+    local = "local"
+
+
+class IllustrationPlacement(str, Enum):
+    """生成したイラストを最終的な保存先に配置する方式を定義するEnum"""
+
+    # Imagenにジョブの保存先へ直接書き込ませ、その画像をそのまま参照する
+    reference = "reference"
+    # 画像のバイト列をレスポンスで受け取り、ジョブの保存先に1回でアップロードする
+    inline = "inline"
+    # 一時出力先に書き込ませてから、ジョブの保存先に移動する（コピーと削除）
+    rename = "rename"
+
+
+class AnswerCacheBackend(str, Enum):
+    """回答キャッシュの保存先を定義するEnum"""
+
+    none = "none"
+    memory = "memory"
+    disk = "disk"
+    firestore = "firestore"
+
+
 class Settings(BaseSettings):
     """
     アプリケーション（Cloud Run）の環境変数を管理するための設定クラス。
@@ -43,6 +77,44 @@ class Settings(BaseSettings):
     )
     generated_image_bucket: str = Field(..., description="生成画像保存用のバケット名")
 
+    # ストレージ設定
+    storage_backend: StorageBackendType = Field(
+        default=StorageBackendType.gcs,
+        description=(
+            "成果物の保存先（gcs: Cloud Storage, local: ローカルのファイルシステム。"
+            "テスト用）"
+        ),
+    )
+    storage_local_root: str = Field(
+        default="/tmp/coco-ai/storage",
+        description="localバックエンドでバケットごとのディレクトリを作成するルートディレクトリ",
+    )
+    storage_max_workers: int = Field(
+        default=16,
+        description="ストレージ操作を実行するスレッド数と、GCSへのHTTP接続プールの大きさ",
+    )
+    storage_retry_attempts: int = Field(
+        default=4, description="一時的なエラーが発生したストレージ操作の最大試行回数"
+    )
+    storage_retry_initial_backoff_seconds: float = Field(
+        default=0.2,
+        description="ストレージ操作のリトライ間隔（ジッター付き指数バックオフ）の初期値",
+    )
+    storage_retry_max_backoff_seconds: float = Field(
+        default=5.0, description="ストレージ操作のリトライ間隔の上限秒数"
+    )
+    storage_retry_deadline_seconds: float = Field(
+        default=30.0, description="1つのストレージ操作でリトライを続ける最大秒数"
+    )
+    storage_resumable_threshold_bytes: int = Field(
+        default=8 * 1024 * 1024,
+        description="再開可能アップロードで送信するデータサイズの下限（0で無効）",
+    )
+    storage_resumable_chunk_bytes: int = Field(
+        default=4 * 1024 * 1024,
+        description="再開可能アップロードで1回に送信するバイト数（256KiBの倍数に切り下げる）",
+    )
+
     # Gemini API 設定
     google_genai_use_vertexai: bool = Field(
         default=True, description="Vertex AI経由でGemini APIを使用するかどうか"
@@ -52,12 +124,287 @@ class Settings(BaseSettings):
     firestore_collection: str = Field(..., description="Firestoreのコレクション名")
 
     # タイムアウト設定
-    agent_timeout: int = Field(default=300, description="エージェントのタイムアウト秒")
+    job_timeout_seconds: float = Field(
+        default=600.0,
+        description="ジョブ全体の処理時間の予算秒数（各ステージの期限はこの残り時間を超えない）",
+    )
+    agent_timeout: int = Field(
+        default=300, description="エージェント（ステージ）ごとのタイムアウト秒"
+    )
+
+    # 音声文字起こし設定
+    transcription_mode: TranscriptionMode = Field(
+        default=TranscriptionMode.batch,
+        description=(
+            "音声文字起こしの方式（batch: 一括認識, streaming: ストリーミング認識）"
+        ),
+    )
+
+    # 解説生成設定
+    explainer_streaming: bool = Field(
+        default=False,
+        description="Geminiの出力をストリーミングで受け取り、確定したフィールドからイラスト生成と音声合成を開始するかどうか",
+    )
+
+    # 回答キャッシュ設定
+    answer_cache_backend: AnswerCacheBackend = Field(
+        default=AnswerCacheBackend.none,
+        description="同じ質問への回答を再利用する回答キャッシュの保存先（none: 無効）",
+    )
+    answer_cache_max_entries: int = Field(
+        default=1000, description="回答キャッシュに保持する質問数の上限"
+    )
+    answer_cache_ttl_seconds: float = Field(
+        default=7 * 24 * 3600, description="キャッシュした回答を再利用する秒数"
+    )
+    answer_cache_dir: str = Field(
+        default="/tmp/coco-ai/answer-cache",
+        description="diskバックエンドで回答を保存するディレクトリ",
+    )
+    answer_cache_collection: str = Field(
+        default="answer_cache",
+        description="firestoreバックエンドで回答を保存するコレクション名",
+    )
+    answer_cache_similarity_threshold: float = Field(
+        default=0.0,
+        description="埋め込みベクトルによる類似検索でヒットとみなすコサイン類似度の下限（0で類似検索を無効化）",
+    )
+    answer_cache_embedding_model: str = Field(
+        default="text-multilingual-embedding-002",
+        description="類似検索に使用する埋め込みモデル",
+    )
+
+    # イラスト生成設定
+    illustration_placement: IllustrationPlacement = Field(
+        default=IllustrationPlacement.reference,
+        description=(
+            "生成したイラストを保存先に配置する方式（reference: 直接書き込み, inline: "
+            "バイト列を受け取りアップロード, rename: 一時出力先から移動）"
+        ),
+    )
+    temp_generation_sweep_interval_seconds: float = Field(
+        default=3600.0,
+        description="生成画像バケットの一時出力先（temp_generations/）に残った画像を削除する間隔の秒数（0で無効）",
+    )
+    temp_generation_max_age_seconds: float = Field(
+        default=3600.0,
+        description="一時出力先の画像を、移動されずに残ったとみなして削除するまでの秒数",
+    )
+
+    # 成果物キャッシュ設定
+    tts_cache_enabled: bool = Field(
+        default=True,
+        description="同じSSMLと音声設定から合成済みの音声を再利用し、音声合成とアップロードを省略するかどうか",
+    )
+    tts_cache_budget_bytes: int = Field(
+        default=1024**3,
+        description="キャッシュ用に保持する音声の合計サイズの上限（超過時は古いものから削除する。0で無制限）",
+    )
+    illustration_cache_enabled: bool = Field(
+        default=True,
+        description="同じプロンプトと生成設定から生成済みのイラストを再利用し、Imagenの呼び出しを省略するかどうか",
+    )
+    illustration_cache_variety: int = Field(
+        default=3,
+        description="1つのプロンプトについて生成して保持するイラストの数（この数が揃うまでは新たに生成し、揃った後はその中から無作為に選ぶ）",
+    )
+    illustration_cache_budget_bytes: int = Field(
+        default=5 * 1024**3,
+        description="キャッシュ用に保持するイラストの合計サイズの上限（超過時は古いものから削除する。0で無制限）",
+    )
+    artifact_cache_collection: str = Field(
+        default="artifact_cache",
+        description="成果物キャッシュの永続インデックスを保存するコレクション名",
+    )
+    artifact_cache_memory_entries: int = Field(
+        default=1024,
+        description="成果物キャッシュのインメモリインデックスに保持するエントリ数の上限",
+    )
+
+    # 同期APIクライアント呼び出し用のスレッドプール設定
+    blocking_executor_max_workers: int = Field(
+        default=32,
+        description="Speech/TTS/Imagenの同期呼び出しを実行するスレッド数の上限",
+    )
+
+    # 起動設定
+    pipeline_background_load: bool = Field(
+        default=True,
+        description="重いSDKのimportとパイプラインの構築を、リクエストの受付開始後にバックグラウンドで行うかどうか（falseの場合は構築の完了を待ってから受付を開始する）",
+    )
+    warmup_on_startup: bool = Field(
+        default=False,
+        description=(
+            "パイプラインの構築後に各バックエンドへの接続を確立するウォームアップを"
+            "行うかどうか（`/warmup` からも実行できる）"
+        ),
+    )
+    warmup_timeout_seconds: float = Field(
+        default=10.0, description="ウォームアップでバックエンドごとに応答を待つ秒数"
+    )
+    warmup_storage_connections: int = Field(
+        default=4,
+        description="ウォームアップでGCSの接続プールに確立しておく接続数（同時に送るリクエスト数）",
+    )
+
+    # ジョブスケジューラ設定
+    job_max_concurrency: int = Field(
+        default=16,
+        description="インスタンス内で同時に処理するジョブ数の上限（ステージのワーカーの空きを待っているジョブを含む）",
+    )
+    job_queue_size: int = Field(
+        default=32, description="実行待ちジョブのキューの上限（超過時は429を返す）"
+    )
+    invoke_batch_max_events: int = Field(
+        default=1000,
+        description="`/invoke/batch` の1回のリクエストで受け付けるイベント数の上限",
+    )
+    job_drain_timeout: float = Field(
+        default=8.0, description="シャットダウン時に実行中のジョブの完了を待つ秒数"
+    )
+
+    # ステージごとのワーカー設定
+    stage_transcribe_workers: int = Field(
+        default=8, description="同時に実行する文字起こし（Speech-to-Text）の数の上限"
+    )
+    stage_explain_workers: int = Field(
+        default=8, description="同時に実行する解説生成（Gemini）の数の上限"
+    )
+    stage_illustrate_workers: int = Field(
+        default=4, description="同時に実行するイラスト生成（Imagen）の数の上限"
+    )
+    stage_narrate_workers: int = Field(
+        default=8, description="同時に実行する音声合成（Text-to-Speech）の数の上限"
+    )
+    stage_write_workers: int = Field(
+        default=8, description="同時に実行する最終結果の書き込み（Firestore）の数の上限"
+    )
+
+    # バックエンドのレート制限設定
+    speech_requests_per_minute: float = Field(
+        default=0,
+        description="Speech-to-Textに1分間に送るリクエスト数の上限（0はクォータ超過を検知するまで無制限）",
+    )
+    gemini_requests_per_minute: float = Field(
+        default=0,
+        description="Geminiに1分間に送るリクエスト数の上限（0はクォータ超過を検知するまで無制限）",
+    )
+    imagen_requests_per_minute: float = Field(
+        default=0,
+        description="Imagenに1分間に送るリクエスト数の上限（0はクォータ超過を検知するまで無制限）",
+    )
+    tts_requests_per_minute: float = Field(
+        default=0,
+        description="Text-to-Speechに1分間に送るリクエスト数の上限（0はクォータ超過を検知するまで無制限）",
+    )
+    rate_limit_burst: int = Field(
+        default=5,
+        description="上限の範囲内で連続して送れるリクエスト数（トークンバケットの容量）",
+    )
+    rate_limit_decrease_factor: float = Field(
+        default=0.5, description="クォータ超過を受け取った際に上限に掛ける係数"
+    )
+    rate_limit_recovery_seconds: float = Field(
+        default=60.0, description="下げた上限を元の値まで線形に戻すのにかける秒数"
+    )
+    rate_limit_initial_backoff_seconds: float = Field(
+        default=1.0,
+        description="クォータ超過後に呼び出しを止める秒数の初期値（連続するたびに倍にする）",
+    )
+    rate_limit_max_backoff_seconds: float = Field(
+        default=30.0, description="クォータ超過後に呼び出しを止める秒数の上限"
+    )
+    rate_limit_window_seconds: float = Field(
+        default=60.0,
+        description="上限を設定していないバックエンドで、クォータ超過時に直近のリクエスト数を数える期間（バックエンドのクォータの集計期間に合わせる）",
+    )
+    rate_limit_max_wait_seconds: float = Field(
+        default=120.0,
+        description="1回の呼び出しでクォータ超過からの回復を待つ秒数の上限（超えた場合はジョブを失敗させる）",
+    )
+
+    # ヘッジリクエスト設定
+    imagen_hedging_enabled: bool = Field(
+        default=False,
+        description="Imagenの応答が遅い場合に2つ目のリクエストを送り、先に返った方を使うかどうか（referenceの配置では、採用されなかった画像がジョブの保存先に残る）",
+    )
+    tts_hedging_enabled: bool = Field(
+        default=False,
+        description="Text-to-Speechの応答が遅い場合に2つ目のリクエストを送り、先に返った方を使うかどうか",
+    )
+    hedge_percentile: float = Field(
+        default=95.0,
+        description="2つ目のリクエストを送るまでの待ち時間とする、直近の応答時間のパーセンタイル",
+    )
+    hedge_min_samples: int = Field(
+        default=20, description="ヘッジを始めるのに必要な、観測済みの応答時間の数"
+    )
+    hedge_window_size: int = Field(
+        default=200, description="待ち時間の算出に使う、直近の応答時間の数"
+    )
+
+    # 縮退運転設定
+    degradation_enabled: bool = Field(
+        default=False,
+        description="イラストまたはナレーションが揃わない場合に、揃った成果物でジョブを完了させ、残りを後から補完するかどうか",
+    )
+    degradable_stage_timeout_seconds: float = Field(
+        default=60.0,
+        description="縮退運転時に、イラスト生成と音声合成の完了を待つ秒数（超えた場合はその成果物なしでジョブを完了させる）",
+    )
+    backfill_timeout_seconds: float = Field(
+        default=600.0,
+        description="ジョブの完了後に、揃わなかった成果物を補完する処理の時間の上限秒数",
+    )
+    placeholder_image_gcs_path: str = Field(
+        default="",
+        description="イラストが補完されるまでの間に表示する画像のGCSパス（空の場合は画像なし）",
+    )
+
+    # ジョブのリース設定
+    job_lease_enabled: bool = Field(
+        default=True,
+        description="ジョブドキュメントのリースで、重複して配信されたジョブの実行を省略するかどうか",
+    )
+    job_lease_ttl_seconds: float = Field(
+        default=120.0,
+        description="ジョブのリースの有効期限の秒数（延長されずに期限が切れたリースは、次の配信が引き継ぐ）",
+    )
+    job_lease_renew_interval_seconds: float = Field(
+        default=30.0, description="実行中のジョブのリースの有効期限を延長する間隔の秒数"
+    )
+
+    # ジョブドキュメントの書き込み設定
+    job_update_debounce_seconds: float = Field(
+        default=1.0,
+        description="ジョブドキュメントへの更新をまとめるために書き込みを待つ秒数（0で無効）",
+    )
+    job_update_max_delay_seconds: float = Field(
+        default=3.0,
+        description="まとめている更新を、最初の更新から書き込むまでに待つ最大秒数",
+    )
+
+    # 計測設定
+    record_job_timings: bool = Field(
+        default=False,
+        description="ステージごとの処理時間の内訳をジョブドキュメントに書き込むかどうか",
+    )
 
     # ADK セッションサービス設定
     session_service: SessionService = Field(
         default=SessionService.inmemory, description="使用するセッションサービスの種類"
     )
+    firestore_session_lean_writes: bool = Field(
+        default=True,
+        description="FirestoreSessionServiceで書き込み後の再読み込みを省略し、イベントの追加を1回の書き込みで行うかどうか",
+    )
+    session_cache_max_entries: int = Field(
+        default=256,
+        description="FirestoreSessionServiceのインメモリキャッシュに保持するセッション数の上限（0で無効）",
+    )
+    session_cache_ttl_seconds: float = Field(
+        default=600.0, description="キャッシュしたセッションを保持する秒数"
+    )
 
 
 AGENT_ERROR_MESSAGES = {
@@ -66,6 +413,8 @@ AGENT_ERROR_MESSAGES = {
     "IllustratorAgent": "イラスト生成に失敗しました。",
     "NarratorAgent": "ナレーション生成に失敗しました。",
     "ResultWriterAgent": "結果の書き込みに失敗しました。",
+    "Timeout": "処理に時間がかかりすぎたため、中断しました。",
+    "Interrupted": "サーバーの停止により処理を中断しました。",
     "UnknownAgent": "不明な処理でエラーが発生しました。",  # 汎用的なメッセージ
 }
 
@@ -1,21 +1,32 @@
 from functools import lru_cache
+from typing import TYPE_CHECKING
 
-from google.adk.sessions import BaseSessionService
-from google.cloud.firestore import AsyncClient
-from services.session_service import create_session_service, get_db_client
+from services.client_registry import ClientRegistry
+
+if TYPE_CHECKING:
+    from google.adk.sessions import BaseSessionService
+    from google.cloud.firestore import AsyncClient
 
 
 @lru_cache
-def get_session_service(db_client: AsyncClient | None = None) -> BaseSessionService:
+def get_session_service(db_client: "AsyncClient | None" = None) -> "BaseSessionService":
     """
     セッションサービスのシングルトンインスタンスを生成・取得する。
     引数で渡された場合、そのクライアントを使用してサービスを初期化する。
     """
+    # ADKに依存するため、初めて必要になった時点でimportする
+    from services.session_service import create_session_service
+
     # db_clientがNoneの場合、create_session_service内で新しいクライアントが生成される
     return create_session_service(db_client)
 
 
+def get_firestore_client() -> "AsyncClient":
+    """共有レジストリからFirestore AsyncClientのシングルトンインスタンスを取得する。"""
+    return get_client_registry().firestore
+
+
 @lru_cache
-def get_firestore_client() -> AsyncClient:
-    """Firestore AsyncClientのシングルトンインスタンスを生成・取得する。"""
-    return get_db_client()
+def get_client_registry() -> ClientRegistry:
+    """共有クライアントレジストリのシングルトンインスタンスを生成・取得する。"""
+    return ClientRegistry()
@@ -1,66 +1,159 @@
-# 各種エージェント
+# 起動処理の内訳を記録するため、他のモジュールより先にimportする
+from services.startup_profile import get_startup_profile  # isort: skip
 
+import asyncio
+import json
 from contextlib import asynccontextmanager
 
-from agents.explainer_agent.agent import ExplainerAgent
-from agents.illustrator_agent.agent import IllustratorAgent
-from agents.narrator_agent.agent import NarratorAgent
-from agents.result_writer_agent.agent import ResultWriterAgent
-from agents.transcriber_agent.agent import TranscriberAgent
-from callback import after_agent_callback, before_agent_callback
-
 # FastAPI & CloudEvents
-from cloudevents.http import from_http
-from dependencies import get_session_service
+from cloudevents.http import from_dict, from_http
 from fastapi import (
-    BackgroundTasks,
     FastAPI,
     HTTPException,
     Request,
     Response,
     status,
 )
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-# ADK & GenAI SDK
-from google.adk.agents import ParallelAgent, SequentialAgent
-from google.adk.runners import Runner
-from google.adk.sessions import BaseSessionService
-from google.cloud import firestore
-from google.genai.types import Content, Part
-
-# モデル、サービス、コールバック関数
-from models.agent_models import AgentProcessingError, StorageObjectData
+# モデル、サービス
+from models.agent_models import JobNotResumableError, StorageObjectData
 from pydantic import ValidationError
-from services.firestore_service import update_job_status
+from services.job_scheduler import JobRejectedError, JobScheduler
 from services.logging_service import get_logger, setup_logging
+from services.metrics_service import get_metrics_registry
 
 # 設定
-from config import AGENT_ERROR_MESSAGES, get_settings
+from config import get_settings
+
+# パイプラインが依存する重いSDK。リクエストの受付開始後にバックグラウンドでimportし、
+# `/startup-profile` で個別のimport時間を報告する
+DEFERRED_MODULES = (
+    "google.adk",
+    "google.genai",
+    "google.cloud.speech_v2",
+    "google.cloud.texttospeech",
+    "google.cloud.firestore",
+    "google.cloud.storage",
+)
+
+get_startup_profile().mark("main_imported")
+
+
+async def _load_pipeline():
+    """
+    重いSDKをimportしてパイプラインを構築する。
+    importはイベントループを止めないよう別スレッドで行い、その間もリクエストを受け付ける。
+    """
+    profile = get_startup_profile()
+    with profile.phase("deferred_imports"):
+        for name in DEFERRED_MODULES:
+            await asyncio.to_thread(profile.import_module, name)
+        # エージェントやサービスなど、アプリケーション自身のモジュール
+        pipeline_module = await asyncio.to_thread(profile.import_module, "pipeline")
+    with profile.phase("pipeline_build"):
+        pipeline = pipeline_module.Pipeline()
+    profile.mark("pipeline_ready")
+    logger.info("パイプラインの準備が完了しました。")
+    return pipeline
+
+
+def _on_pipeline_loaded(task: asyncio.Task) -> None:
+    """
+    パイプラインの構築の完了時に呼び出される。
+    失敗した場合はログと `/startup-profile` に記録する。
+    以降のジョブの受付は503で拒否する。
+    """
+    if task.cancelled() or task.exception() is None:
+        return
+    error = task.exception()
+    logger.error(
+        f"パイプラインの構築に失敗しました。ジョブの受付を停止します: {error}",
+        exc_info=error,
+    )
+    get_startup_profile().fail("pipeline", error)
+
+
+def _ensure_pipeline_available(app: FastAPI) -> None:
+    """
+    パイプラインの構築に失敗している場合、ジョブを受け付けずに503を返す。
+    受け付けた（ACKした）ジョブは再配信されないため、実行できないジョブは受け付けない。
+    """
+    loading: asyncio.Task = app.state.pipeline
+    if loading.done() and (loading.cancelled() or loading.exception() is not None):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="パイプラインを構築できなかったため、ジョブを受け付けられません。",
+            headers={"Retry-After": "10"},
+        )
+
+
+async def _warm_up(app: FastAPI) -> dict:
+    """パイプラインの構築の完了を待ってから、各バックエンドへの接続を確立する。"""
+    pipeline = await app.state.pipeline
+    profile = get_startup_profile()
+    with profile.phase("warmup"):
+        report = await pipeline.warm_up()
+    profile.mark("warmed_up")
+    return report
+
+
+def _start_warmup(app: FastAPI) -> asyncio.Task:
+    """
+    ウォームアップを開始する。実行中または成功済みの場合はそのタスクを返し、
+    同じインスタンスで何度もウォームアップしないようにする。
+    """
+    task: asyncio.Task | None = app.state.warmup
+    if task is None or (task.done() and (task.cancelled() or task.exception())):
+        task = asyncio.create_task(_warm_up(app), name="warmup")
+        app.state.warmup = task
+    return task
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     FastAPIアプリケーションのライフサイクルイベントを管理する。
-    起動時にFirestoreクライアントを初期化し、アプリケーション全体で共有する。
+    起動時にジョブスケジューラを起動し、パイプライン（Firestoreクライアント、共有クライアント
+    レジストリ、エージェント）の構築を開始する。構築は既定ではバックグラウンドで行い、
+    完了を待たずにリクエストの受付を開始する。受け付けたジョブは構築の完了を待ってから実行される。
+    `warmup_on_startup` が有効な場合は、構築後に各バックエンドへの接続も確立しておく。
     終了時にクライアントを閉じる。
     """
-    # アプリケーション起動時
-    db_client = firestore.AsyncClient()
-    app.state.db_client = db_client
-    logger.info("Firestore client initialized.")
+    # 同時実行数とキュー長に上限を設けたジョブスケジューラを起動
+    scheduler = JobScheduler(
+        max_concurrency=settings.job_max_concurrency,
+        max_queue_size=settings.job_queue_size,
+        on_abandoned=lambda job_id: _abandon_job(app, job_id),
+    )
+    scheduler.start()
+    app.state.scheduler = scheduler
+
+    app.state.pipeline = asyncio.create_task(_load_pipeline(), name="load-pipeline")
+    app.state.pipeline.add_done_callback(_on_pipeline_loaded)
+    app.state.warmup = None
+    if settings.warmup_on_startup:
+        _start_warmup(app)
+    if not settings.pipeline_background_load:
+        await app.state.pipeline
+        if app.state.warmup is not None:
+            await app.state.warmup
+    get_startup_profile().mark("listening")
     yield
     # アプリケーション終了時
-    client: firestore.AsyncClient = app.state.db_client
-    if client:
-        client.close()
-    logger.info("Firestore client closed.")
+    # 受付を停止し、実行中のジョブの完了を待ってからクライアントを閉じる
+    await scheduler.drain(timeout=settings.job_drain_timeout)
+    if app.state.warmup is not None and not app.state.warmup.done():
+        app.state.warmup.cancel()
+    loading = app.state.pipeline
+    if not loading.done():
+        loading.cancel()
+    elif loading.exception() is None:
+        await loading.result().close()
 
 
 app = FastAPI(lifespan=lifespan)
 
-APP_NAME = "coco-ai"  # A logical name for the application/agent.
-
 # ---------------------------
 # ログと設定の初期化
 # ---------------------------
@@ -72,6 +165,16 @@ settings = get_settings()
 # ---------------------------
 # ヘルパー関数
 # ---------------------------
+def _to_event_data(storage_data: StorageObjectData) -> dict:
+    """検証済みのイベントペイロードから、パイプラインの実行に必要なデータを抽出する。"""
+    return {
+        "job_id": storage_data.metadata.job_id,
+        "user_id": storage_data.metadata.user_id,
+        "bucket": storage_data.bucket,
+        "name": storage_data.name,
+    }
+
+
 async def _parse_cloudevent_payload(request: Request) -> dict:
     """
     FastAPIリクエストからCloudEventペイロードを解析・検証する。
@@ -90,10 +193,9 @@ async def _parse_cloudevent_payload(request: Request) -> dict:
         storage_data = StorageObjectData.model_validate(event.data)
 
         # イベントペイロードからデータを抽出
-        job_id = storage_data.metadata.job_id
-        user_id = storage_data.metadata.user_id
-        bucket = storage_data.bucket
-        name = storage_data.name
+        event_data = _to_event_data(storage_data)
+        job_id = event_data["job_id"]
+        bucket = event_data["bucket"]
 
         # セキュリティチェック: イベントが期待されたバケットからのものか確認
         if bucket != settings.audio_upload_bucket:
@@ -104,7 +206,7 @@ async def _parse_cloudevent_payload(request: Request) -> dict:
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="予期しないソースバケットからのイベントです。",
             )
-        return {"job_id": job_id, "user_id": user_id, "bucket": bucket, "name": name}
+        return event_data
     except ValidationError as e:
         logger.error(f"不正なCloudEventペイロードです: {e}", exc_info=True)
         raise HTTPException(
@@ -118,150 +220,232 @@ async def _parse_cloudevent_payload(request: Request) -> dict:
         )
 
 
-async def _update_job_status_on_error(
-    db_client: firestore.AsyncClient, job_id: str, error_message: str
-):
-    """
-    Firestoreのジョブステータスをエラー状態に更新し、その際のDBエラーをログに記録するヘルパー関数。
-    """
-    try:
-        await update_job_status(
-            db_client, job_id, "error", {"errorMessage": error_message}
-        )
-    except Exception as db_error:
-        logger.error(
-            f"[{job_id}] Firestoreへのエラー状態の書き込みに失敗しました: {db_error}"
+# ---------------------------------
+# Eventarcトリガーのエンドポイント
+# ---------------------------------
+async def _run_job(app: FastAPI, event_data: dict) -> None:
+    """パイプラインの構築の完了を待ってから、ジョブを実行する。"""
+    pipeline = await app.state.pipeline
+    await pipeline.run(event_data)
+
+
+async def _abandon_job(app: FastAPI, job_id: str) -> None:
+    """停止時に実行できなかったジョブを、再開できる状態（エラー）にする。"""
+    loading: asyncio.Task = app.state.pipeline
+    if not loading.done() or loading.cancelled() or loading.exception():
+        logger.warning(
+            f"[{job_id}] パイプラインが未構築のため、中断を記録できませんでした。"
         )
+        return
+    await loading.result().abandon(job_id)
 
 
-# ---------------------------------
-# ルートエージェントの構築
-# ---------------------------------
-def build_root_agent(db_client: firestore.AsyncClient) -> SequentialAgent:
-    """
-    エージェントの処理パイプラインを構築する。
-
-    処理フロー:
-      音声文字起こし (Transcriber)
-      -> 子供向け解説生成 (Explainer)
-      -> [並列処理]
-         - イラスト生成 (Illustrator)
-         - 音声合成 (Narrator)
-      -> 最終結果の書き込み (ResultWriter)
-
-    IllustratorとNarratorは `ParallelAgent` を使って並列実行される。
-    最終的な失敗チェックは `ResultWriterAgent` で行われる。
-    """
-    transcriber = TranscriberAgent()
-    explainer = ExplainerAgent()
-    illustrator = IllustratorAgent()
-    narrator = NarratorAgent()
-    result_writer = ResultWriterAgent(db_client=db_client)
-
-    # イラスト生成と音声合成を並列実行するブランチ
-    parallel_branch = ParallelAgent(
-        name="IllustrateAndNarrate",
-        sub_agents=[illustrator, narrator],
-        description="イラスト生成と音声合成を並列で実行します。",
+def _rejected_http_exception(e: JobRejectedError) -> HTTPException:
+    """スケジューラがジョブを受け付けなかった場合の応答。キュー満杯は429、停止処理中は503を返す。"""
+    status_code = (
+        status.HTTP_429_TOO_MANY_REQUESTS
+        if e.reason == "queue_full"
+        else status.HTTP_503_SERVICE_UNAVAILABLE
     )
-
-    # 全体の処理を定義するシーケンシャルなエージェント
-    root = SequentialAgent(
-        name="CocoAiPipeline",
-        sub_agents=[transcriber, explainer, parallel_branch, result_writer],
-        before_agent_callback=before_agent_callback,
-        after_agent_callback=after_agent_callback,
+    return HTTPException(
+        status_code=status_code,
+        detail="現在ジョブを受け付けられません。",
+        headers={"Retry-After": "10"},
     )
-    return root
 
 
-async def run_pipeline_in_background(
-    event_data: dict,
-    session_service: BaseSessionService,
-    db_client: firestore.AsyncClient,
-):
+@app.post("/invoke")
+async def invoke_pipeline(request: Request):
     """
-    バックグラウンドで実行されるエージェントパイプラインのメインロジック。
+    Cloud StorageへのファイルアップロードをトリガーにEventarcから呼び出されるメインエンドポイント。
+    リクエストを即座にACKし、重い処理はジョブスケジューラ上で実行する。
+    スケジューラが受け付けられない場合は429/503を返し、Eventarcに再配信させる。
     """
-    job_id = event_data["job_id"]
-    user_id = event_data["user_id"]
-    bucket = event_data["bucket"]
-    name = event_data["name"]
+    scheduler: JobScheduler = request.app.state.scheduler
+    _ensure_pipeline_available(request.app)
+
+    # CloudEventペイロードを解析・検証
+    # ヘルパー関数内で発生したHTTPExceptionはFastAPIによって自動的に伝播される
+    event_data = await _parse_cloudevent_payload(request)
 
-    gcs_uri = f"gs://{bucket}/{name}"
-    logger.info(f"[{job_id}] CloudEventを受信しました: {gcs_uri}")
+    # ジョブスケジューラにパイプライン処理を投入
     try:
-        # セッションの初期状態を設定
-        initial_data = {"state": {"job_id": job_id, "gcs_uri": gcs_uri}}
-        session = await session_service.get_session(
-            app_name=APP_NAME, user_id=user_id, session_id=job_id
+        scheduler.submit(
+            event_data["job_id"],
+            _run_job,
+            request.app,
+            event_data,
         )
-        if not session:
-            # 新しいセッションの場合、初期状態を注入してセッションを作成
-            session = await session_service.create_session(
-                app_name=APP_NAME,
-                user_id=user_id,
-                session_id=job_id,
-                **initial_data,
-            )
+    except JobRejectedError as e:
+        # いずれのステータスコードでもEventarcによって再配信される
+        raise _rejected_http_exception(e)
+
+    # Eventarcに即座に成功応答（204 No Content）を返し、リトライを防ぐ
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def _parse_batch_item(item: object) -> dict:
+    """
+    `/invoke/batch` の1件分の要素を解析・検証する。
+    構造化モードのCloudEvent（`specversion` を持つオブジェクト）の場合はその `data` を、
+    それ以外の場合は要素そのものをCloud Storageのイベントペイロードとして扱う。
 
-        # エージェントパイプラインを構築し、Runnerを初期化
-        root_agent = build_root_agent(db_client)
-        runner = Runner(
-            agent=root_agent, app_name=APP_NAME, session_service=session_service
+    Raises:
+        ValueError: 要素が不正な場合（pydanticのValidationErrorを含む）。
+    """
+    if not isinstance(item, dict):
+        raise ValueError("イベントはJSONオブジェクトである必要があります。")
+    payload = from_dict(item).data if "specversion" in item else item
+    if not payload:
+        raise ValueError("CloudEventのデータが空です。")
+    event_data = _to_event_data(StorageObjectData.model_validate(payload))
+    if event_data["bucket"] != settings.audio_upload_bucket:
+        raise ValueError(
+            f"予期しないソースバケットからのイベントです: {event_data['bucket']}"
         )
+    return event_data
 
-        # エージェントへの初期入力を作成
-        user_content = Content(parts=[Part(text=gcs_uri)])
 
-        # エージェントパイプラインを実行
-        final_response_content = "最終レスポンスイベントを受信しませんでした。"
-        async for event in runner.run_async(
-            user_id=user_id, session_id=job_id, new_message=user_content
-        ):
-            if event.is_final_response() and event.content and event.content.parts:
-                final_response_content = event.content.parts[0].text
+@app.post("/invoke/batch")
+async def invoke_pipeline_batch(request: Request):
+    """
+    複数のCloud Storageイベントをまとめて受け付けるエンドポイント。過去のアップロードの
+    再処理（バックフィル）など、大量のイベントを投入する場合に使用する。
+
+    リクエストボディは、構造化モードのCloudEventの配列（`application/cloudevents-batch+json`）
+    またはCloud Storageのイベントペイロードの配列。すべてのイベントを検証した上で
+    `job_id` で重複を除き、まとめてジョブスケジューラに投入する。
+    各イベントの結果は `accepted` / `duplicate` / `invalid` / `rejected` のいずれか。
+    `rejected` のイベントはキューに空きができてから再送する。
+    """
+    scheduler: JobScheduler = request.app.state.scheduler
+    _ensure_pipeline_available(request.app)
 
-        logger.info(
-            f"[{job_id}] ワークフローが完了しました。最終レスポンス: {final_response_content}"
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="リクエストボディをJSONとして解析できませんでした。",
         )
-    except AgentProcessingError as ape:
-        logger.error(
-            f"[{job_id}] エージェント処理エラー ({ape.agent_name}): {ape.user_message}",
-            exc_info=True,
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="リクエストボディはイベントの配列である必要があります。",
         )
-        await _update_job_status_on_error(db_client, job_id, ape.user_message)
-    except Exception as e:
-        logger.error(
-            f"[{job_id}] ワークフローで予期せぬエラーが発生しました: {e}", exc_info=True
+    if len(items) > settings.invoke_batch_max_events:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"1回に送信できるイベントは{settings.invoke_batch_max_events}件までです。",
         )
-        user_facing_error = AGENT_ERROR_MESSAGES["UnknownAgent"]
-        await _update_job_status_on_error(db_client, job_id, user_facing_error)
+
+    # すべてのイベントを検証し、重複を除いてから投入する
+    results: list[dict] = []
+    jobs: list[tuple] = []
+    submitted: list[dict] = []
+    seen_job_ids: set[str] = set()
+    for index, item in enumerate(items):
+        try:
+            event_data = _parse_batch_item(item)
+        except Exception as e:
+            results.append({"index": index, "status": "invalid", "detail": str(e)})
+            continue
+        job_id = event_data["job_id"]
+        result = {"index": index, "job_id": job_id}
+        if job_id in seen_job_ids:
+            result["status"] = "duplicate"
+        else:
+            seen_job_ids.add(job_id)
+            jobs.append((job_id, _run_job, (request.app, event_data)))
+            submitted.append(result)
+        results.append(result)
+
+    for result, reason in zip(submitted, scheduler.submit_many(jobs)):
+        if reason is None:
+            result["status"] = "accepted"
+        else:
+            result.update(status="rejected", detail=reason)
+
+    counts = {
+        key: sum(result["status"] == key for result in results)
+        for key in ("accepted", "duplicate", "invalid", "rejected")
+    }
+    logger.info(f"バッチで{len(items)}件のイベントを受信しました: {counts}")
+    return JSONResponse({**counts, "results": results})
 
 
 # ---------------------------------
-# Eventarcトリガーのエンドポイント
+# ジョブの再開
 # ---------------------------------
-@app.post("/invoke")
-async def invoke_pipeline(
-    request: Request,
-    background_tasks: BackgroundTasks,
-):
+@app.post("/jobs/{job_id}/resume", status_code=status.HTTP_202_ACCEPTED)
+async def resume_job(job_id: str, request: Request):
     """
-    Cloud StorageへのファイルアップロードをトリガーにEventarcから呼び出されるメインエンドポイント。
-    リクエストを即座にACKし、重い処理はバックグラウンドで実行する。
+    失敗または停止したジョブを再実行する。
+    セッションに有効な成果物が残っているステージはスキップし、足りないステージだけを実行する。
+    完了済みのジョブと、他のインスタンスが処理中のジョブは409を返す。
     """
-    db_client: firestore.AsyncClient = request.app.state.db_client
+    scheduler: JobScheduler = request.app.state.scheduler
+    _ensure_pipeline_available(request.app)
+    pipeline = await request.app.state.pipeline
 
-    session_service: BaseSessionService = get_session_service(db_client)
-    # CloudEventペイロードを解析・検証
-    # ヘルパー関数内で発生したHTTPExceptionはFastAPIによって自動的に伝播される
-    event_data = await _parse_cloudevent_payload(request)
+    try:
+        event_data = await pipeline.reopen(job_id)
+    except JobNotResumableError as e:
+        logger.warning(f"[{job_id}] ジョブを再開できません: {e.reason}")
+        raise HTTPException(
+            status_code=(
+                status.HTTP_404_NOT_FOUND
+                if e.reason == "not_found"
+                else status.HTTP_409_CONFLICT
+            ),
+            detail=f"ジョブを再開できません: {e.reason}",
+        )
+
+    # 受け付けられなかった場合も、ジョブは再開できる状態のまま残るため、
+    # 再度呼び出せばよい
+    try:
+        scheduler.submit(job_id, _run_job, request.app, event_data)
+    except JobRejectedError as e:
+        raise _rejected_http_exception(e)
+
+    logger.info(f"[{job_id}] ジョブの再開を受け付けました。")
+    return {"job_id": job_id, "status": "accepted"}
+
+
+# ---------------------------------
+# ウォームアップ
+# ---------------------------------
+@app.get("/warmup")
+async def warmup(request: Request):
+    """
+    各バックエンド（Speech, TTS, Imagen, Gemini, Firestore, GCS）への接続を確立する。
+    Cloud Runの起動プローブやmin-instancesのインスタンスから呼び出し、最初のジョブが
+    チャネルの確立や認証トークンの取得を待たないようにする。
+    ウォームアップは1インスタンスにつき1回だけ行い、2回目以降は前回の結果を返す。
+    """
+    report = await asyncio.shield(_start_warmup(request.app))
+    return JSONResponse(
+        {"uptime_seconds": round(get_startup_profile().elapsed(), 4), **report}
+    )
 
-    # バックグラウンドでパイプライン処理を実行するようにスケジュール
-    background_tasks.add_task(
-        run_pipeline_in_background, event_data, session_service, db_client
+
+# ---------------------------------
+# 監視用エンドポイント
+# ---------------------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """プロセス内のメトリクスをPrometheusのテキスト形式で返す。"""
+    return PlainTextResponse(
+        get_metrics_registry().render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
     )
 
-    # Eventarcに即座に成功応答（204 No Content）を返し、リトライを防ぐ
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@app.get("/startup-profile")
+async def startup_profile():
+    """
+    インスタンスの起動処理の内訳（フェーズごとの所要時間、遅延importしたモジュールごとの
+    import時間、リクエストの受付開始やパイプラインの準備完了の時刻）を返す。
+    パイプラインの構築に失敗した場合は、その時刻とエラー内容も返す。
+    """
+    return JSONResponse(get_startup_profile().snapshot())
@@ -6,12 +6,14 @@ class ExplanationOutput(BaseModel):
     ExplainerAgent内のLLMによって生成される構造化データ。
     このモデルは、LlmAgentの `output_schema` として使用され、
     JSON出力形式を強制する。
+    フィールドの定義順がモデルの出力順になる。ストリーミング時に最も時間のかかる
+    イラスト生成を早く開始できるよう、illustration_prompt を解説文の直後に置いている。
     """
 
     child_explanation: str = Field(description="子供向けの解説文")
+    illustration_prompt: str = Field(description="イラスト生成用の日本語プロンプト")
     child_explanation_ssml: str = Field(description="子供向けの解説文 (SSML形式)")
     parent_hint: str = Field(description="親向けの対話のヒント")
-    illustration_prompt: str = Field(description="イラスト生成用の日本語プロンプト")
     needs_clarification: bool = Field(description="追加の確認が必要かどうか")
     clarification_question: str | None = Field(
         default=None, description="追加の確認が必要な場合の質問文"
@@ -39,15 +41,33 @@ class NarrationResult(BaseModel):
     final_audio_gcs_path: str = Field(description="生成されたナレーション音声のGCSパス")
 
 
+class CachedAnswer(BaseModel):
+    """回答キャッシュに保存される、1つの質問に対する生成済みの成果物"""
+
+    question: str = Field(description="正規化した質問文（キャッシュのキー）")
+    transcribed_text: str = Field(description="キャッシュ登録時の書き起こしテキスト")
+    explanation: ExplanationOutput
+    image_gcs_path: str = Field(description="生成されたイラストのGCSパス")
+    final_audio_gcs_path: str = Field(description="生成されたナレーション音声のGCSパス")
+    embedding: list[float] | None = Field(
+        default=None, description="類似検索用の質問文の埋め込みベクトル"
+    )
+    created_at: float = Field(description="登録時刻（UNIX時間）")
+    expires_at: float = Field(description="有効期限（UNIX時間）")
+
+
 class FinalJobData(BaseModel):
-    """ジョブ完了時にFirestoreに書き込まれる最終的なデータ構造"""
+    """
+    ジョブ完了時にFirestoreに書き込まれる最終的なデータ構造。
+    イラストと音声のGCSパスと状態は、ここには含めない。
+    これらは各ステージが書き込む。回答キャッシュから復元した場合や、
+    再開時にスキップした場合は、そのコールバックが書き込む。
+    """
 
     transcribedText: str
     childExplanation: str
     parentHint: str
     illustrationPrompt: str
-    imageGcsPath: str
-    finalAudioGcsPath: str
 
 
 class CloudEventMetadata(BaseModel):
@@ -81,3 +101,27 @@ class AgentProcessingError(Exception):
         self.user_message = user_message
         self.original_exception = original_exception
         super().__init__(f"Agent '{agent_name}' failed: {user_message}")
+
+
+class JobNotResumableError(Exception):
+    """
+    ジョブを再開できない場合に送出される例外。
+    `reason` は "not_found"（ジョブが存在しない）、"completed"（完了済み）、
+    "in_flight"（処理中）、"missing_source"（入力の音声ファイルが特定できない）のいずれか。
+    """
+
+    def __init__(self, job_id: str, reason: str):
+        self.job_id = job_id
+        self.reason = reason
+        super().__init__(f"Job {job_id} cannot be resumed: {reason}")
+
+
+class StageDeadlineExceededError(TimeoutError):
+    """
+    ステージの期限（ジョブ全体の予算とステージごとの上限のうち早い方）を過ぎた場合に送出される例外。
+    """
+
+    def __init__(self, job_id: str, stage: str):
+        self.job_id = job_id
+        self.stage = stage
+        super().__init__(f"Stage '{stage}' of job {job_id} exceeded its deadline")
@@ -0,0 +1,390 @@
+"""
+エージェントパイプラインの構築と実行。
+
+ADK・Speech・Text-to-Speech・GenAIなどの重いSDKに依存するため、`main` からは
+リクエストの受付を開始した後にバックグラウンドでimportされる。
+"""
+
+import asyncio
+
+from agents.explainer_agent.agent import ExplainerAgent
+from agents.illustrator_agent.agent import IllustratorAgent
+from agents.narrator_agent.agent import NarratorAgent
+from agents.result_writer_agent.agent import ResultWriterAgent
+from agents.transcriber_agent.agent import TranscriberAgent
+from callback import (
+    after_agent_callback,
+    after_pipeline_callback,
+    before_agent_callback,
+    skip_completed_stage,
+    skip_stage_on_answer_cache_hit,
+)
+from dependencies import (
+    get_client_registry,
+    get_firestore_client,
+    get_session_service,
+)
+
+# ADK & GenAI SDK
+from google.adk.agents import BaseAgent, ParallelAgent, SequentialAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService
+from google.cloud import firestore
+from google.genai.types import Content, Part
+
+# モデル、サービス
+from models.agent_models import AgentProcessingError
+from services.artifact_backfill import get_artifact_backfiller
+from services.blocking_executor import get_blocking_executor
+from services.client_registry import ClientRegistry
+from services.deadline import get_job_deadlines
+from services.explanation_stream import get_explanation_streams
+from services.firestore_service import get_job_update_buffer, update_job_status
+from services.firestore_session_service import FirestoreSessionService
+from services.job_lease import (
+    JobLease,
+    get_job_lease_manager,
+    interrupt_job,
+    reopen_job,
+)
+from services.logging_service import get_logger
+from services.stage_checkpoint import get_stage_checkpoints
+from services.storage_service import get_storage_service
+from services.temp_generation_sweeper import TempGenerationSweeper
+from services.timing_service import get_job_timing_tracker
+from services.warmup import Warmer
+
+# 設定
+from config import AGENT_ERROR_MESSAGES, get_settings
+
+APP_NAME = "coco-ai"  # A logical name for the application/agent.
+
+logger = get_logger(__name__)
+settings = get_settings()
+
+
+async def _update_job_status_on_error(
+    db_client: firestore.AsyncClient, job_id: str, error_message: str
+):
+    """
+    Firestoreのジョブステータスをエラー状態に更新し、その際のDBエラーをログに記録するヘルパー関数。
+    """
+    try:
+        await update_job_status(
+            db_client, job_id, "error", {"errorMessage": error_message}
+        )
+    except Exception as db_error:
+        logger.error(
+            f"[{job_id}] Firestoreへのエラー状態の書き込みに失敗しました: {db_error}"
+        )
+
+
+# ---------------------------------
+# ルートエージェントの構築
+# ---------------------------------
+def _attach_stage_callbacks(agent: BaseAgent) -> None:
+    """
+    エージェント固有のコールバックを保持したまま、ステージ計測用の
+    before/after_agent_callback を追加する。
+    """
+    agent.before_agent_callback = [
+        before_agent_callback,
+        *agent.canonical_before_agent_callbacks,
+    ]
+    agent.after_agent_callback = [
+        *agent.canonical_after_agent_callbacks,
+        after_agent_callback,
+    ]
+
+
+def build_root_agent(
+    db_client: firestore.AsyncClient, clients: ClientRegistry
+) -> SequentialAgent:
+    """
+    エージェントの処理パイプラインを構築する。
+    アプリケーション起動時に一度だけ呼び出され、構築されたエージェントは全ジョブで共有される。
+
+    処理フロー:
+      音声文字起こし (Transcriber)
+      -> 子供向け解説生成 (Explainer)
+      -> [並列処理]
+         - イラスト生成 (Illustrator)
+         - 音声合成 (Narrator)
+      -> 最終結果の書き込み (ResultWriter)
+
+    IllustratorとNarratorは `ParallelAgent` を使って並列実行される。
+    回答キャッシュにヒットした場合は、ExplainerからNarratorまでをスキップする。
+    セッション状態に成果物が保存済みのステージ（再開したジョブ）もスキップする。
+    `explainer_streaming` が有効な場合は Explainer も同じ並列処理に含め、
+    IllustratorとNarratorはストリーミング中に必要なフィールドが確定した時点で処理を開始する。
+    最終的な失敗チェックは `ResultWriterAgent` で行われる。
+    """
+    transcriber = TranscriberAgent(speech_client=clients.speech)
+    explainer = ExplainerAgent(llm=clients.gemini)
+    illustrator = IllustratorAgent(genai_client=clients.genai)
+    narrator = NarratorAgent(tts_client=clients.tts)
+    result_writer = ResultWriterAgent(db_client=db_client)
+
+    # イラスト生成と音声合成を並列実行するブランチ
+    parallel_branch = ParallelAgent(
+        name="IllustrateAndNarrate",
+        sub_agents=[illustrator, narrator],
+        description="イラスト生成と音声合成を並列で実行します。",
+    )
+
+    stages: list[BaseAgent] = [
+        transcriber,
+        explainer,
+        illustrator,
+        narrator,
+        parallel_branch,
+        result_writer,
+    ]
+    if settings.explainer_streaming:
+        # 解説生成と並行して、確定したフィールドからイラスト生成と音声合成を開始する
+        explain_branch = ParallelAgent(
+            name="ExplainIllustrateAndNarrate",
+            sub_agents=[explainer, parallel_branch],
+            description="解説生成をストリーミングで行い、イラスト生成と音声合成を並行して実行します。",
+        )
+        stages.append(explain_branch)
+        generation_stages: list[BaseAgent] = [explain_branch]
+    else:
+        generation_stages = [explainer, parallel_branch]
+    pipeline = [transcriber, *generation_stages, result_writer]
+
+    # 回答キャッシュにヒットした場合は、解説生成から音声合成までのステージをスキップする
+    for agent in generation_stages:
+        agent.before_agent_callback = skip_stage_on_answer_cache_hit
+
+    # 再開したジョブでは、以前の実行で成果物を保存済みのステージをスキップする
+    for agent in (transcriber, explainer, illustrator, narrator):
+        agent.before_agent_callback = [
+            skip_completed_stage,
+            *agent.canonical_before_agent_callbacks,
+        ]
+
+    # 各ステージの処理時間を計測するためのコールバックを追加
+    for agent in stages:
+        _attach_stage_callbacks(agent)
+
+    # 全体の処理を定義するシーケンシャルなエージェント
+    root = SequentialAgent(
+        name="CocoAiPipeline",
+        sub_agents=pipeline,
+        before_agent_callback=before_agent_callback,
+        after_agent_callback=[after_agent_callback, after_pipeline_callback],
+    )
+    return root
+
+
+async def run_pipeline_in_background(
+    event_data: dict,
+    runner: Runner,
+    db_client: firestore.AsyncClient,
+    lease: JobLease | None = None,
+):
+    """
+    バックグラウンドで実行されるエージェントパイプラインのメインロジック。
+    共有のRunnerを使用し、ジョブ固有の状態はセッションにのみ保持する。
+    実行中に `lease` を他のインスタンスに引き継がれた場合は、中止する。
+    その場合、ジョブドキュメントには何も書き込まない。
+    """
+    session_service: BaseSessionService = runner.session_service
+    job_id = event_data["job_id"]
+    user_id = event_data["user_id"]
+    bucket = event_data["bucket"]
+    name = event_data["name"]
+
+    gcs_uri = f"gs://{bucket}/{name}"
+    logger.info(f"[{job_id}] CloudEventを受信しました: {gcs_uri}")
+    # ジョブ全体の予算を設定し、各ステージの期限はこの残り時間から割り当てる
+    get_job_deadlines().start_job(job_id, settings.job_timeout_seconds)
+    try:
+        # セッションの初期状態を設定
+        initial_data = {"state": {"job_id": job_id, "gcs_uri": gcs_uri}}
+        # 再開や引き継ぎでは、他のインスタンスがセッションを進めている可能性がある。
+        # そのため、キャッシュを使わずにFirestoreから読み直す
+        if isinstance(session_service, FirestoreSessionService):
+            session_service.invalidate_cached(job_id)
+        session = await session_service.get_session(
+            app_name=APP_NAME, user_id=user_id, session_id=job_id
+        )
+        if not session:
+            # 新しいセッションの場合、初期状態を注入してセッションを作成
+            session = await session_service.create_session(
+                app_name=APP_NAME,
+                user_id=user_id,
+                session_id=job_id,
+                **initial_data,
+            )
+
+        # エージェントへの初期入力を作成
+        user_content = Content(parts=[Part(text=gcs_uri)])
+
+        # 解説生成のストリーミングが有効な場合は、
+        # Geminiの出力を部分レスポンスで受け取り、
+        # 確定したフィールドを後続のエージェントに配信するストリームを開く
+        run_config = RunConfig()
+        if settings.explainer_streaming:
+            run_config.streaming_mode = StreamingMode.SSE
+            get_explanation_streams().open(job_id)
+
+        # エージェントパイプラインを実行する。
+        # ステージの期限で打ち切れない待ちも、ジョブの予算の超過で打ち切る
+        final_response_content = "最終レスポンスイベントを受信しませんでした。"
+        async with asyncio.timeout(settings.job_timeout_seconds):
+            async for event in runner.run_async(
+                user_id=user_id,
+                session_id=job_id,
+                new_message=user_content,
+                run_config=run_config,
+            ):
+                if event.is_final_response() and event.content and event.content.parts:
+                    final_response_content = event.content.parts[0].text
+
+        logger.info(
+            f"[{job_id}] ワークフローが完了しました。"
+            f"最終レスポンス: {final_response_content}"
+        )
+    except AgentProcessingError as ape:
+        logger.error(
+            f"[{job_id}] エージェント処理エラー ({ape.agent_name}): {ape.user_message}",
+            exc_info=True,
+        )
+        user_facing_error = ape.user_message
+        if isinstance(ape.original_exception, TimeoutError):
+            user_facing_error = AGENT_ERROR_MESSAGES["Timeout"]
+        await _update_job_status_on_error(db_client, job_id, user_facing_error)
+    except asyncio.CancelledError:
+        if lease is None or not lease.lost:
+            # シャットダウンで打ち切られた。受け付け済みのイベントは再配信されないため、
+            # /jobs/{job_id}/resume で再開できるようエラーステータスを書き込む
+            logger.warning(f"[{job_id}] ジョブの実行が中断されました。")
+            await _update_job_status_on_error(
+                db_client, job_id, AGENT_ERROR_MESSAGES["Interrupted"]
+            )
+        raise
+    except TimeoutError as e:
+        logger.error(
+            f"[{job_id}] ジョブの処理が期限までに完了しませんでした"
+            f"（予算: {settings.job_timeout_seconds}秒）: {e}"
+        )
+        await _update_job_status_on_error(
+            db_client, job_id, AGENT_ERROR_MESSAGES["Timeout"]
+        )
+    except Exception as e:
+        logger.error(
+            f"[{job_id}] ワークフローで予期せぬエラーが発生しました: {e}", exc_info=True
+        )
+        user_facing_error = AGENT_ERROR_MESSAGES["UnknownAgent"]
+        await _update_job_status_on_error(db_client, job_id, user_facing_error)
+    finally:
+        # 解説データのフィールドを待っている処理が残っていればキャンセルする
+        get_explanation_streams().close(job_id)
+        # 今回の実行で生成し直したステージの記録を破棄する
+        get_stage_checkpoints().discard(job_id)
+        # 完了しなかったジョブの計測データを破棄する（完了済みの場合は何もしない）
+        get_job_timing_tracker().discard(job_id)
+        get_job_deadlines().discard(job_id)
+        # 最終結果を書き込まずに終了したジョブでは、成果物の補完を取りやめる
+        get_artifact_backfiller().finalize(job_id, completed=False)
+        # 保留中のジョブドキュメントの更新を書き込み、ジョブごとのバッファを解放する
+        # （リースを引き継がれた場合は、引き継いだ側の更新を上書きしないよう破棄する）
+        await get_job_update_buffer().close(
+            job_id, discard=lease is not None and lease.lost
+        )
+
+
+class Pipeline:
+    """
+    全ジョブで共有するエージェントパイプラインと、その実行に必要な共有リソース。
+    インスタンスの起動後に一度だけ構築される。
+    """
+
+    def __init__(self):
+        self.db_client = get_firestore_client()
+        self.clients = get_client_registry()
+        # パイプラインはジョブ間で共有し、ジョブ固有の状態はセッションに保持する
+        self.runner = Runner(
+            agent=build_root_agent(self.db_client, self.clients),
+            app_name=APP_NAME,
+            session_service=get_session_service(self.db_client),
+        )
+        logger.info("Agent pipeline initialized.")
+
+        # Imagenの一時出力先に残った画像を定期的に削除する
+        self._sweeper = TempGenerationSweeper(
+            bucket_name=settings.generated_image_bucket,
+            interval_seconds=settings.temp_generation_sweep_interval_seconds,
+            max_age_seconds=settings.temp_generation_max_age_seconds,
+        )
+        self._sweeper.start()
+
+    async def run(self, event_data: dict) -> None:
+        """
+        1つのジョブのパイプラインを実行する。
+        リースが有効な場合は、終了済みのジョブや他で処理中のジョブの重複した配信を実行しない。
+        """
+        leases = get_job_lease_manager()
+        if leases is None:
+            await run_pipeline_in_background(event_data, self.runner, self.db_client)
+            return
+
+        async with leases.hold(event_data["job_id"]) as lease:
+            if lease.acquired:
+                await run_pipeline_in_background(
+                    event_data, self.runner, self.db_client, lease
+                )
+
+    async def reopen(self, job_id: str) -> dict:
+        """
+        失敗または停止したジョブを再実行できる状態に戻し、
+        `run` に渡すイベントデータを返す。
+        再実行では、セッションに有効な成果物が残っているステージをスキップする。
+
+        Raises:
+            JobNotResumableError: ジョブを再開できない場合。
+        """
+        data = await reopen_job(self.db_client, settings.firestore_collection, job_id)
+        return {
+            "job_id": job_id,
+            "user_id": data["userId"],
+            "bucket": settings.audio_upload_bucket,
+            "name": data["objectName"],
+        }
+
+    async def abandon(self, job_id: str) -> None:
+        """
+        受け付けたが実行を開始できなかったジョブを、再開できるエラー状態にする。
+        """
+        await interrupt_job(
+            self.db_client,
+            settings.firestore_collection,
+            job_id,
+            AGENT_ERROR_MESSAGES["Interrupted"],
+        )
+
+    async def warm_up(self) -> dict:
+        """各バックエンドへの接続を確立し、バックエンドごとの所要時間を返す。"""
+        warmer = Warmer(
+            self.clients,
+            self.db_client,
+            timeout_seconds=settings.warmup_timeout_seconds,
+            storage_connections=settings.warmup_storage_connections,
+        )
+        return await warmer.warm_up()
+
+    async def close(self) -> None:
+        """保留中の書き込みを済ませ、共有リソースを解放する。"""
+        await self._sweeper.stop()
+        # 完了したジョブの成果物の補完を、書き込みの保留分と合わせて済ませる
+        await get_artifact_backfiller().drain(timeout=settings.job_drain_timeout)
+        # まとめて書き込むために保留しているジョブドキュメントの更新を書き込む
+        await get_job_update_buffer().flush_all()
+        get_blocking_executor().shutdown(wait=False)
+        get_storage_service().shutdown()
+        # Firestoreクライアントを含む共有クライアントをすべて閉じる
+        self.clients.close()
+        logger.info("Shared clients closed.")
@@ -0,0 +1,451 @@
+import asyncio
+import hashlib
+import math
+import os
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from dependencies import get_client_registry, get_firestore_client
+from google.cloud import firestore
+from google.genai import types
+from models.agent_models import CachedAnswer, ExplanationOutput
+from pydantic import ValidationError
+from services.blocking_executor import run_blocking
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+from config import AnswerCacheBackend, get_settings
+
+logger = get_logger(__name__)
+
+Embedder = Callable[[str], Awaitable[list[float]]]
+
+_metrics = get_metrics_registry()
+_LOOKUPS = _metrics.counter(
+    "coco_answer_cache_lookups_total",
+    "回答キャッシュの検索回数（result: exact, similar, miss）",
+    ["result"],
+)
+_STORES = _metrics.counter(
+    "coco_answer_cache_stores_total", "回答キャッシュに登録した回答の数"
+)
+_EVICTIONS = _metrics.counter(
+    "coco_answer_cache_evictions_total",
+    "回答キャッシュから破棄されたエントリ数",
+    ["reason"],
+)
+
+
+def _hit_ratio() -> float:
+    hits = _LOOKUPS.value(result="exact") + _LOOKUPS.value(result="similar")
+    total = hits + _LOOKUPS.value(result="miss")
+    return hits / total if total else 0.0
+
+
+_metrics.gauge(
+    "coco_answer_cache_hit_ratio",
+    "プロセス起動以降の回答キャッシュのヒット率",
+    function=_hit_ratio,
+)
+
+
+def normalize_question(text: str) -> str:
+    """
+    書き起こしテキストをキャッシュのキーとして使える形に正規化する。
+    全角・半角の揺れをNFKCで揃え、空白・句読点・記号を取り除いて小文字にする。
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PZSC")
+
+
+def _entry_id(key: str) -> str:
+    """キーからファイル名やドキュメントIDに使えるIDを生成する。"""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _unit_vector(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+def _dot(a: list[float], b: list[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class BaseAnswerCacheStore(ABC):
+    """回答キャッシュの保存先の基底クラス。有効期限の判定は AnswerCache が行う。"""
+
+    @abstractmethod
+    async def get(self, key: str) -> CachedAnswer | None:
+        """キーに対応する回答を返す。存在しない場合はNone。"""
+
+    @abstractmethod
+    async def put(self, key: str, answer: CachedAnswer) -> None:
+        """回答を保存する。上限を超えた場合は古いエントリを破棄する。"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """回答を削除する。存在しない場合は何もしない。"""
+
+    @abstractmethod
+    async def list_embeddings(self) -> dict[str, list[float]]:
+        """類似検索用に、埋め込みベクトルを持つすべてのエントリのキーとベクトルを返す。"""
+
+
+class InMemoryAnswerCacheStore(BaseAnswerCacheStore):
+    """プロセス内に回答を保持する保存先。最も長く使われていないエントリから破棄する。"""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+
+    async def get(self, key: str) -> CachedAnswer | None:
+        answer = self._entries.get(key)
+        if answer is None:
+            return None
+        self._entries.move_to_end(key)
+        return answer.model_copy(deep=True)
+
+    async def put(self, key: str, answer: CachedAnswer) -> None:
+        self._entries[key] = answer.model_copy(deep=True)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            _EVICTIONS.inc(reason="capacity")
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def list_embeddings(self) -> dict[str, list[float]]:
+        return {
+            key: answer.embedding
+            for key, answer in self._entries.items()
+            if answer.embedding
+        }
+
+
+class DiskAnswerCacheStore(BaseAnswerCacheStore):
+    """
+    ローカルディスクに回答を1件1ファイルのJSONで保存する保存先。
+    インスタンスの再起動後も（ディスクが残る限り）キャッシュを再利用できる。
+    読み込みのたびにファイルの更新時刻を更新し、最も古いファイルから破棄する。
+    """
+
+    def __init__(self, directory: str, max_entries: int):
+        self._directory = Path(directory)
+        self._max_entries = max_entries
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self._directory / f"{_entry_id(key)}.json"
+
+    def _read(self, path: Path) -> CachedAnswer | None:
+        try:
+            answer = CachedAnswer.model_validate_json(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except ValidationError as e:
+            logger.warning(f"破損した回答キャッシュのファイルを削除します: {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+        return answer
+
+    def _write(self, key: str, answer: CachedAnswer) -> None:
+        path = self._path(key)
+        # 書き込み途中のファイルを読まないよう、一時ファイルに書いてから置き換える
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(answer.model_dump_json(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+        files = sorted(
+            self._directory.glob("*.json"), key=lambda file: file.stat().st_mtime
+        )
+        for file in files[: max(len(files) - self._max_entries, 0)]:
+            file.unlink(missing_ok=True)
+            _EVICTIONS.inc(reason="capacity")
+
+    def _list_embeddings(self) -> dict[str, list[float]]:
+        embeddings = {}
+        for file in self._directory.glob("*.json"):
+            try:
+                answer = CachedAnswer.model_validate_json(file.read_bytes())
+            except (FileNotFoundError, ValidationError):
+                continue
+            if answer.embedding:
+                embeddings[answer.question] = answer.embedding
+        return embeddings
+
+    async def get(self, key: str) -> CachedAnswer | None:
+        return await asyncio.to_thread(self._read, self._path(key))
+
+    async def put(self, key: str, answer: CachedAnswer) -> None:
+        await asyncio.to_thread(self._write, key, answer)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._path(key).unlink, missing_ok=True)
+
+    async def list_embeddings(self) -> dict[str, list[float]]:
+        return await asyncio.to_thread(self._list_embeddings)
+
+
+class FirestoreAnswerCacheStore(BaseAnswerCacheStore):
+    """
+    Firestoreのコレクションに回答を保存する保存先。すべてのインスタンスでキャッシュを共有する。
+    読み込みのたびに書き込みが発生しないよう、破棄は登録が古い順に行う。
+    """
+
+    def __init__(
+        self, db_client: firestore.AsyncClient, collection_name: str, max_entries: int
+    ):
+        self._db = db_client
+        self._collection = db_client.collection(collection_name)
+        self._max_entries = max_entries
+
+    async def get(self, key: str) -> CachedAnswer | None:
+        snapshot = await self._collection.document(_entry_id(key)).get()
+        if not snapshot.exists:
+            return None
+        try:
+            return CachedAnswer.model_validate(snapshot.to_dict())
+        except ValidationError as e:
+            logger.warning(f"不正な回答キャッシュのドキュメントを無視します: {e}")
+            return None
+
+    async def put(self, key: str, answer: CachedAnswer) -> None:
+        await self._collection.document(_entry_id(key)).set(answer.model_dump())
+
+        # 件数の集計は1回の読み取りで済むため、登録のたびに上限を確認する
+        results = await self._collection.count(alias="count").get()
+        excess = int(results[0][0].value) - self._max_entries
+        if excess <= 0:
+            return
+        oldest = await self._collection.order_by("created_at").limit(excess).get()
+        batch = self._db.batch()
+        for snapshot in oldest:
+            batch.delete(snapshot.reference)
+        await batch.commit()
+        _EVICTIONS.inc(len(oldest), reason="capacity")
+
+    async def delete(self, key: str) -> None:
+        await self._collection.document(_entry_id(key)).delete()
+
+    async def list_embeddings(self) -> dict[str, list[float]]:
+        embeddings = {}
+        async for snapshot in self._collection.stream():
+            data = snapshot.to_dict() or {}
+            if data.get("embedding") and data.get("question"):
+                embeddings[data["question"]] = data["embedding"]
+        return embeddings
+
+
+class AnswerCache:
+    """
+    書き起こしテキストをキーに、生成済みの解説・イラスト・ナレーションを再利用する回答キャッシュ。
+
+    正規化した質問文の完全一致で検索し、見つからない場合は（`embedder` と
+    `similarity_threshold` が指定されていれば）埋め込みベクトルのコサイン類似度で
+    最も近い質問を検索する。類似検索用のベクトルは、初回の検索時に保存先から読み込み、
+    以降はインスタンス内に保持する。
+    """
+
+    def __init__(
+        self,
+        store: BaseAnswerCacheStore,
+        ttl_seconds: float,
+        similarity_threshold: float = 0.0,
+        embedder: Embedder | None = None,
+    ):
+        self._store = store
+        self._ttl = ttl_seconds
+        self._threshold = similarity_threshold
+        self._embedder = embedder if similarity_threshold > 0 else None
+        self._index: dict[str, list[float]] | None = None
+        self._index_lock = asyncio.Lock()
+        # 検索時に計算した埋め込みを、登録時に再計算せずに済むよう保持する
+        self._recent_embeddings: OrderedDict[str, list[float]] = OrderedDict()
+
+    async def lookup(self, transcribed_text: str) -> CachedAnswer | None:
+        """
+        書き起こしテキストに対応するキャッシュ済みの回答を返す。
+
+        Args:
+            transcribed_text: 書き起こされた質問文。
+
+        Returns:
+            有効期限内のキャッシュ済みの回答。見つからない場合はNone。
+        """
+        key = normalize_question(transcribed_text)
+        if not key:
+            return None
+
+        answer = await self._get_valid(key)
+        if answer is not None:
+            _LOOKUPS.inc(result="exact")
+            return answer
+
+        if self._embedder is not None:
+            answer = await self._lookup_similar(key, transcribed_text)
+            if answer is not None:
+                _LOOKUPS.inc(result="similar")
+                return answer
+
+        _LOOKUPS.inc(result="miss")
+        return None
+
+    async def store(
+        self,
+        transcribed_text: str,
+        explanation: ExplanationOutput,
+        image_gcs_path: str,
+        final_audio_gcs_path: str,
+    ) -> None:
+        """生成済みの成果物を、書き起こしテキストをキーにキャッシュに登録する。"""
+        key = normalize_question(transcribed_text)
+        if not key:
+            return
+
+        embedding = None
+        if self._embedder is not None:
+            embedding = self._recent_embeddings.pop(key, None)
+            if embedding is None:
+                embedding = await self._embed(transcribed_text)
+
+        now = time.time()
+        answer = CachedAnswer(
+            question=key,
+            transcribed_text=transcribed_text,
+            explanation=explanation,
+            image_gcs_path=image_gcs_path,
+            final_audio_gcs_path=final_audio_gcs_path,
+            embedding=embedding,
+            created_at=now,
+            expires_at=now + self._ttl,
+        )
+        await self._store.put(key, answer)
+        _STORES.inc()
+        if embedding and self._index is not None:
+            self._index[key] = _unit_vector(embedding)
+
+    async def invalidate(self, question: str, reason: str = "invalid") -> None:
+        """
+        キャッシュ済みの回答を破棄する。
+        成果物のファイルが削除されているなど、再利用できないことが分かった場合に呼び出す。
+        """
+        await self._store.delete(question)
+        if self._index is not None:
+            self._index.pop(question, None)
+        _EVICTIONS.inc(reason=reason)
+
+    async def _get_valid(self, key: str) -> CachedAnswer | None:
+        answer = await self._store.get(key)
+        if answer is not None and answer.expires_at <= time.time():
+            await self.invalidate(key, reason="expired")
+            return None
+        return answer
+
+    async def _lookup_similar(self, key: str, text: str) -> CachedAnswer | None:
+        embedding = await self._embed(text)
+        if not embedding:
+            return None
+        self._recent_embeddings[key] = embedding
+        while len(self._recent_embeddings) > 256:
+            self._recent_embeddings.popitem(last=False)
+
+        index = await self._load_index()
+        query = _unit_vector(embedding)
+        # ベクトル数が多い場合に備え、内積の計算はイベントループ外で行う
+        best = await asyncio.to_thread(
+            lambda: max(
+                ((_dot(query, vector), question) for question, vector in index.items()),
+                default=None,
+            )
+        )
+        if best is None or best[0] < self._threshold:
+            return None
+
+        score, question = best
+        answer = await self._get_valid(question)
+        if answer is None:
+            # 他のインスタンスで破棄されたエントリはインデックスからも取り除く
+            index.pop(question, None)
+            return None
+        logger.info(
+            f"類似する質問の回答を再利用します: '{text}' -> "
+            f"'{answer.transcribed_text}' (類似度 {score:.3f})"
+        )
+        return answer
+
+    async def _load_index(self) -> dict[str, list[float]]:
+        async with self._index_lock:
+            if self._index is None:
+                embeddings = await self._store.list_embeddings()
+                self._index = {
+                    question: _unit_vector(vector)
+                    for question, vector in embeddings.items()
+                }
+        return self._index
+
+    async def _embed(self, text: str) -> list[float] | None:
+        assert self._embedder is not None
+        try:
+            return await self._embedder(text)
+        except Exception as e:
+            # 類似検索は補助的な機能のため、失敗しても完全一致の結果のみで処理を続ける
+            logger.warning(f"質問文の埋め込みの生成に失敗しました: {e}")
+            return None
+
+
+def _create_genai_embedder(model: str) -> Embedder:
+    """共有のGenAIクライアントで質問文の埋め込みを生成する関数を返す。"""
+
+    async def embed(text: str) -> list[float]:
+        client = get_client_registry().genai
+        response = await run_blocking(
+            client.models.embed_content,
+            model=model,
+            contents=text,
+            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY"),
+        )
+        return list(response.embeddings[0].values)
+
+    return embed
+
+
+@lru_cache
+def get_answer_cache() -> AnswerCache | None:
+    """
+    設定に応じた回答キャッシュのシングルトンインスタンスを取得する。
+    回答キャッシュが無効（ANSWER_CACHE_BACKEND=none）の場合はNoneを返す。
+    """
+    settings = get_settings()
+    backend = settings.answer_cache_backend
+    if backend == AnswerCacheBackend.none:
+        return None
+
+    store: BaseAnswerCacheStore
+    if backend == AnswerCacheBackend.memory:
+        store = InMemoryAnswerCacheStore(settings.answer_cache_max_entries)
+    elif backend == AnswerCacheBackend.disk:
+        store = DiskAnswerCacheStore(
+            settings.answer_cache_dir, settings.answer_cache_max_entries
+        )
+    else:
+        store = FirestoreAnswerCacheStore(
+            get_firestore_client(),
+            settings.answer_cache_collection,
+            settings.answer_cache_max_entries,
+        )
+    logger.info(f"回答キャッシュを有効化しました（保存先: {backend.value}）。")
+
+    return AnswerCache(
+        store=store,
+        ttl_seconds=settings.answer_cache_ttl_seconds,
+        similarity_threshold=settings.answer_cache_similarity_threshold,
+        embedder=_create_genai_embedder(settings.answer_cache_embedding_model),
+    )
@@ -0,0 +1,255 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Awaitable, Callable
+
+from services.artifact_publisher import ArtifactStatus, publish_artifact
+from services.firestore_service import get_job_update_buffer
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+from config import get_settings
+
+logger = get_logger(__name__)
+
+_metrics = get_metrics_registry()
+_JOBS_DEGRADED = _metrics.counter(
+    "coco_jobs_degraded_total",
+    "成果物が期限までに揃わなかったため、その成果物なしで完了させたジョブの数",
+    ("artifact", "reason"),
+)
+_BACKFILLS = _metrics.counter(
+    "coco_artifact_backfills_total",
+    "ジョブの完了後に成果物を補完した結果"
+    "（completed: 補完した, failed: 生成に失敗した, abandoned: "
+    "ジョブの失敗やシャットダウンで取りやめた）",
+    ("artifact", "result"),
+)
+_BACKFILL_SECONDS = _metrics.histogram(
+    "coco_artifact_backfill_seconds",
+    "成果物なしでステージを終えてから、ジョブドキュメントに成果物を補完するまでの秒数",
+    ("artifact",),
+)
+
+
+@dataclass
+class _DegradedJob:
+    # ジョブが終了したことを知らせるイベント
+    finalized: asyncio.Event = field(default_factory=asyncio.Event)
+    completed: bool = False
+    # 補完中の成果物
+    pending: set[str] = field(default_factory=set)
+
+
+class ArtifactBackfiller:
+    """
+    イラストや音声が期限までに揃わないジョブを、揃った成果物で先に完了させ、
+    残りの成果物をバックグラウンドで補完する縮退運転の管理。
+
+    ステージの待ち時間を過ぎた生成は打ち切らずにバックグラウンドで続け、
+    失敗した生成は1回だけ生成し直す。
+    補完中の成果物は、ジョブドキュメントの状態を `backfilling` にする。
+    同時に `pendingArtifacts` に入れ、揃った時点でGCSパスを書き込んで外す。
+    ジョブが完了せずに終了した場合は、補完を取りやめる。
+    シャットダウンで打ち切った補完は、補完中のまま残らないよう `failed` にする。
+    """
+
+    def __init__(
+        self,
+        backfill_timeout_seconds: float,
+        placeholders: dict[str, str] | None = None,
+    ):
+        self._timeout = backfill_timeout_seconds
+        # 補完するまでの間、代わりにジョブドキュメントに書き込むGCSパス
+        self._placeholders = placeholders or {}
+        self._jobs: dict[str, _DegradedJob] = {}
+        self._background: set[asyncio.Task] = set()
+
+    async def wait_or_backfill(
+        self,
+        job_id: str,
+        artifact: str,
+        produce: Callable[[], Awaitable[str]],
+        wait_seconds: float,
+    ) -> str | None:
+        """
+        成果物を生成し、`wait_seconds` 以内に生成できた場合はそのGCSパスを返す。
+        間に合わなかった場合や失敗した場合はNoneを返し、生成をバックグラウンドで続けて補完する。
+        `produce` は呼び出しのたびに新しいコルーチンを返す関数を渡す。
+        """
+        task = asyncio.ensure_future(produce())
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(wait_seconds, 0.0))
+        except asyncio.CancelledError:
+            # ジョブ自体が中断された場合は、補完せずに生成も止める
+            task.cancel()
+            raise
+        except TimeoutError:
+            reason = "deadline"
+            logger.warning(
+                f"[{job_id}] {artifact} が{wait_seconds:.1f}秒以内に揃わないため、"
+                "この成果物なしでジョブを完了させ、後から補完します。"
+            )
+        except Exception as e:
+            reason = "error"
+            task = None
+            logger.warning(
+                f"[{job_id}] {artifact} の生成に失敗したため、"
+                "この成果物なしでジョブを完了させ、"
+                f"後から補完します: {e}"
+            )
+
+        _JOBS_DEGRADED.inc(artifact=artifact, reason=reason)
+        job = self._jobs.setdefault(job_id, _DegradedJob())
+        job.pending.add(artifact)
+        await publish_artifact(
+            job_id,
+            artifact,
+            ArtifactStatus.backfilling,
+            gcs_path=self._placeholders.get(artifact) or None,
+            extra={"pendingArtifacts": sorted(job.pending)},
+        )
+        backfill = asyncio.create_task(
+            self._backfill(job_id, job, artifact, task, produce),
+            name=f"backfill-{artifact}-{job_id}",
+        )
+        self._background.add(backfill)
+        backfill.add_done_callback(self._background.discard)
+        return None
+
+    def pending(self, job_id: str) -> list[str]:
+        """ジョブの補完中の成果物を返す。"""
+        job = self._jobs.get(job_id)
+        return sorted(job.pending) if job else []
+
+    def finalize(self, job_id: str, completed: bool) -> None:
+        """
+        ジョブの最終結果の書き込みが済んだ（`completed=True`）、またはジョブが完了せずに
+        終了したことを知らせる。完了しなかったジョブの補完は、生成後に書き込まずに取りやめる。
+        最初の呼び出しだけが有効で、補完中の成果物がないジョブでは何もしない。
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.finalized.is_set():
+            return
+        job.completed = completed
+        job.finalized.set()
+        if not job.pending:
+            # 補完がすべて先に終わっていた（失敗した）場合
+            del self._jobs[job_id]
+
+    async def _backfill(
+        self,
+        job_id: str,
+        job: _DegradedJob,
+        artifact: str,
+        in_flight: asyncio.Future | None,
+        produce: Callable[[], Awaitable[str]],
+    ) -> None:
+        started_at = time.perf_counter()
+        result = "failed"
+        try:
+            async with asyncio.timeout(self._timeout):
+                gcs_path = None
+                if in_flight is not None:
+                    try:
+                        gcs_path = await in_flight
+                    except Exception as e:
+                        logger.warning(
+                            f"[{job_id}] {artifact} の生成に失敗したため、"
+                            f"生成し直します: {e}"
+                        )
+                if gcs_path is None:
+                    gcs_path = await produce()
+
+            if self._abandoned(job_id, job, artifact):
+                result = "abandoned"
+                return
+
+            # ジョブの完了を待たずに、揃った時点でジョブドキュメントに書き込む
+            job.pending.discard(artifact)
+            await publish_artifact(
+                job_id,
+                artifact,
+                ArtifactStatus.ready,
+                gcs_path=gcs_path,
+                extra={"pendingArtifacts": sorted(job.pending)},
+            )
+            result = "completed"
+            _BACKFILL_SECONDS.observe(
+                time.perf_counter() - started_at, artifact=artifact
+            )
+            logger.info(f"[{job_id}] {artifact} を補完しました: {gcs_path}")
+        except asyncio.CancelledError:
+            result = "abandoned"
+            logger.warning(
+                f"[{job_id}] シャットダウンのため、{artifact} の補完を打ち切ります。"
+            )
+            # 完了済みのジョブは再開できず、このままでは補完中の状態のまま残るため、
+            # 補完できなかったことを書き込んでおく
+            if not self._abandoned(job_id, job, artifact):
+                await self._publish_failed(job_id, job, artifact)
+            raise
+        except Exception as e:
+            logger.error(
+                f"[{job_id}] {artifact} の補完に失敗しました: {e}", exc_info=True
+            )
+            if self._abandoned(job_id, job, artifact):
+                result = "abandoned"
+            else:
+                await self._publish_failed(job_id, job, artifact)
+        finally:
+            if in_flight is not None and not in_flight.done():
+                in_flight.cancel()
+            _BACKFILLS.inc(artifact=artifact, result=result)
+            job.pending.discard(artifact)
+            if (
+                not job.pending
+                and job.finalized.is_set()
+                and self._jobs.get(job_id) is job
+            ):
+                del self._jobs[job_id]
+                # 実行の終了時に解放済みのジョブごとのバッファを、
+                # 補完の書き込み後にも解放する
+                await get_job_update_buffer().close(job_id)
+
+    @staticmethod
+    async def _publish_failed(job_id: str, job: _DegradedJob, artifact: str) -> None:
+        job.pending.discard(artifact)
+        await publish_artifact(
+            job_id,
+            artifact,
+            ArtifactStatus.failed,
+            extra={"pendingArtifacts": sorted(job.pending)},
+        )
+
+    @staticmethod
+    def _abandoned(job_id: str, job: _DegradedJob, artifact: str) -> bool:
+        if job.finalized.is_set() and not job.completed:
+            logger.info(
+                f"[{job_id}] ジョブが完了しなかったため、"
+                f"{artifact} の補完を取りやめます。"
+            )
+            return True
+        return False
+
+    async def drain(self, timeout: float) -> None:
+        """シャットダウン時に、実行中の補完の完了を `timeout` 秒まで待つ。"""
+        if not self._background:
+            return
+        logger.info("ArtifactBackfiller draining (%d backfills)", len(self._background))
+        _, pending = await asyncio.wait(self._background, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        # 打ち切った補完の後始末（メトリクスとバッファの解放）を済ませる
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+@lru_cache
+def get_artifact_backfiller() -> ArtifactBackfiller:
+    """設定に基づいて共有のArtifactBackfillerを生成・取得する。"""
+    settings = get_settings()
+    return ArtifactBackfiller(
+        backfill_timeout_seconds=settings.backfill_timeout_seconds,
+        placeholders={"illustration": settings.placeholder_image_gcs_path},
+    )
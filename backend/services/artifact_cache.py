@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Coroutine
+
+from dependencies import get_firestore_client
+from google.cloud import firestore
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+from services.storage_service import delete_blob
+
+from config import get_settings
+
+logger = get_logger(__name__)
+
+_metrics = get_metrics_registry()
+_LOOKUPS = _metrics.counter(
+    "coco_artifact_cache_lookups_total",
+    "成果物キャッシュの検索回数（result: memory_hit, persistent_hit, miss）",
+    ["cache", "result"],
+)
+_INVALIDATIONS = _metrics.counter(
+    "coco_artifact_cache_invalidations_total",
+    "参照先のファイルが見つからないなどの理由で破棄された成果物キャッシュのエントリ数",
+    ["cache"],
+)
+_EVICTIONS = _metrics.counter(
+    "coco_artifact_cache_evictions_total",
+    "ストレージの予算を超えたため破棄された成果物キャッシュのエントリ数",
+    ["cache"],
+)
+_SAVED_SECONDS = _metrics.counter(
+    "coco_artifact_cache_saved_seconds_total",
+    "キャッシュにヒットしたことで省略できた生成処理（Imagen, TTSなど）の待ち時間の合計",
+    ["cache"],
+)
+
+# ストレージの予算を超えた場合に、1回のクエリで破棄候補として読み込むエントリ数
+_EVICTION_BATCH_SIZE = 20
+
+
+def content_key(*parts: str | bytes) -> str:
+    """
+    成果物の内容を決定する入力（SSMLや音声設定など）から、コンテンツアドレスのキーを生成する。
+    各要素の長さを含めてハッシュするため、要素の区切りが異なる入力が衝突することはない。
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode() if isinstance(part, str) else part
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedArtifact:
+    """キャッシュされた成果物の1つのバリエーション。"""
+
+    gcs_uri: str
+    # 生成にかかった時間。ヒット時に省略できた時間としてメトリクスに記録する
+    generation_seconds: float = 0.0
+
+
+class ArtifactCache:
+    """
+    同じ入力から生成されるGCS上の成果物（ナレーション音声やイラスト）を再利用するための、
+    コンテンツアドレスのキャッシュ。
+
+    キーは `content_key` で生成した入力のハッシュで、1つのキーに最大 `variety` 個の
+    成果物（バリエーション）を保持する。`variety` 個が揃うまでは検索をミスとして扱い、
+    揃った後は直近 `variety` 個の中から無作為に1つを返す。
+    プロセス内のLRUインデックスを先に参照し、見つからない場合はFirestoreの
+    永続インデックス（`{collection}/{name}/entries`）を参照する。永続インデックスは
+    すべてのインスタンスで共有される。
+
+    `storage_budget_bytes` を指定した場合は、登録されたファイルの合計サイズが予算を
+    超えた時点で古いエントリから破棄し、参照先のファイルも削除する。そのため、
+    予算を指定するキャッシュには、キャッシュ専用のパスにコピーしたファイルを登録すること。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        db_client: firestore.AsyncClient,
+        collection_name: str,
+        max_memory_entries: int,
+        variety: int = 1,
+        storage_budget_bytes: int = 0,
+    ):
+        self.name = name
+        self._db = db_client
+        self._stats_ref = db_client.collection(collection_name).document(name)
+        self._entries = self._stats_ref.collection("entries")
+        self._max_memory_entries = max_memory_entries
+        self._variety = max(variety, 1)
+        self._budget = storage_budget_bytes
+        self._memory: OrderedDict[str, list[CachedArtifact]] = OrderedDict()
+        self._background: set[asyncio.Task] = set()
+
+    async def lookup(self, key: str) -> CachedArtifact | None:
+        """
+        キーに対応する成果物を返す。
+
+        Args:
+            key: `content_key` で生成したキー。
+
+        Returns:
+            生成済みの成果物。見つからない場合や、バリエーションが揃っていない場合はNone。
+        """
+        variants = self._memory.get(key)
+        if variants is not None and len(variants) >= self._variety:
+            self._memory.move_to_end(key)
+            return self._hit(variants, "memory_hit")
+
+        snapshots = (
+            await self._entries.where("key", "==", key)
+            .order_by("createdAt", direction=firestore.Query.DESCENDING)
+            .limit(self._variety)
+            .get()
+        )
+        variants = [
+            CachedArtifact(
+                gcs_uri=snapshot.get("gcsUri"),
+                generation_seconds=snapshot.get("generationSeconds") or 0.0,
+            )
+            for snapshot in snapshots
+            if snapshot.get("gcsUri")
+        ]
+        if variants:
+            self._remember(key, variants)
+        if len(variants) < self._variety:
+            _LOOKUPS.inc(cache=self.name, result="miss")
+            return None
+        return self._hit(variants, "persistent_hit")
+
+    async def register(
+        self,
+        key: str,
+        gcs_uri: str,
+        size_bytes: int = 0,
+        generation_seconds: float = 0.0,
+    ) -> None:
+        """
+        生成したファイルを、インメモリと永続の両方のインデックスに登録する。
+        ストレージの予算を超えた場合は、古いエントリを破棄する。
+        """
+        artifact = CachedArtifact(
+            gcs_uri=gcs_uri, generation_seconds=generation_seconds
+        )
+        self._remember(key, [artifact, *self._memory.get(key, [])])
+        await self._entries.document(content_key(key, gcs_uri)).set(
+            {
+                "key": key,
+                "gcsUri": gcs_uri,
+                "sizeBytes": size_bytes,
+                "generationSeconds": generation_seconds,
+                "createdAt": time.time(),
+            }
+        )
+        if self._budget <= 0:
+            return
+
+        await self._stats_ref.set(
+            {"totalBytes": firestore.Increment(size_bytes)}, merge=True
+        )
+        snapshot = await self._stats_ref.get()
+        total_bytes = snapshot.get("totalBytes") or 0
+        if total_bytes > self._budget:
+            await self._evict(total_bytes - self._budget)
+
+    async def invalidate(self, key: str, gcs_uri: str) -> None:
+        """参照先のファイルが削除されているなど、再利用できないエントリを破棄する。"""
+        variants = [v for v in self._memory.pop(key, []) if v.gcs_uri != gcs_uri]
+        if variants:
+            self._remember(key, variants)
+        await self._entries.document(content_key(key, gcs_uri)).delete()
+        _INVALIDATIONS.inc(cache=self.name)
+
+    def run_in_background(self, coro: Coroutine) -> None:
+        """
+        キャッシュへの登録など、ジョブの結果に影響しない処理をバックグラウンドで実行する。
+        処理中の例外はログに記録するのみで、送出しない。
+        """
+        task = asyncio.create_task(self._log_errors(coro))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _log_errors(self, coro: Coroutine) -> None:
+        try:
+            await coro
+        except Exception as e:
+            logger.warning(f"成果物キャッシュ '{self.name}' の更新に失敗しました: {e}")
+
+    def _hit(self, variants: list[CachedArtifact], result: str) -> CachedArtifact:
+        artifact = random.choice(variants[: self._variety])
+        _LOOKUPS.inc(cache=self.name, result=result)
+        _SAVED_SECONDS.inc(artifact.generation_seconds, cache=self.name)
+        return artifact
+
+    def _remember(self, key: str, variants: list[CachedArtifact]) -> None:
+        self._memory[key] = variants[: self._variety]
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_memory_entries:
+            self._memory.popitem(last=False)
+
+    async def _evict(self, excess_bytes: int) -> None:
+        """登録の古いエントリから、合計 `excess_bytes` 以上になるまで破棄する。"""
+        snapshots = (
+            await self._entries.order_by("createdAt").limit(_EVICTION_BATCH_SIZE).get()
+        )
+        freed = 0
+        batch = self._db.batch()
+        for snapshot in snapshots:
+            if freed >= excess_bytes:
+                break
+            data = snapshot.to_dict() or {}
+            try:
+                await delete_blob(data["gcsUri"])
+            except Exception as e:
+                logger.warning(
+                    f"成果物キャッシュ '{self.name}' のファイルの削除に失敗しました: "
+                    f"{e}"
+                )
+            batch.delete(snapshot.reference)
+            self._memory.pop(data.get("key", ""), None)
+            freed += data.get("sizeBytes") or 0
+            _EVICTIONS.inc(cache=self.name)
+        batch.set(
+            self._stats_ref, {"totalBytes": firestore.Increment(-freed)}, merge=True
+        )
+        await batch.commit()
+        logger.info(
+            f"成果物キャッシュ '{self.name}' から {freed} "
+            "バイト分のエントリを破棄しました。"
+        )
+
+
+@lru_cache
+def get_artifact_cache(
+    name: str, variety: int = 1, storage_budget_bytes: int = 0
+) -> ArtifactCache:
+    """成果物の種類（`name`）ごとに、プロセス全体で共有するArtifactCacheを取得する。"""
+    settings = get_settings()
+    return ArtifactCache(
+        name=name,
+        db_client=get_firestore_client(),
+        collection_name=settings.artifact_cache_collection,
+        max_memory_entries=settings.artifact_cache_memory_entries,
+        variety=variety,
+        storage_budget_bytes=storage_budget_bytes,
+    )
@@ -0,0 +1,76 @@
+from enum import Enum
+
+from dependencies import get_firestore_client
+from services.firestore_service import update_job_data
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+logger = get_logger(__name__)
+
+_metrics = get_metrics_registry()
+_ARTIFACTS_PUBLISHED = _metrics.counter(
+    "coco_artifacts_published_total",
+    "イラストや音声の状態を、ジョブの完了を待たずにジョブドキュメントに書き込んだ回数",
+    ("artifact", "status"),
+)
+
+
+class ArtifactStatus(str, Enum):
+    """ジョブドキュメントに書き込む、成果物ごとの状態"""
+
+    generating = "generating"  # 生成中
+    ready = "ready"  # 生成済み（GCSパスを書き込み済み）
+    backfilling = "backfilling"  # 期限までに揃わなかったため、ジョブの完了後に補完する
+    failed = "failed"  # 補完できなかった
+
+
+# 成果物の種類と、ジョブドキュメントのGCSパスと状態のフィールド
+ARTIFACT_FIELDS = {
+    "illustration": ("imageGcsPath", "illustrationStatus"),
+    "narration": ("finalAudioGcsPath", "narrationStatus"),
+}
+
+
+async def publish_artifact(
+    job_id: str,
+    artifact: str,
+    status: ArtifactStatus,
+    gcs_path: str | None = None,
+    extra: dict | None = None,
+    immediate: bool | None = None,
+) -> None:
+    """
+    成果物の状態（と生成済みの場合はGCSパス）を、ジョブの完了を待たずにジョブドキュメントに書き込む。
+    フロントエンドは、揃った成果物から先に表示・再生できる。
+    既定では、生成中の状態は他の更新とまとめて、それ以外の状態はすぐに書き込む。
+    書き込みに失敗した場合はログに記録するのみで、例外は送出しない。
+
+    Args:
+        job_id: ジョブID。
+        artifact: 成果物の種類（"illustration" または "narration"）。
+        status: 成果物の状態。
+        gcs_path: 成果物のGCSパス（任意）。
+        extra: 同時に書き込む追加のフィールド（任意）。
+        immediate: 即座に書き込むかどうか（任意）。Falseの場合は後続の更新とまとめる。
+    """
+    path_field, status_field = ARTIFACT_FIELDS[artifact]
+    data = {status_field: status.value}
+    if gcs_path is not None:
+        data[path_field] = gcs_path
+    if extra:
+        data.update(extra)
+    try:
+        await update_job_data(
+            db=get_firestore_client(),
+            job_id=job_id,
+            data=data,
+            immediate=(
+                status != ArtifactStatus.generating if immediate is None else immediate
+            ),
+        )
+        _ARTIFACTS_PUBLISHED.inc(artifact=artifact, status=status.value)
+    except Exception as e:
+        logger.warning(
+            f"[{job_id}] {artifact} の状態（{status.value}）"
+            f"の書き込みに失敗しました: {e}"
+        )
@@ -0,0 +1,109 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, TypeVar
+
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+from config import get_settings
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class BlockingCallExecutor:
+    """
+    同期APIクライアント（Speech-to-Text, Text-to-Speech, Imagen）の呼び出しを
+    イベントループの外で実行するための、上限付きスレッドプール。
+
+    asyncioのデフォルトexecutorとは独立しているため、外部APIの待ち時間が
+    他のジョブや `/invoke` のACKを巻き込んで停止させることはない。
+    実行待ちの呼び出し数（キューの深さ）と実行中の呼び出し数を `stats()` で報告する。
+    """
+
+    def __init__(self, max_workers: int, name: str = "blocking-api"):
+        self._name = name
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        # ワーカースレッドとイベントループの両方から更新されるためロックで保護する
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._active = 0
+
+    async def run(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+        """
+        同期関数をスレッドプールで実行し、その結果を返す。
+        呼び出し元のcontextvarsはワーカースレッドに引き継がれる。
+        """
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+
+        with self._lock:
+            saturated = self._active >= self._max_workers
+            queue_depth = self._submitted - self._active
+            self._submitted += 1
+        if saturated:
+            logger.warning(
+                "%s executor is saturated (queue_depth=%d, max_workers=%d)",
+                self._name,
+                queue_depth + 1,
+                self._max_workers,
+            )
+
+        def _tracked_call() -> T:
+            with self._lock:
+                self._active += 1
+            try:
+                return call()
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._submitted -= 1
+
+        return await loop.run_in_executor(self._executor, _tracked_call)
+
+    def stats(self) -> dict[str, int]:
+        """現在のキューの深さ、実行中の呼び出し数、ワーカー数の上限を返す。"""
+        with self._lock:
+            return {
+                "queue_depth": self._submitted - self._active,
+                "active": self._active,
+                "max_workers": self._max_workers,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """スレッドプールを停止する。"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+@lru_cache
+def get_blocking_executor() -> BlockingCallExecutor:
+    """設定に基づいて共有のBlockingCallExecutorを生成・取得する。"""
+    settings = get_settings()
+    executor = BlockingCallExecutor(max_workers=settings.blocking_executor_max_workers)
+
+    metrics = get_metrics_registry()
+    metrics.gauge(
+        "coco_blocking_executor_queue_depth",
+        "ワーカーの空きを待っている同期API呼び出しの数",
+        function=lambda: executor.stats()["queue_depth"],
+    )
+    metrics.gauge(
+        "coco_blocking_executor_active",
+        "実行中の同期API呼び出しの数",
+        function=lambda: executor.stats()["active"],
+    )
+    return executor
+
+
+async def run_blocking(fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """共有のBlockingCallExecutorで同期関数を実行するショートカット。"""
+    return await get_blocking_executor().run(fn, *args, **kwargs)
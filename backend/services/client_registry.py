@@ -0,0 +1,181 @@
+import threading
+from typing import TYPE_CHECKING, Any, Callable
+
+from services.logging_service import get_logger
+
+from config import get_settings
+
+# 各SDKのimportには数百ミリ秒から数秒かかるため、クライアントを生成する時点でimportする
+if TYPE_CHECKING:
+    from google import genai
+    from google.adk.models import BaseLlm
+    from google.cloud import firestore, storage
+    from google.cloud.speech_v2 import SpeechClient
+    from google.cloud.texttospeech import TextToSpeechClient
+
+logger = get_logger(__name__)
+
+ClientFactory = Callable[[], Any]
+
+
+def _create_speech_client() -> "SpeechClient":
+    from google.cloud.speech_v2 import SpeechClient
+
+    return SpeechClient()
+
+
+def _create_tts_client() -> "TextToSpeechClient":
+    from google.cloud.texttospeech import TextToSpeechClient
+
+    return TextToSpeechClient()
+
+
+def _create_genai_client() -> "genai.Client":
+    """Vertex AI APIを使用するGenAIクライアントを生成する。"""
+    from google import genai
+
+    settings = get_settings()
+    return genai.Client(
+        vertexai=True,
+        project=settings.google_cloud_project,
+        location=settings.google_cloud_location,
+    )
+
+
+def _create_gemini_llm() -> "BaseLlm":
+    """
+    ExplainerAgentが使用するGeminiモデルを生成する。
+    LlmAgentにモデル名の文字列を渡すと呼び出しのたびに新しいクライアントが生成されるため、
+    インスタンスを共有して接続を使い回す。
+    """
+    from agents.explainer_agent.config import MODEL_ID as EXPLAINER_MODEL_ID
+    from google.adk.models import Gemini
+
+    return Gemini(model=EXPLAINER_MODEL_ID)
+
+
+def _create_storage_client() -> "storage.Client":
+    """
+    GCSクライアントを生成する。
+    requestsの既定の接続プール（10接続）ではストレージ操作用のスレッド数に足りず、
+    接続の確立とTLSハンドシェイクが繰り返されるため、スレッド数と同じ大きさの
+    keep-aliveの接続プールを持つセッションを使用する。
+    """
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+
+    settings = get_settings()
+    credentials, _ = google.auth.default(scopes=storage.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(
+        pool_connections=settings.storage_max_workers,
+        pool_maxsize=settings.storage_max_workers,
+    )
+    session.mount("https://", adapter)
+    return storage.Client(project=settings.google_cloud_project, _http=session)
+
+
+def _create_firestore_client() -> "firestore.AsyncClient":
+    from google.cloud import firestore
+
+    return firestore.AsyncClient()
+
+
+def default_client_factories() -> dict[str, ClientFactory]:
+    """本番用のクライアントファクトリを返す。"""
+    return {
+        "speech": _create_speech_client,
+        "tts": _create_tts_client,
+        "genai": _create_genai_client,
+        "gemini": _create_gemini_llm,
+        "storage": _create_storage_client,
+        "firestore": _create_firestore_client,
+    }
+
+
+class ClientRegistry:
+    """
+    プロセス全体で共有するGoogle Cloudクライアントのレジストリ。
+
+    gRPCチャネルの確立、認証トークンの取得、TLSハンドシェイクはクライアント生成時に発生するため、
+    ジョブごとにクライアントを作り直さず、最初に要求された時点で一度だけ生成して使い回す。
+    ファクトリを差し替えることで、ベンチマークなどでフェイククライアントを注入できる。
+    """
+
+    def __init__(self, factories: dict[str, ClientFactory] | None = None):
+        self._factories = {**default_client_factories(), **(factories or {})}
+        self._clients: dict[str, Any] = {}
+        # executorのスレッドからも参照されるため、生成処理はロックで保護する
+        self._lock = threading.Lock()
+
+    def set_factory(self, name: str, factory: ClientFactory) -> None:
+        """
+        クライアントのファクトリを差し替える。
+        すでに生成済みのクライアントには影響しないため、最初の利用より前に呼び出す必要がある。
+        """
+        with self._lock:
+            if name in self._clients:
+                raise RuntimeError(f"Client '{name}' has already been created.")
+            self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        """指定された名前のクライアントを取得する。未生成の場合はここで生成する。"""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                factory = self._factories.get(name)
+                if factory is None:
+                    raise KeyError(f"Unknown client: {name}")
+                client = factory()
+                self._clients[name] = client
+                logger.info("共有クライアント '%s' を初期化しました。", name)
+        return client
+
+    @property
+    def speech(self) -> "SpeechClient":
+        return self.get("speech")
+
+    @property
+    def tts(self) -> "TextToSpeechClient":
+        return self.get("tts")
+
+    @property
+    def genai(self) -> "genai.Client":
+        return self.get("genai")
+
+    @property
+    def gemini(self) -> "BaseLlm":
+        return self.get("gemini")
+
+    @property
+    def storage(self) -> "storage.Client":
+        return self.get("storage")
+
+    @property
+    def firestore(self) -> "firestore.AsyncClient":
+        return self.get("firestore")
+
+    def close(self) -> None:
+        """生成済みのクライアントをすべて閉じる。"""
+        with self._lock:
+            clients, self._clients = self._clients, {}
+
+        for name, client in clients.items():
+            try:
+                close = getattr(client, "close", None)
+                if close is None:
+                    transport = getattr(client, "transport", None)
+                    close = getattr(transport, "close", None)
+                if close is not None:
+                    close()
+                logger.info("共有クライアント '%s' を閉じました。", name)
+            except Exception as e:
+                logger.warning(
+                    f"共有クライアント '{name}' のクローズに失敗しました: {e}"
+                )
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Awaitable, TypeVar
+
+from models.agent_models import StageDeadlineExceededError
+from services.metrics_service import get_metrics_registry
+
+from config import get_settings
+
+T = TypeVar("T")
+
+_metrics = get_metrics_registry()
+_STAGE_BUDGET = _metrics.histogram(
+    "coco_stage_budget_seconds",
+    "ステージの開始時点で、そのステージに割り当てた処理時間の上限",
+    ("stage",),
+)
+_DEADLINES_EXCEEDED = _metrics.counter(
+    "coco_stage_deadlines_exceeded_total",
+    "期限を過ぎたため打ち切ったステージの処理の数",
+    ("stage",),
+)
+
+
+@dataclass
+class _JobDeadline:
+    deadline: float
+    # ステージごとの期限
+    stages: dict[str, float] = field(default_factory=dict)
+
+
+class JobDeadlines:
+    """
+    ジョブ全体の処理時間の予算から、ステージごとの期限を割り当てるトラッカー。
+
+    ジョブの開始時に `job_timeout_seconds` 後をジョブの期限とし、各ステージの開始時に
+    「ジョブの期限」と「開始から `agent_timeout` 秒後」の早い方をステージの期限とする。
+    各エージェントは外部APIの呼び出しに固定のタイムアウトではなく期限までの残り時間を渡すため、
+    前のステージが予算を使い込んだジョブでは、後のステージも予算の範囲で打ち切られる。
+    """
+
+    def __init__(self, stage_timeout_seconds: float):
+        self._stage_timeout = stage_timeout_seconds
+        self._jobs: dict[str, _JobDeadline] = {}
+        self._lock = threading.Lock()
+
+    def start_job(self, job_id: str, budget_seconds: float) -> None:
+        """ジョブの期限を設定する。"""
+        with self._lock:
+            self._jobs[job_id] = _JobDeadline(
+                deadline=time.monotonic() + budget_seconds
+            )
+
+    def start_stage(self, job_id: str, stage: str) -> None:
+        """ステージの期限を設定する。ジョブの期限が未設定の場合は何もしない。"""
+        now = time.monotonic()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            deadline = min(job.deadline, now + self._stage_timeout)
+            job.stages[stage] = deadline
+        _STAGE_BUDGET.observe(max(deadline - now, 0.0), stage=stage)
+
+    def detach_stage(self, job_id: str, stage: str, timeout_seconds: float) -> None:
+        """
+        ステージの期限をジョブの期限から切り離し、今から `timeout_seconds` 秒後にする。
+        ジョブの完了後もバックグラウンドで続ける処理（縮退運転の補完）に使う。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.stages[stage] = time.monotonic() + timeout_seconds
+
+    def remaining(
+        self, job_id: str, stage: str | None, cap: float | None = None
+    ) -> float:
+        """
+        ステージの期限までの残り秒数を返す。
+        `stage` がNoneの場合はジョブの期限までの残り秒数を返す。
+        `cap` を指定した場合はその値を上限とする。
+        期限が未設定のジョブ（パイプライン外からの呼び出し）は `agent_timeout` を返す。
+
+        Raises:
+            StageDeadlineExceededError: 期限を過ぎている場合。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            deadline = job.stages.get(stage, job.deadline) if job else None
+        if deadline is None:
+            remaining = float(self._stage_timeout)
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _DEADLINES_EXCEEDED.inc(stage=stage or "job")
+                raise StageDeadlineExceededError(job_id, stage or "job")
+        return min(remaining, cap) if cap is not None else remaining
+
+    async def within(self, job_id: str, stage: str, awaitable: Awaitable[T]) -> T:
+        """
+        ステージの期限までに `awaitable` の完了を待つ。
+        期限を過ぎた場合は処理をキャンセルする。
+        レート制限やヘッジの待ち時間も含めて期限に収めるため、それらの呼び出しの外側で使う。
+
+        Raises:
+            StageDeadlineExceededError: 期限までに完了しなかった場合。
+        """
+        try:
+            timeout = self.remaining(job_id, stage)
+        except StageDeadlineExceededError:
+            # 待たずに失敗させる場合も、渡されたコルーチンを閉じておく
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            async with asyncio.timeout(timeout) as cm:
+                return await awaitable
+        except TimeoutError:
+            if not cm.expired():
+                # 呼び出し先のタイムアウト（APIに渡した残り時間など）はそのまま送出する
+                raise
+        _DEADLINES_EXCEEDED.inc(stage=stage)
+        raise StageDeadlineExceededError(job_id, stage)
+
+    def discard(self, job_id: str) -> None:
+        """終了したジョブの期限を破棄する。"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+
+@lru_cache
+def get_job_deadlines() -> JobDeadlines:
+    """プロセス全体で共有するJobDeadlinesを取得する。"""
+    return JobDeadlines(stage_timeout_seconds=get_settings().agent_timeout)
@@ -0,0 +1,264 @@
+import asyncio
+import json
+from functools import lru_cache
+from typing import Any
+
+from models.agent_models import ExplanationOutput
+from pydantic import TypeAdapter
+from services.logging_service import get_logger
+
+logger = get_logger(__name__)
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJsonObjectParser:
+    """
+    トップレベルのJSONオブジェクトを断片ごとに受け取り、値が確定したフィールドから順に返すパーサー。
+
+    Geminiのストリーミング出力のように、1つのJSONオブジェクトが任意の位置で
+    分割されて届く場合に使用する。受け取った文字列は一度だけ走査する。
+    確定した値は `json.loads` でデコードするため、エスケープや入れ子の値も扱える。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        # start -> key -> colon -> value -> comma -> key ... -> done
+        self._expect = "start"
+        self._key: str | None = None
+        self._value_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def done(self) -> bool:
+        """オブジェクトの終端まで読み終えたかどうか。"""
+        return self._expect == "done"
+
+    def feed(self, chunk: str) -> list[tuple[str, Any]]:
+        """
+        JSONの断片を追加し、新たに値が確定したフィールドを返す。
+
+        Args:
+            chunk: ストリームから受け取ったJSON文字列の断片。
+
+        Returns:
+            (フィールド名, デコード済みの値) のリスト。出現順に並ぶ。
+
+        Raises:
+            ValueError: 入力がJSONオブジェクトとして不正な場合。
+        """
+        self._buffer += chunk
+        fields: list[tuple[str, Any]] = []
+        while self._pos < len(self._buffer) and not self.done:
+            if self._expect == "value":
+                field = self._scan_value()
+                if field is None:
+                    break
+                fields.append(field)
+                continue
+
+            char = self._buffer[self._pos]
+            if char in _WHITESPACE:
+                self._pos += 1
+            elif self._expect == "start":
+                self._consume(char, "{", "key")
+            elif self._expect == "key":
+                if char == "}":
+                    self._pos += 1
+                    self._expect = "done"
+                    continue
+                end = self._string_end(self._pos)
+                if end is None:
+                    break
+                self._key = json.loads(self._buffer[self._pos : end + 1])
+                self._pos = end + 1
+                self._expect = "colon"
+            elif self._expect == "colon":
+                self._consume(char, ":", "value")
+                self._value_start = self._pos
+            elif self._expect == "comma":
+                if char == "}":
+                    self._pos += 1
+                    self._expect = "done"
+                else:
+                    self._consume(char, ",", "key")
+        return fields
+
+    def _consume(self, char: str, expected: str, next_state: str) -> None:
+        if char != expected:
+            raise ValueError(
+                f"位置 {self._pos} で '{expected}' を期待しましたが '{char}' でした。"
+            )
+        self._pos += 1
+        self._expect = next_state
+
+    def _string_end(self, start: int) -> int | None:
+        """`start` の二重引用符で始まる文字列の終端位置を返す。未到着の場合はNone。"""
+        if self._buffer[start] != '"':
+            raise ValueError(f"位置 {start} でフィールド名を期待しました。")
+        index = start + 1
+        while index < len(self._buffer):
+            char = self._buffer[index]
+            if char == "\\":
+                index += 2
+                continue
+            if char == '"':
+                return index
+            index += 1
+        return None
+
+    def _scan_value(self) -> tuple[str, Any] | None:
+        """値を走査し、確定した場合は (フィールド名, 値) を返す。"""
+        # 値の前の空白を読み飛ばす
+        if self._pos == self._value_start:
+            while (
+                self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE
+            ):
+                self._pos += 1
+            self._value_start = self._pos
+
+        while self._pos < len(self._buffer):
+            char = self._buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 0:
+                        self._pos += 1
+                        return self._finish_value(self._pos)
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # オブジェクトの終端。数値・真偽値・nullの値が確定する
+                    return self._finish_value(self._pos)
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pos += 1
+                    return self._finish_value(self._pos)
+            elif self._depth == 0 and (char == "," or char in _WHITESPACE):
+                return self._finish_value(self._pos)
+            self._pos += 1
+        return None
+
+    def _finish_value(self, end: int) -> tuple[str, Any]:
+        raw = self._buffer[self._value_start : end]
+        key = self._key
+        assert key is not None
+        self._key = None
+        self._expect = "comma"
+        self._pos = end
+        # 確定したフィールドより前の部分は不要なため、バッファから取り除く
+        self._buffer = self._buffer[end:]
+        self._pos = 0
+        return key, json.loads(raw)
+
+
+class ExplanationStream:
+    """
+    1つのジョブについて、ストリーミング中のGemini出力から値が確定したフィールドを配信する。
+
+    ExplainerAgentのモデルコールバックが `feed` で出力の断片を渡し、
+    IllustratorAgentやNarratorAgentは `wait_for` で必要なフィールドだけを待つ。
+    これにより、レスポンス全体の受信を待たずに後続の処理を開始できる。
+    """
+
+    _FIELD_ADAPTERS = {
+        name: TypeAdapter(field.annotation)
+        for name, field in ExplanationOutput.model_fields.items()
+    }
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._parser: IncrementalJsonObjectParser | None = IncrementalJsonObjectParser()
+        self._fields: dict[str, asyncio.Future] = {}
+
+    def _future(self, name: str) -> asyncio.Future:
+        if name not in self._FIELD_ADAPTERS:
+            raise KeyError(f"ExplanationOutputに存在しないフィールドです: {name}")
+        future = self._fields.get(name)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._fields[name] = future
+        return future
+
+    def _publish(self, name: str, value: Any) -> bool:
+        adapter = self._FIELD_ADAPTERS.get(name)
+        if adapter is None:
+            return False
+        future = self._future(name)
+        if future.done():
+            return False
+        future.set_result(adapter.validate_python(value))
+        return True
+
+    def feed(self, chunk: str) -> list[str]:
+        """
+        出力の断片を追加し、新たに確定したフィールド名のリストを返す。
+        出力がJSONとして不正な場合は以降の断片を無視し、`complete` での配信に任せる。
+        """
+        if self._parser is None:
+            return []
+        try:
+            fields = self._parser.feed(chunk)
+            return [name for name, value in fields if self._publish(name, value)]
+        except ValueError as e:
+            logger.warning(
+                f"[{self.job_id}] ストリーミング出力の逐次パースに失敗したため、"
+                f"完了時の出力を使用します: {e}"
+            )
+            self._parser = None
+            return []
+
+    def complete(self, explanation: ExplanationOutput) -> None:
+        """パース済みの最終出力から、まだ配信していないフィールドをすべて配信する。"""
+        self._parser = None
+        for name in self._FIELD_ADAPTERS:
+            self._publish(name, getattr(explanation, name))
+
+    async def wait_for(self, name: str, timeout: float | None = None) -> Any:
+        """指定したフィールドの値が確定するまで待ち、その値を返す。"""
+        return await asyncio.wait_for(asyncio.shield(self._future(name)), timeout)
+
+    def close(self) -> None:
+        """未確定のフィールドを待っている処理をキャンセルする。"""
+        self._parser = None
+        for future in self._fields.values():
+            if not future.done():
+                future.cancel()
+
+
+class ExplanationStreamRegistry:
+    """実行中のジョブの ExplanationStream をジョブIDで管理する。"""
+
+    def __init__(self):
+        self._streams: dict[str, ExplanationStream] = {}
+
+    def open(self, job_id: str) -> ExplanationStream:
+        """ジョブのストリームを作成する。既存のストリームは閉じてから置き換える。"""
+        self.close(job_id)
+        stream = ExplanationStream(job_id)
+        self._streams[job_id] = stream
+        return stream
+
+    def get(self, job_id: str) -> ExplanationStream | None:
+        return self._streams.get(job_id)
+
+    def close(self, job_id: str) -> None:
+        stream = self._streams.pop(job_id, None)
+        if stream is not None:
+            stream.close()
+
+
+@lru_cache
+def get_explanation_streams() -> ExplanationStreamRegistry:
+    """プロセス全体で共有するExplanationStreamRegistryを取得する。"""
+    return ExplanationStreamRegistry()
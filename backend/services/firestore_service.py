@@ -1,10 +1,26 @@
+import asyncio
+from functools import lru_cache
+
 from google.cloud import firestore
 from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
 
 from config import get_settings
 
 logger = get_logger(__name__)
 
+_metrics = get_metrics_registry()
+_JOB_WRITES = _metrics.counter(
+    "coco_job_document_writes_total", "ジョブドキュメントへの書き込み回数"
+)
+_JOB_UPDATES_COALESCED = _metrics.counter(
+    "coco_job_document_updates_coalesced_total",
+    "他の更新とまとめて書き込まれたため、単独の書き込みが不要になった更新の数",
+)
+
+# 書き込みに失敗し続ける場合に、再試行が間を置かずに繰り返されないための最小の待ち時間
+_RETRY_MIN_DELAY_SECONDS = 0.5
+
 
 async def _update_job(db: firestore.AsyncClient, job_id: str, payload: dict):
     """Firestoreのジョブドキュメントを更新する内部ヘルパー関数"""
@@ -18,6 +34,7 @@ async def _update_job(db: firestore.AsyncClient, job_id: str, payload: dict):
 
     try:
         await job_ref.set(payload, merge=True)
+        _JOB_WRITES.inc()
         logger.info(f"[{job_id}] ジョブの更新が完了しました。")
     except Exception as e:
         logger.error(
@@ -26,11 +43,178 @@ async def _update_job(db: firestore.AsyncClient, job_id: str, payload: dict):
         raise
 
 
+class JobUpdateBuffer:
+    """
+    ジョブドキュメントへの更新をジョブごとにまとめて書き込むバッファ。
+
+    通常の更新は `debounce_seconds` の間バッファに溜められ、後続の更新とマージして
+    1回の `set(merge=True)` で書き込まれる。更新が続いても、最初の更新から
+    `max_delay_seconds` 以内には必ず書き込む。
+    UIにすぐ反映すべき更新（最初の進捗やステータスの変更）は `immediate=True` で
+    保留中の更新と合わせて即座に書き込む。
+    すでに同じ値を書き込み済みのフィールドは、ペイロードから除外する。
+    書き込みに失敗した更新はバッファに戻し、最初の更新から `max_delay_seconds` 以内
+    （過ぎている場合は少し待って）に再試行する。
+    """
+
+    def __init__(self, debounce_seconds: float, max_delay_seconds: float):
+        self._debounce = debounce_seconds
+        self._max_delay = max(max_delay_seconds, debounce_seconds)
+        self._pending: dict[str, dict] = {}
+        self._pending_count: dict[str, int] = {}
+        self._first_pending_at: dict[str, float] = {}
+        self._clients: dict[str, firestore.AsyncClient] = {}
+        self._written: dict[str, dict] = {}
+        self._timers: dict[str, asyncio.Task] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def update(
+        self,
+        db: firestore.AsyncClient,
+        job_id: str,
+        data: dict,
+        immediate: bool = False,
+    ) -> None:
+        """
+        ジョブドキュメントへの更新をバッファに追加する。
+
+        Args:
+            db: Firestoreクライアントのインスタンス。
+            job_id: 更新対象のジョブID。
+            data: マージするフィールドの辞書。
+            immediate: Trueの場合、保留中の更新と合わせて即座に書き込む。
+        """
+        loop = asyncio.get_running_loop()
+        self._pending.setdefault(job_id, {}).update(data)
+        self._pending_count[job_id] = self._pending_count.get(job_id, 0) + 1
+        self._first_pending_at.setdefault(job_id, loop.time())
+        self._clients[job_id] = db
+
+        if immediate or self._debounce <= 0:
+            await self.flush(job_id)
+            return
+
+        # 更新のたびに書き込みを後ろ倒しにするが、最初の更新から max_delay は超えない
+        deadline = self._first_pending_at[job_id] + self._max_delay
+        delay = min(self._debounce, max(deadline - loop.time(), 0.0))
+        self._cancel_timer(job_id)
+        self._timers[job_id] = asyncio.create_task(
+            self._flush_later(job_id, delay), name=f"job-update-flush-{job_id}"
+        )
+
+    async def flush(self, job_id: str) -> None:
+        """保留中の更新を即座に書き込む。保留中の更新がない場合は何もしない。"""
+        self._cancel_timer(job_id)
+        lock = self._locks.setdefault(job_id, asyncio.Lock())
+        async with lock:
+            pending = self._pending.pop(job_id, None)
+            count = self._pending_count.pop(job_id, 0)
+            first_pending_at = self._first_pending_at.pop(job_id, None)
+            db = self._clients.get(job_id)
+            if not pending or db is None:
+                return
+
+            written = self._written.setdefault(job_id, {})
+            payload = {
+                key: value
+                for key, value in pending.items()
+                if key not in written or written[key] != value
+            }
+            if not payload:
+                return
+            try:
+                await _update_job(db, job_id, dict(payload))
+            except Exception:
+                # 書き込めなかった更新はバッファに戻し、再試行のタイマーを設定する
+                self._pending[job_id] = {**pending, **self._pending.get(job_id, {})}
+                self._pending_count[job_id] = count + self._pending_count.get(job_id, 0)
+                if first_pending_at is not None:
+                    self._first_pending_at[job_id] = first_pending_at
+                self._schedule_retry(job_id)
+                raise
+            if count > 1:
+                _JOB_UPDATES_COALESCED.inc(count - 1)
+            written.update(payload)
+
+    async def close(self, job_id: str, discard: bool = False) -> None:
+        """
+        ジョブの終了時に呼び出し、保留中の更新を書き込んでからジョブの状態を破棄する。
+        書き込みに失敗した場合はログに記録するのみで、例外は送出しない。
+        `discard` がTrueの場合は、保留中の更新を書き込まずに破棄する。
+        """
+        try:
+            if not discard:
+                await self.flush(job_id)
+        except Exception as e:
+            logger.error(f"[{job_id}] 保留中のジョブ更新の書き込みに失敗しました: {e}")
+        finally:
+            self._cancel_timer(job_id)
+            for state in (
+                self._pending,
+                self._pending_count,
+                self._first_pending_at,
+                self._clients,
+                self._written,
+                self._locks,
+            ):
+                state.pop(job_id, None)
+
+    async def flush_all(self) -> None:
+        """保留中のすべての更新を書き込む。シャットダウン時に呼び出す。"""
+        for job_id in list(self._pending):
+            await self.close(job_id)
+
+    async def _flush_later(self, job_id: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # 自身をタイマーから外してから書き込む（flush内でキャンセルされないように）
+        if self._timers.get(job_id) is asyncio.current_task():
+            del self._timers[job_id]
+        try:
+            await self.flush(job_id)
+        except Exception as e:
+            logger.warning(
+                f"[{job_id}] 遅延させたジョブ更新の書き込みに失敗しました: {e}"
+            )
+
+    def _schedule_retry(self, job_id: str) -> None:
+        """
+        書き込みに失敗した更新の再試行をタイマーに設定する。
+        再試行は最初の更新から `max_delay_seconds` 以内に行う。
+        ただし、失敗が続く場合に備えて最小の待ち時間は空ける。
+        """
+        loop = asyncio.get_running_loop()
+        first_pending_at = self._first_pending_at.setdefault(job_id, loop.time())
+        deadline = first_pending_at + self._max_delay
+        delay = max(
+            min(self._debounce, deadline - loop.time()), _RETRY_MIN_DELAY_SECONDS
+        )
+        self._cancel_timer(job_id)
+        self._timers[job_id] = asyncio.create_task(
+            self._flush_later(job_id, delay), name=f"job-update-flush-{job_id}"
+        )
+
+    def _cancel_timer(self, job_id: str) -> None:
+        timer = self._timers.pop(job_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+
+
+@lru_cache
+def get_job_update_buffer() -> JobUpdateBuffer:
+    """プロセス全体で共有するJobUpdateBufferを取得する。"""
+    settings = get_settings()
+    return JobUpdateBuffer(
+        debounce_seconds=settings.job_update_debounce_seconds,
+        max_delay_seconds=settings.job_update_max_delay_seconds,
+    )
+
+
 async def update_job_status(
     db: firestore.AsyncClient, job_id: str, status: str, data: dict | None = None
 ):
     """
     Firestoreのジョブステータスと追加情報を更新する。
+    ステータスの変更はUIにすぐ反映させるため、保留中の更新と合わせて即座に書き込む。
 
     Args:
         db: Firestoreクライアントのインスタンス。
@@ -41,18 +225,21 @@ async def update_job_status(
     update_payload = {"status": status}
     if data:
         update_payload.update(data)
-    await _update_job(db, job_id, update_payload)
+    await get_job_update_buffer().update(db, job_id, update_payload, immediate=True)
 
 
-async def update_job_data(db: firestore.AsyncClient, job_id: str, data: dict):
+async def update_job_data(
+    db: firestore.AsyncClient, job_id: str, data: dict, immediate: bool = False
+):
     """
     Firestoreのジョブドキュメントにデータのみをマージする。
     ステータスは変更しない。
+    `immediate` がFalseの場合、更新はバッファされ、後続の更新とまとめて書き込まれる。
 
     Args:
         db: Firestoreクライアントのインスタンス。
         job_id: 更新対象のジョブID。
         data: 保存する追加情報の辞書。
+        immediate: Trueの場合、保留中の更新と合わせて即座に書き込む。
     """
-    # ペイロードは渡されたデータ辞書そのもの
-    await _update_job(db, job_id, data)
+    await get_job_update_buffer().update(db, job_id, data, immediate=immediate)
@@ -2,6 +2,7 @@ import asyncio
 import hashlib
 import json
 import re
+import time
 import traceback
 import uuid
 from datetime import datetime, timezone
@@ -13,9 +14,17 @@ from google.api_core import exceptions as google_exceptions
 from google.cloud import firestore
 from pydantic import BaseModel
 from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+from services.session_cache import SessionCache
 
 logger = get_logger(__name__)
 
+_SESSION_OPERATIONS = get_metrics_registry().counter(
+    "coco_session_operations_total",
+    "FirestoreSessionServiceのメソッド呼び出し回数",
+    ["operation"],
+)
+
 # タイムスタンプはFirestoreのサーバータイムスタンプを使用するため、
 # Pydanticモデル用のプレースホルダーとしてUTCを使用
 UTC = timezone.utc
@@ -98,20 +107,54 @@ class FirestoreSessionService(BaseSessionService):
     Firestoreをバックエンドとして使用するADKセッションサービス（非同期）。
     - セッションをコレクションに保存します（デフォルト: 'adk_sessions'）。
     - model_dump(by_alias=True) を使用して書き込むことで、フィールドがADKスキーマ（appName, userIdなど）と一致するようにします。
+    - `lean_writes=True` の場合、書き込み後の再読み込みを省略します。
+      ローカルでマージしたセッションを返します。
+      また、イベントの書き込み・カウンタの更新・state_deltaの適用を1回のバッチ書き込みで行います。
+    - `cache` を指定した場合、書き込んだセッションをキャッシュし、イベントを含まない
+      get_session はキャッシュから返します（ライトスルー）。
     """
 
     def __init__(
         self,
         db_client: firestore.AsyncClient,
         collection_name: str = "adk_sessions",
+        lean_writes: bool = False,
+        cache: SessionCache | None = None,
     ):
         # 外部から渡された共有クライアントを使用
         self._db = db_client
         self._collection = self._db.collection(collection_name)
+        self._lean_writes = lean_writes
+        self._cache = cache
         logger.info(
-            "FirestoreSessionService initialized (collection=%s)", collection_name
+            "FirestoreSessionService initialized (collection=%s, lean_writes=%s)",
+            collection_name,
+            lean_writes,
         )
 
+    @staticmethod
+    def _state_delta_fields(
+        state_delta: dict[str, Any], max_state_keys: int = 200
+    ) -> dict[str, Any]:
+        """state_deltaを、セッションドキュメントのフィールドパス（state.<key>）の辞書に変換する。"""
+        if len(state_delta) > max_state_keys:
+            raise ValueError(
+                f"state_delta too large ({len(state_delta)} > {max_state_keys})"
+            )
+
+        fields: dict[str, Any] = {}
+        for key, value in state_delta.items():
+            if INVALID_KEY_CHARS.search(key):
+                raise ValueError(f"Invalid character in state_delta key: '{key}'")
+            # Pydanticモデルを辞書に変換してから保存
+            if isinstance(value, BaseModel):
+                fields[f"state.{key}"] = value.model_dump(
+                    by_alias=True, exclude_none=True
+                )
+            else:
+                fields[f"state.{key}"] = value
+        return fields
+
     async def create_session(
         self,
         *,
@@ -120,6 +163,7 @@ class FirestoreSessionService(BaseSessionService):
         state: dict[str, Any] | None = None,
         session_id: str | None = None,
     ) -> Session:
+        _SESSION_OPERATIONS.inc(operation="create_session")
         session_id = session_id or uuid.uuid4().hex
         session = Session(
             id=session_id,
@@ -146,6 +190,11 @@ class FirestoreSessionService(BaseSessionService):
             "created session %s for app=%s user=%s", session_id, app_name, user_id
         )
 
+        if self._lean_writes:
+            # 書き込んだ内容はローカルのセッションと同一のため、再読み込みを省略する
+            self._cache_put(session)
+            return session
+
         # 返り値の整合性を保つため、書き込み後のデータを再度読み込んで返す。
         # これにより、last_update_timeがサーバーで採番された正確なタイムスタンプになる。
         created_snap = await doc_ref.get()
@@ -159,6 +208,7 @@ class FirestoreSessionService(BaseSessionService):
             logger.error(
                 "Failed to retrieve session %s immediately after creation.", session_id
             )
+        self._cache_put(session)
         return session
 
     async def update_session(
@@ -188,6 +238,7 @@ class FirestoreSessionService(BaseSessionService):
         Returns:
             更新が成功した場合は、最新の `Session` オブジェクト。セッションが存在しない場合は `None`。
         """
+        _SESSION_OPERATIONS.inc(operation="update_session")
         if not state_delta:
             logger.debug(
                 "update_session called with empty state_delta for %s", session_id
@@ -200,23 +251,12 @@ class FirestoreSessionService(BaseSessionService):
                 ignore_owner_check=not (app_name and user_id),
             )
 
-        if len(state_delta) > max_state_keys:
-            raise ValueError(
-                f"state_delta too large ({len(state_delta)} > {max_state_keys})"
-            )
-
         session_ref = self._collection.document(session_id)
-        update_data: dict[str, Any] = {"lastUpdateTime": firestore.SERVER_TIMESTAMP}
-        for key, value in state_delta.items():
-            if INVALID_KEY_CHARS.search(key):
-                raise ValueError(f"Invalid character in state_delta key: '{key}'")
-            # Pydanticモデルを辞書に変換してから保存
-            if isinstance(value, BaseModel):
-                update_data[f"state.{key}"] = value.model_dump(
-                    by_alias=True, exclude_none=True
-                )
-            else:
-                update_data[f"state.{key}"] = value
+        state_fields = self._state_delta_fields(state_delta, max_state_keys)
+        update_data: dict[str, Any] = {
+            "lastUpdateTime": firestore.SERVER_TIMESTAMP,
+            **state_fields,
+        }
 
         transaction = self._db.transaction()
 
@@ -236,14 +276,36 @@ class FirestoreSessionService(BaseSessionService):
                     raise PermissionError("user_id mismatch for session update")
 
             transaction.update(session_ref, update_data)
-            return True
+            return snap.to_dict() or {}
 
-        ok = await _run_with_retries(
+        current = await _run_with_retries(
             update_in_transaction, transaction, log_context={"session_id": session_id}
         )
-        if not ok:
+        if current is False:
             return None
 
+        if self._lean_writes:
+            # トランザクション内で読み取った内容にstate_deltaをマージして返し、
+            # 再読み込みを省略する
+            data = _normalize_timestamps(current)
+            data["state"] = {
+                **data.get("state", {}),
+                **{
+                    key.removeprefix("state."): value
+                    for key, value in state_fields.items()
+                },
+            }
+            data["lastUpdateTime"] = time.time()
+            data["events"] = []
+            # ADKのSessionモデルにないカスタムフィールドを検証前に削除
+            data.pop("eventsCount", None)
+            session = Session.model_validate(data)
+            self._cache_put(session)
+            return session
+
+        # 更新後の内容を読み直すため、キャッシュを経由しない
+        if self._cache is not None:
+            self._cache.invalidate(session_id)
         return await self.get_session(
             app_name=app_name or "",
             user_id=user_id or "",
@@ -261,6 +323,12 @@ class FirestoreSessionService(BaseSessionService):
         ignore_owner_check: bool = False,
         include_events: bool = False,
     ) -> Session | None:
+        _SESSION_OPERATIONS.inc(operation="get_session")
+        if self._cache is not None and not include_events:
+            cached = self._cache.get(session_id)
+            if cached is not None:
+                return self._check_owner(cached, app_name, user_id, ignore_owner_check)
+
         doc_ref = self._collection.document(session_id)
         snap = await doc_ref.get()
         if not snap.exists:
@@ -294,24 +362,44 @@ class FirestoreSessionService(BaseSessionService):
         # ADKのSessionモデルにないカスタムフィールドを検証前に削除
         data.pop("eventsCount", None)
         session = Session.model_validate(data)
+        if not include_events:
+            self._cache_put(session)
+        return self._check_owner(session, app_name, user_id, ignore_owner_check)
 
+    @staticmethod
+    def _check_owner(
+        session: Session, app_name: str, user_id: str, ignore_owner_check: bool
+    ) -> Session | None:
         if not ignore_owner_check and (
             session.app_name != app_name or session.user_id != user_id
         ):
             logger.warning(
                 "session found but app_name/user_id mismatch (doc=%s, expected app=%s user=%s)",
-                session_id,
+                session.id,
                 app_name,
                 user_id,
             )
             return None
         return session
 
+    def invalidate_cached(self, session_id: str) -> None:
+        """
+        セッションをこのインスタンスのキャッシュから破棄し、次の読み取りでFirestoreから読み直す。
+        他のインスタンスが更新した可能性のあるセッション（ジョブの再開や引き継ぎ）に使う。
+        """
+        if self._cache is not None:
+            self._cache.invalidate(session_id)
+
+    def _cache_put(self, session: Session) -> None:
+        if self._cache is not None:
+            self._cache.put(session)
+
     async def append_event(self, session: Session, event: Event) -> Event:
         """
         セッション履歴にイベントをアトミックに追加し、イベントのアクションにあるstate_deltaを適用します。
         state_deltaの適用は、実績のあるupdate_sessionメソッドに委譲することで、競合を防ぎます。
         """
+        _SESSION_OPERATIONS.inc(operation="append_event")
         session_ref = self._collection.document(session.id)
         state_delta = event.actions.state_delta if event.actions else None
 
@@ -330,6 +418,13 @@ class FirestoreSessionService(BaseSessionService):
         event_ref = session_ref.collection("events").document(event_id)
         event_data["id"] = event_id
 
+        if self._lean_writes:
+            await self._append_event_in_batch(
+                session_ref, event_ref, event_data, state_delta
+            )
+            logger.debug("Appended event to subcollection for session %s", session.id)
+            return self._with_event_id(event, event_id)
+
         # トランザクションでイベントドキュメントの書き込みとカウンタの更新のみを行う
         transaction = self._db.transaction()
 
@@ -367,6 +462,57 @@ class FirestoreSessionService(BaseSessionService):
                 user_id=session.user_id,
             )
 
+        logger.debug("Appended event to subcollection for session %s", session.id)
+        return self._with_event_id(event, event_id)
+
+    async def _append_event_in_batch(
+        self,
+        session_ref,
+        event_ref,
+        event_data: dict[str, Any],
+        state_delta: dict[str, Any] | None,
+    ) -> None:
+        """
+        イベントドキュメントの作成、カウンタの更新、state_deltaの適用を1回のバッチ書き込みで行う。
+        イベントがすでに存在する場合はバッチ全体が失敗するため、重複した適用は起こらない。
+        """
+        session_update: dict[str, Any] = {
+            "eventsCount": firestore.Increment(1),
+            "lastUpdateTime": firestore.SERVER_TIMESTAMP,
+        }
+        state_fields = self._state_delta_fields(state_delta) if state_delta else {}
+        session_update.update(state_fields)
+
+        async def commit_batch():
+            batch = self._db.batch()
+            batch.create(event_ref, event_data)
+            batch.update(session_ref, session_update)
+            await batch.commit()
+
+        try:
+            await _run_with_retries(
+                commit_batch,
+                log_context={"session_id": session_ref.id, "event_id": event_ref.id},
+            )
+        except google_exceptions.AlreadyExists:
+            # リトライ前の書き込みが成功していた場合も含め、適用済みとして扱う。
+            # キャッシュに反映済みかは分からないため、次の読み込みはFirestoreから行う
+            logger.info("Event %s already exists, skipping creation.", event_ref.id)
+            self.invalidate_cached(session_ref.id)
+            return
+
+        if self._cache is not None:
+            self._cache.apply_state_delta(
+                session_ref.id,
+                {
+                    key.removeprefix("state."): value
+                    for key, value in state_fields.items()
+                },
+                time.time(),
+            )
+
+    @staticmethod
+    def _with_event_id(event: Event, event_id: str) -> Event:
         # 呼び出し元がIDを使えるように、返すイベントオブジェクトにも安全にIDをセットする
         try:
             event.id = event_id
@@ -375,8 +521,6 @@ class FirestoreSessionService(BaseSessionService):
             ev_data = event.model_dump(by_alias=True, exclude_none=True)
             ev_data["id"] = event_id
             event = Event.model_validate(ev_data)
-
-        logger.debug("Appended event to subcollection for session %s", session.id)
         return event
 
     async def delete_session(
@@ -406,6 +550,8 @@ class FirestoreSessionService(BaseSessionService):
         await _batch_delete_subcollection(events_ref)
         # 親ドキュメントを削除
         await doc_ref.delete()
+        if self._cache is not None:
+            self._cache.invalidate(session_id)
         logger.info("Deleted session %s", session_id)
 
     async def list_sessions(self, *, app_name: str, user_id: str) -> list[Session]:
@@ -430,4 +576,4 @@ class FirestoreSessionService(BaseSessionService):
             # ADKのSessionモデルにないカスタムフィールドを検証前に削除
             data.pop("eventsCount", None)
             sessions.append(Session.model_validate(data))
-        return sessions
\ No newline at end of file
+        return sessions
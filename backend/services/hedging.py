@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Awaitable, Callable, TypeVar
+
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+from config import get_settings
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+_metrics = get_metrics_registry()
+_HEDGEABLE_REQUESTS = _metrics.counter(
+    "coco_hedgeable_requests_total",
+    "ヘッジの対象としたバックエンドの呼び出しの数",
+    ("backend",),
+)
+_HEDGED_REQUESTS = _metrics.counter(
+    "coco_hedged_requests_total",
+    "応答が遅いため、2つ目のリクエストを送った呼び出しの数",
+    ("backend",),
+)
+_HEDGE_WINS = _metrics.counter(
+    "coco_hedge_wins_total",
+    "2つ目のリクエストの応答を採用した呼び出しの数",
+    ("backend",),
+)
+_HEDGE_DELAY = _metrics.gauge(
+    "coco_hedge_delay_seconds",
+    "2つ目のリクエストを送るまでの待ち時間（0は観測した応答時間が不足しているためヘッジしない）",
+    ("backend",),
+)
+_HEDGE_RATE = _metrics.gauge(
+    "coco_hedge_rate",
+    "ヘッジの対象とした呼び出しのうち、2つ目のリクエストを送った割合",
+    ("backend",),
+)
+_HEDGE_WIN_RATE = _metrics.gauge(
+    "coco_hedge_win_rate",
+    "2つ目のリクエストを送った呼び出しのうち、その応答を採用した割合",
+    ("backend",),
+)
+
+
+class HedgedCaller:
+    """
+    冪等なバックエンドの呼び出しに、応答が遅い場合だけ2つ目のリクエストを送るヘッジ。
+
+    応答が直近 `window_size` 回の応答時間の `percentile` パーセンタイルより遅れたら、
+    同じ呼び出しをもう1つ送り、先に成功した方の結果を使って残りをキャンセルする。
+    応答時間が `min_samples` 回分たまるまではヘッジしない。
+    同期APIをスレッドで呼び出している場合、キャンセルは応答を待たずに破棄するだけで、
+    採用されなかったリクエストはスレッドを使い続け、バックエンドのクォータも消費する。
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        enabled: bool,
+        percentile: float,
+        min_samples: int,
+        window_size: int,
+    ):
+        self.backend = backend
+        self.enabled = enabled
+        self._percentile = percentile
+        self._min_samples = max(1, min_samples)
+        self._latencies: deque[float] = deque(
+            maxlen=max(window_size, self._min_samples)
+        )
+        self._requests = 0
+        self._hedged = 0
+        self._wins = 0
+
+    def hedge_delay(self) -> float | None:
+        """2つ目のリクエストを送るまでの秒数。ヘッジしない場合はNone。"""
+        if not self.enabled or len(self._latencies) < self._min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self._percentile / 100))
+        return latencies[index]
+
+    def stats(self) -> dict[str, float]:
+        """ヘッジの対象とした呼び出しの数、ヘッジした数、2つ目が採用された数とその割合を返す。"""
+        return {
+            "requests": self._requests,
+            "hedged": self._hedged,
+            "wins": self._wins,
+            "hedge_rate": self._hedged / self._requests if self._requests else 0.0,
+            "win_rate": self._wins / self._hedged if self._hedged else 0.0,
+        }
+
+    def _publish(self) -> None:
+        stats = self.stats()
+        _HEDGE_DELAY.set(self.hedge_delay() or 0.0, backend=self.backend)
+        _HEDGE_RATE.set(stats["hedge_rate"], backend=self.backend)
+        _HEDGE_WIN_RATE.set(stats["win_rate"], backend=self.backend)
+
+    async def _attempt(self, fn: Callable[[], Awaitable[T]]) -> T:
+        started_at = time.perf_counter()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # 採用されずにキャンセルされた遅い応答も、応答時間の下限として分布に残す
+            self._latencies.append(time.perf_counter() - started_at)
+            raise
+        self._latencies.append(time.perf_counter() - started_at)
+        return result
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        job_id: str | None = None,
+        can_hedge: Callable[[], bool] | None = None,
+    ) -> T:
+        """
+        `fn` を呼び出して、その結果を返す。
+        応答が遅い場合は2つ目の呼び出しを送り、先に成功した方の結果を返す。
+        両方が失敗した場合は、最初の呼び出しの例外を送出する。
+        `fn` は呼び出しのたびに新しいコルーチンを返す関数を渡す。
+        `can_hedge` を渡した場合は、2つ目の呼び出しを送る直前に呼び出す。
+        Falseが返った場合は送らずに、最初の呼び出しの応答を待つ。
+        レートリミッターのバックオフ中などに、2つ目の呼び出しを止めるために使う。
+        """
+        if not self.enabled:
+            return await fn()
+
+        self._requests += 1
+        _HEDGEABLE_REQUESTS.inc(backend=self.backend)
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(self._attempt(fn))
+        attempts = [primary]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done and (can_hedge is None or can_hedge()):
+                    self._hedged += 1
+                    _HEDGED_REQUESTS.inc(backend=self.backend)
+                    prefix = f"[{job_id}] " if job_id else ""
+                    logger.info(
+                        f"{prefix}{self.backend} の応答が{delay:.2f}秒を超えたため、"
+                        "2つ目のリクエストを送ります。"
+                    )
+                    attempts.append(asyncio.ensure_future(self._attempt(fn)))
+
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for attempt in done:
+                    if attempt.exception() is not None:
+                        # もう一方が成功する可能性があるため、残りの応答を待つ
+                        continue
+                    if attempt is not primary:
+                        self._wins += 1
+                        _HEDGE_WINS.inc(backend=self.backend)
+                    return attempt.result()
+            return primary.result()
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+            self._publish()
+
+
+@lru_cache(maxsize=None)
+def get_hedger(backend: str) -> HedgedCaller:
+    """
+    設定に基づいて、バックエンド（imagen, tts）ごとの共有のHedgedCallerを返す。
+    """
+    settings = get_settings()
+    return HedgedCaller(
+        backend=backend,
+        enabled=getattr(settings, f"{backend}_hedging_enabled"),
+        percentile=settings.hedge_percentile,
+        min_samples=settings.hedge_min_samples,
+        window_size=settings.hedge_window_size,
+    )
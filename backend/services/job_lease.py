@@ -0,0 +1,402 @@
+import asyncio
+import socket
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from functools import lru_cache
+from typing import AsyncIterator
+from uuid import uuid4
+
+from dependencies import get_firestore_client
+from google.cloud import firestore
+from models.agent_models import JobNotResumableError
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+from config import get_settings
+
+logger = get_logger(__name__)
+
+_metrics = get_metrics_registry()
+_DUPLICATES_SUPPRESSED = _metrics.counter(
+    "coco_job_duplicates_suppressed_total",
+    "処理済みまたは処理中のため実行を省略した、重複して配信されたジョブの数",
+    ("reason",),
+)
+_JOBS_RESUMED = _metrics.counter(
+    "coco_jobs_resumed_total",
+    "途中のステージから再開したジョブの数（lease_expired: 期限切れのリースの引き継ぎ, "
+    "manual: /jobs/{job_id}/resume）",
+    ("trigger",),
+)
+_LEASES_LOST = _metrics.counter(
+    "coco_job_leases_lost_total",
+    "実行中に他のインスタンスに引き継がれたリースの数",
+)
+
+# これ以上処理を進めないジョブのステータス
+TERMINAL_JOB_STATUSES = ("completed", "error")
+
+
+class LeaseOutcome(str, Enum):
+    """ジョブのリースの取得結果を定義するEnum"""
+
+    # 新たにリースを取得した
+    claimed = "claimed"
+    # 期限切れのリースを引き継いだ（完了済みのステージから再開する）
+    reclaimed = "reclaimed"
+    # リースを取得できなかったが、重複の判定ができないため実行する
+    unleased = "unleased"
+    # ジョブはすでに終了している
+    finished = "finished"
+    # 他のインスタンス（またはこのインスタンスの別の配信）が処理中
+    in_flight = "in_flight"
+
+
+@dataclass
+class JobLease:
+    """ジョブのリースの取得結果。"""
+
+    job_id: str
+    outcome: LeaseOutcome
+    # このリースで何回目の実行か（リースを取得しなかった場合は0）
+    attempt: int = 0
+    # 実行中に他のインスタンスにリースを引き継がれた
+    lost: bool = False
+
+    @property
+    def acquired(self) -> bool:
+        """このインスタンスがジョブを実行すべきかどうか。"""
+        return self.outcome in (
+            LeaseOutcome.claimed,
+            LeaseOutcome.reclaimed,
+            LeaseOutcome.unleased,
+        )
+
+
+def _default_owner() -> str:
+    """インスタンスを識別する所有者ID。同じホスト名のコンテナを区別するため乱数を付ける。"""
+    return f"{socket.gethostname()}-{uuid4().hex[:8]}"
+
+
+class JobLeaseManager:
+    """
+    ジョブドキュメントの `lease` フィールドを使った、ジョブの実行権の管理。
+
+    Eventarcは少なくとも1回の配信を保証するため、同じジョブが重複して配信されることがある。
+    ジョブの実行前にトランザクションでリース（所有者と有効期限）を取得し、
+    終了済みのジョブや他のインスタンスが処理中のジョブの実行を省略する。
+    実行中は有効期限を定期的に延長し、インスタンスの停止などで延長されなくなったリースは
+    期限切れ後に別の配信が引き継ぐ。引き継いだジョブは、セッションに保存された
+    完了済みのステージを省略して再開する。
+    """
+
+    def __init__(
+        self,
+        db_client: firestore.AsyncClient,
+        collection_name: str,
+        ttl_seconds: float,
+        renew_interval_seconds: float,
+        owner: str | None = None,
+    ):
+        self._db = db_client
+        self._collection = collection_name
+        self._ttl = timedelta(seconds=ttl_seconds)
+        self._renew_interval = renew_interval_seconds
+        self.owner = owner or _default_owner()
+        # このインスタンスで実行中のジョブ。
+        # 同じインスタンスへの重複配信をFirestoreを読まずに弾く
+        self._active: set[str] = set()
+
+    def _job_ref(self, job_id: str) -> firestore.AsyncDocumentReference:
+        return self._db.collection(self._collection).document(job_id)
+
+    async def claim(self, job_id: str) -> JobLease:
+        """
+        ジョブのリースを取得する。
+        Firestoreの読み書きに失敗した場合は、ジョブを取りこぼさないよう
+        リースを持たずに実行する（`LeaseOutcome.unleased`）。
+        """
+        if job_id in self._active:
+            return self._suppress(JobLease(job_id, LeaseOutcome.in_flight))
+        # トランザクションの完了を待つ間に届いた同じジョブの配信も弾けるよう、
+        # 先に予約する
+        self._active.add(job_id)
+        job_ref = self._job_ref(job_id)
+        transaction = self._db.transaction()
+
+        @firestore.async_transactional
+        async def claim_in_transaction(
+            transaction: firestore.AsyncTransaction,
+        ) -> JobLease:
+            snapshot = await job_ref.get(transaction=transaction)
+            data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            if data.get("status") in TERMINAL_JOB_STATUSES:
+                return JobLease(job_id, LeaseOutcome.finished)
+
+            now = datetime.now(timezone.utc)
+            lease = data.get("lease") or {}
+            expires_at = lease.get("expiresAt")
+            if lease.get("owner") != self.owner and expires_at and expires_at > now:
+                return JobLease(job_id, LeaseOutcome.in_flight)
+
+            attempt = int(lease.get("attempt", 0)) + 1
+            transaction.set(
+                job_ref,
+                {
+                    "lease": {
+                        "owner": self.owner,
+                        "expiresAt": now + self._ttl,
+                        "attempt": attempt,
+                    }
+                },
+                merge=True,
+            )
+            # 以前の実行のリースが残っている場合は、その実行が途中で止まったとみなす
+            outcome = LeaseOutcome.reclaimed if lease else LeaseOutcome.claimed
+            return JobLease(job_id, outcome, attempt)
+
+        try:
+            result = await claim_in_transaction(transaction)
+        except Exception as e:
+            logger.warning(
+                f"[{job_id}] ジョブのリースを取得できなかったため、"
+                f"リースなしで実行します: {e}"
+            )
+            return JobLease(job_id, LeaseOutcome.unleased)
+
+        if not result.acquired:
+            self._active.discard(job_id)
+            return self._suppress(result)
+        if result.outcome == LeaseOutcome.reclaimed:
+            _JOBS_RESUMED.inc(trigger="lease_expired")
+            logger.info(
+                f"[{job_id}] 期限切れのリースを引き継ぎました"
+                f"（{result.attempt}回目の実行）。"
+            )
+        return result
+
+    def _suppress(self, lease: JobLease) -> JobLease:
+        _DUPLICATES_SUPPRESSED.inc(reason=lease.outcome.value)
+        logger.info(
+            f"[{lease.job_id}] 重複して配信されたジョブの実行を省略します"
+            f"（{lease.outcome.value}）。"
+        )
+        return lease
+
+    async def renew(self, job_id: str) -> bool:
+        """リースの有効期限を延長する。他の所有者に引き継がれていた場合はFalseを返す。"""
+        job_ref = self._job_ref(job_id)
+        transaction = self._db.transaction()
+
+        @firestore.async_transactional
+        async def renew_in_transaction(transaction: firestore.AsyncTransaction) -> bool:
+            snapshot = await job_ref.get(transaction=transaction)
+            lease = ((snapshot.to_dict() or {}) if snapshot.exists else {}).get("lease")
+            if not lease or lease.get("owner") != self.owner:
+                return False
+            transaction.update(
+                job_ref, {"lease.expiresAt": datetime.now(timezone.utc) + self._ttl}
+            )
+            return True
+
+        return await renew_in_transaction(transaction)
+
+    async def release(self, job_id: str) -> None:
+        """
+        保持しているリースを解放し、次の配信がすぐにジョブを引き継げるようにする。
+        他の所有者に引き継がれていた場合は何もしない。
+        """
+        job_ref = self._job_ref(job_id)
+        transaction = self._db.transaction()
+
+        @firestore.async_transactional
+        async def release_in_transaction(transaction: firestore.AsyncTransaction):
+            snapshot = await job_ref.get(transaction=transaction)
+            lease = ((snapshot.to_dict() or {}) if snapshot.exists else {}).get("lease")
+            if lease and lease.get("owner") == self.owner:
+                transaction.update(job_ref, {"lease": firestore.DELETE_FIELD})
+
+        await release_in_transaction(transaction)
+
+    async def _keep_alive(self, lease: JobLease, job_task: asyncio.Task) -> None:
+        """
+        リースの有効期限を定期的に延長する。他のインスタンスに引き継がれていた場合は、
+        同じジョブを二重に実行しないよう、このインスタンスのジョブの実行をキャンセルする。
+        """
+        job_id = lease.job_id
+        while True:
+            await asyncio.sleep(self._renew_interval)
+            try:
+                if await self.renew(job_id):
+                    continue
+            except Exception as e:
+                # 一時的な失敗は、有効期限内の次の延長で取り戻せる
+                logger.warning(f"[{job_id}] ジョブのリースの延長に失敗しました: {e}")
+                continue
+            _LEASES_LOST.inc()
+            logger.warning(
+                f"[{job_id}] ジョブのリースが他のインスタンスに引き継がれたため、"
+                "このインスタンスでの実行を中止します。"
+            )
+            lease.lost = True
+            job_task.cancel()
+            return
+
+    @asynccontextmanager
+    async def hold(self, job_id: str) -> AsyncIterator[JobLease]:
+        """
+        ジョブのリースを取得し、ブロックを抜けるまで有効期限を延長し続ける。
+        ブロック内でジョブが終了ステータスを書き込むため、正常終了時はリースを解放しない。
+        例外やキャンセルで中断した場合は、次の配信がすぐに引き継げるようリースを解放する。
+        延長の際に他のインスタンスに引き継がれていたことが分かった場合は、
+        `lease.lost` を立ててブロックを実行中のタスクをキャンセルし、
+        ブロックを正常に抜ける（ジョブは引き継いだインスタンスが続ける）。
+        """
+        lease = await self.claim(job_id)
+        if not lease.acquired:
+            yield lease
+            return
+
+        job_task = asyncio.current_task()
+        keep_alive = None
+        if lease.outcome != LeaseOutcome.unleased:
+            keep_alive = asyncio.create_task(
+                self._keep_alive(lease, job_task), name=f"job-lease-{job_id}"
+            )
+        try:
+            yield lease
+        except BaseException as e:
+            if (
+                lease.lost
+                and isinstance(e, asyncio.CancelledError)
+                and job_task.uncancel() == 0
+            ):
+                return
+            if keep_alive is not None:
+                try:
+                    await self.release(job_id)
+                except Exception as e:
+                    logger.warning(
+                        f"[{job_id}] ジョブのリースの解放に失敗しました: {e}"
+                    )
+            raise
+        finally:
+            if keep_alive is not None:
+                keep_alive.cancel()
+            self._active.discard(job_id)
+
+
+async def reopen_job(
+    db_client: firestore.AsyncClient, collection_name: str, job_id: str
+) -> dict:
+    """
+    失敗または停止したジョブを再実行できる状態に戻し、ジョブドキュメントの内容を返す。
+    ステータスを "initializing" に戻し、エラーメッセージと以前の実行のリースを削除する。
+
+    Raises:
+        JobNotResumableError: ジョブが存在しない、完了済み、他で処理中、
+            または入力の音声ファイルが特定できない場合。
+    """
+    job_ref = db_client.collection(collection_name).document(job_id)
+    transaction = db_client.transaction()
+
+    @firestore.async_transactional
+    async def reopen_in_transaction(transaction: firestore.AsyncTransaction) -> dict:
+        snapshot = await job_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            raise JobNotResumableError(job_id, "not_found")
+        data = snapshot.to_dict() or {}
+        status = data.get("status")
+        if status == "completed":
+            raise JobNotResumableError(job_id, "completed")
+        # 終了ステータスのジョブのリースは、終了した実行が残したものなので無視する
+        lease = data.get("lease") or {}
+        expires_at = lease.get("expiresAt")
+        if (
+            status not in TERMINAL_JOB_STATUSES
+            and expires_at
+            and expires_at > datetime.now(timezone.utc)
+        ):
+            raise JobNotResumableError(job_id, "in_flight")
+        if not data.get("userId") or not data.get("objectName"):
+            raise JobNotResumableError(job_id, "missing_source")
+
+        transaction.update(
+            job_ref,
+            {
+                "status": "initializing",
+                "errorMessage": firestore.DELETE_FIELD,
+                "lease": firestore.DELETE_FIELD,
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            },
+        )
+        return data
+
+    data = await reopen_in_transaction(transaction)
+    _JOBS_RESUMED.inc(trigger="manual")
+    logger.info(
+        f"[{job_id}] ジョブを再実行できる状態に戻しました（以前のステータス: "
+        f"{data.get('status')}）。"
+    )
+    return data
+
+
+async def interrupt_job(
+    db_client: firestore.AsyncClient,
+    collection_name: str,
+    job_id: str,
+    error_message: str,
+) -> bool:
+    """
+    受け付けたが実行できなかったジョブに、再開できるエラーステータスを書き込む。
+    終了済みのジョブや、他のインスタンスが有効なリースを持つジョブは変更しない。
+    同じジョブの重複した配信だったとみなして、Falseを返す。
+    """
+    job_ref = db_client.collection(collection_name).document(job_id)
+    transaction = db_client.transaction()
+
+    @firestore.async_transactional
+    async def interrupt_in_transaction(
+        transaction: firestore.AsyncTransaction,
+    ) -> bool:
+        snapshot = await job_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return False
+        data = snapshot.to_dict() or {}
+        if data.get("status") in TERMINAL_JOB_STATUSES:
+            return False
+        expires_at = (data.get("lease") or {}).get("expiresAt")
+        if expires_at and expires_at > datetime.now(timezone.utc):
+            return False
+        transaction.update(
+            job_ref,
+            {
+                "status": "error",
+                "errorMessage": error_message,
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            },
+        )
+        return True
+
+    interrupted = await interrupt_in_transaction(transaction)
+    if interrupted:
+        logger.warning(
+            f"[{job_id}] 実行できなかったジョブを、再開できるエラー状態にしました。"
+        )
+    return interrupted
+
+
+@lru_cache
+def get_job_lease_manager() -> JobLeaseManager | None:
+    """設定に基づいて共有のJobLeaseManagerを生成・取得する。無効な場合はNoneを返す。"""
+    settings = get_settings()
+    if not settings.job_lease_enabled:
+        return None
+    return JobLeaseManager(
+        db_client=get_firestore_client(),
+        collection_name=settings.firestore_collection,
+        ttl_seconds=settings.job_lease_ttl_seconds,
+        renew_interval_seconds=settings.job_lease_renew_interval_seconds,
+    )
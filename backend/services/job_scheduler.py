@@ -0,0 +1,205 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+logger = get_logger(__name__)
+
+_metrics = get_metrics_registry()
+_QUEUE_LENGTH = _metrics.gauge(
+    "coco_job_queue_length", "実行待ちのジョブ数（スケジューラのキュー長）"
+)
+_IN_FLIGHT = _metrics.gauge("coco_jobs_in_flight", "実行中のジョブ数")
+_SUBMITTED = _metrics.counter(
+    "coco_jobs_submitted_total", "スケジューラが受け付けたジョブ数"
+)
+_REJECTED = _metrics.counter(
+    "coco_jobs_rejected_total", "スケジューラが受付を拒否したジョブ数", ["reason"]
+)
+
+
+class JobRejectedError(Exception):
+    """
+    スケジューラがジョブを受け付けられない場合に送出される例外。
+    `reason` は "queue_full"（キューが満杯）または "shutting_down"（停止処理中）。
+    """
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"Job rejected: {reason}")
+
+
+class JobScheduler:
+    """
+    同時実行数の上限と有界キューを持つ、インプロセスのジョブスケジューラ。
+
+    固定数のワーカータスクがキューからジョブを取り出して実行する。
+    キューが満杯の場合は `JobRejectedError` を送出し、呼び出し元（/invoke）が
+    429/503を返すことでEventarcにイベントを再配信させる。
+    受け付けたジョブはACK済みのため、再配信されない。
+    停止時に実行できなかったジョブは `on_abandoned` に渡し、再開できる状態で記録させる。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue_size: int,
+        on_abandoned: Callable[[str], Awaitable[None]] | None = None,
+    ):
+        self._max_concurrency = max_concurrency
+        self._on_abandoned = on_abandoned
+        self._queue: asyncio.Queue[tuple[str, Callable[..., Awaitable[Any]], tuple]] = (
+            asyncio.Queue(maxsize=max_queue_size)
+        )
+        self._workers: list[asyncio.Task] = []
+        self._in_flight = 0
+        self._accepting = False
+
+    @property
+    def queue_length(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def start(self) -> None:
+        """ワーカータスクを起動し、ジョブの受付を開始する。"""
+        if self._workers:
+            return
+        self._accepting = True
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(self._max_concurrency)
+        ]
+        logger.info(
+            "JobScheduler started (max_concurrency=%d, max_queue_size=%d)",
+            self._max_concurrency,
+            self._queue.maxsize,
+        )
+
+    def submit(
+        self, job_id: str, fn: Callable[..., Awaitable[Any]], *args: Any
+    ) -> None:
+        """
+        ジョブをキューに投入する。
+
+        Raises:
+            JobRejectedError: 停止処理中、またはキューが満杯の場合。
+        """
+        if not self._accepting:
+            _REJECTED.inc(reason="shutting_down")
+            raise JobRejectedError("shutting_down")
+        try:
+            self._queue.put_nowait((job_id, fn, args))
+        except asyncio.QueueFull:
+            _REJECTED.inc(reason="queue_full")
+            logger.warning(f"[{job_id}] ジョブキューが満杯のため受付を拒否しました。")
+            raise JobRejectedError("queue_full")
+        _SUBMITTED.inc()
+        _QUEUE_LENGTH.set(self._queue.qsize())
+
+    def submit_many(
+        self, jobs: list[tuple[str, Callable[..., Awaitable[Any]], tuple]]
+    ) -> list[str | None]:
+        """
+        複数のジョブを投入順にキューに投入する。
+        ジョブごとに、受け付けた場合は None、拒否した場合はその理由
+        （"queue_full" または "shutting_down"）を返す。キューが満杯になった時点で、
+        残りのジョブはすべて拒否する。
+        """
+        if not self._accepting:
+            _REJECTED.inc(len(jobs), reason="shutting_down")
+            return ["shutting_down"] * len(jobs)
+
+        results: list[str | None] = []
+        for job_id, fn, args in jobs:
+            try:
+                self._queue.put_nowait((job_id, fn, args))
+            except asyncio.QueueFull:
+                break
+            results.append(None)
+        accepted = len(results)
+        rejected = len(jobs) - accepted
+        if rejected:
+            _REJECTED.inc(rejected, reason="queue_full")
+            logger.warning(
+                f"ジョブキューが満杯のため、{len(jobs)}件中{rejected}件の受付を拒否しました。"
+            )
+        _SUBMITTED.inc(accepted)
+        _QUEUE_LENGTH.set(self._queue.qsize())
+        return results + ["queue_full"] * rejected
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, fn, args = await self._queue.get()
+            _QUEUE_LENGTH.set(self._queue.qsize())
+            self._in_flight += 1
+            _IN_FLIGHT.set(self._in_flight)
+            try:
+                await fn(*args)
+            except Exception as e:
+                # ジョブ内のエラー処理はジョブ自身の責務。
+                # ここではワーカーを守るためだけに捕捉する
+                logger.error(
+                    f"[{job_id}] ジョブの実行中に捕捉されない例外が発生しました: {e}",
+                    exc_info=True,
+                )
+            finally:
+                self._in_flight -= 1
+                _IN_FLIGHT.set(self._in_flight)
+                self._queue.task_done()
+
+    async def drain(self, timeout: float) -> None:
+        """
+        新規ジョブの受付を停止し、
+        キュー内と実行中のジョブの完了を最大 `timeout` 秒待つ。
+        受け付けたジョブはACK済みのため、Eventarcは再配信しない。
+        時間内に終わらなかった実行中のジョブはキャンセルする。
+        キャンセルされたジョブは、自身で再開できるエラーステータスを書き込む。
+        開始できなかったキュー内のジョブは、`on_abandoned` に渡す。
+        いずれも `/jobs/{job_id}/resume` で再実行できる。
+        """
+        self._accepting = False
+        logger.info(
+            "JobScheduler draining (queued=%d, in_flight=%d, timeout=%.1fs)",
+            self.queue_length,
+            self.in_flight,
+            timeout,
+        )
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "JobScheduler drain timed out (queued=%d, in_flight=%d)",
+                self.queue_length,
+                self.in_flight,
+            )
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        abandoned = []
+        while not self._queue.empty():
+            job_id, _, _ = self._queue.get_nowait()
+            self._queue.task_done()
+            abandoned.append(job_id)
+        _QUEUE_LENGTH.set(0)
+        if abandoned:
+            logger.warning(
+                "JobScheduler abandoned %d queued jobs: %s",
+                len(abandoned),
+                ", ".join(abandoned),
+            )
+        if self._on_abandoned is not None:
+            for job_id in abandoned:
+                try:
+                    await self._on_abandoned(job_id)
+                except Exception as e:
+                    logger.error(
+                        f"[{job_id}] 実行できなかったジョブの記録に失敗しました: {e}"
+                    )
+        logger.info("JobScheduler stopped.")
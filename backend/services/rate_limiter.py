@@ -0,0 +1,313 @@
+import asyncio
+import random
+import time
+from collections import deque
+from functools import lru_cache
+from typing import AsyncGenerator, Awaitable, Callable, TypeVar
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.api_core import exceptions as google_exceptions
+from google.genai import errors as genai_errors
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+from config import get_settings
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+_metrics = get_metrics_registry()
+_RATE_LIMIT = _metrics.gauge(
+    "coco_backend_rate_limit",
+    "バックエンドごとの現在のリクエスト数の上限（1分あたり、0は無制限）",
+    ("backend",),
+)
+_THROTTLED_SECONDS = _metrics.counter(
+    "coco_backend_throttled_seconds_total",
+    "レート制限とクォータ超過後のバックオフのために、バックエンドの呼び出しを待った延べ秒数",
+    ("backend",),
+)
+_QUOTA_ERRORS = _metrics.counter(
+    "coco_backend_quota_errors_total",
+    "バックエンドがクォータ超過（429/RESOURCE_EXHAUSTED）を返した回数",
+    ("backend",),
+)
+_QUOTA_GIVE_UPS = _metrics.counter(
+    "coco_backend_quota_give_ups_total",
+    "クォータ超過が続き、待機の上限を超えたため失敗させた呼び出しの数",
+    ("backend",),
+)
+
+# 上限を下げる際の下限（1分あたり1リクエスト）
+_MIN_RATE = 1 / 60
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    """例外がクォータ超過（HTTP 429 / gRPC RESOURCE_EXHAUSTED）によるものか判定する。"""
+    if isinstance(exc, google_exceptions.TooManyRequests):
+        # ResourceExhausted は TooManyRequests のサブクラス
+        return True
+    return isinstance(exc, genai_errors.APIError) and exc.code == 429
+
+
+class BackendRateLimiter:
+    """
+    1つのバックエンドへの呼び出しを、インスタンス内のすべてのジョブで共有する上限に収めるレートリミッター。
+
+    トークンバケットでリクエストの送信間隔を制御し、上限はAIMDで調整する。
+    クォータ超過を受け取ると、上限を `decrease_factor` 倍に下げる。
+    同時に、バックエンドへの呼び出し全体を指数バックオフの間止めてから再試行する。
+    その後は成功するたびに、`recovery_seconds` かけて元の上限まで線形に戻す。
+    上限を設定しない場合は、クォータ超過を検知するまでは無制限に送り、
+    検知した時点で直近 `window_seconds` 秒間に観測したリクエスト数を基準に上限を設ける。
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        requests_per_minute: float,
+        burst: int,
+        decrease_factor: float,
+        recovery_seconds: float,
+        initial_backoff_seconds: float,
+        max_backoff_seconds: float,
+        max_wait_seconds: float,
+        window_seconds: float = 60.0,
+    ):
+        self.backend = backend
+        self._ceiling = requests_per_minute / 60 if requests_per_minute > 0 else None
+        # 現在の上限（1秒あたり、None は無制限）と、上限を下げる直前の値
+        self._rate = self._ceiling
+        self._peak = self._ceiling
+        self._burst = max(1, burst)
+        self._decrease_factor = decrease_factor
+        self._recovery_seconds = max(recovery_seconds, 1e-3)
+        self._initial_backoff = initial_backoff_seconds
+        self._max_backoff = max_backoff_seconds
+        self._max_wait = max_wait_seconds
+        self._window = window_seconds
+
+        self._tokens = float(self._burst)
+        now = time.monotonic()
+        self._refilled_at = now
+        self._adjusted_at = now
+        self._decreased_at = float("-inf")
+        self._backoff_until = 0.0
+        self._consecutive_errors = 0
+        self._issued: deque[float] = deque()
+        # 待っている呼び出しに到着順でトークンを割り当てる
+        self._lock = asyncio.Lock()
+        self._publish()
+
+    @property
+    def requests_per_minute(self) -> float | None:
+        """現在の上限（1分あたり）。無制限の場合は None。"""
+        return self._rate * 60 if self._rate is not None else None
+
+    def _publish(self) -> None:
+        _RATE_LIMIT.set(self.requests_per_minute or 0.0, backend=self.backend)
+
+    def _refill(self, now: float) -> None:
+        if self._rate is not None:
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._refilled_at) * self._rate
+            )
+        self._refilled_at = now
+
+    def _observed_rate(self, now: float) -> float:
+        """
+        直近 `window_seconds` 秒間に送ったリクエストの速度（1秒あたり）。
+        送り始めてから `window_seconds` 秒経っていない場合は、実際に観測した期間で割る。
+        観測期間の下限は1秒とする。
+        これにより、起動直後のバーストの後に上限を実際より低く見積もらない。
+        """
+        while self._issued and self._issued[0] < now - self._window:
+            self._issued.popleft()
+        if not self._issued:
+            return 0.0
+        observed = min(self._window, max(1.0, now - self._issued[0]))
+        return len(self._issued) / observed
+
+    async def _acquire(self) -> float:
+        """トークンを1つ取得し、呼び出しを送る時刻を返す。バックオフ中はその終了も待つ。"""
+        started_at = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._backoff_until:
+                    await asyncio.sleep(self._backoff_until - now)
+                    continue
+                self._refill(now)
+                if self._rate is None:
+                    break
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+            issued_at = time.monotonic()
+            self._issued.append(issued_at)
+        waited = issued_at - started_at
+        if waited > 0:
+            _THROTTLED_SECONDS.inc(waited, backend=self.backend)
+        return issued_at
+
+    def try_acquire(self) -> bool:
+        """
+        待たずにトークンを取得できる場合だけ取得してTrueを返す。
+        バックオフ中や、トークンが足りない場合、他の呼び出しがトークンを待っている場合は
+        Falseを返す。ヘッジの2つ目のリクエストなど、省略できる呼び出しに使う。
+        """
+        if self._lock.locked():
+            return False
+        now = time.monotonic()
+        if now < self._backoff_until:
+            return False
+        self._refill(now)
+        if self._rate is not None:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+        self._issued.append(now)
+        return True
+
+    def _on_quota_error(self, issued_at: float) -> float:
+        """上限を下げてバックオフを開始し、バックオフの秒数を返す。"""
+        _QUOTA_ERRORS.inc(backend=self.backend)
+        now = time.monotonic()
+        if issued_at < self._decreased_at:
+            # 前回上限を下げる前に送った呼び出しの失敗。同じ超過で何度も下げないよう、
+            # 待つだけにする
+            return max(0.0, self._backoff_until - now)
+
+        self._refill(now)
+        base = self._rate if self._rate is not None else self._observed_rate(now)
+        self._peak = self._ceiling or max(base, _MIN_RATE)
+        self._rate = max(_MIN_RATE, base * self._decrease_factor)
+        self._tokens = min(self._tokens, 0.0)
+        self._decreased_at = now
+        self._adjusted_at = now
+
+        self._consecutive_errors += 1
+        backoff = min(
+            self._max_backoff,
+            self._initial_backoff * 2 ** (self._consecutive_errors - 1),
+        ) * random.uniform(0.5, 1.0)
+        self._backoff_until = max(self._backoff_until, now + backoff)
+        self._publish()
+        return backoff
+
+    def _on_success(self) -> None:
+        """上限を線形に戻す。上限を設定していない場合は、元の水準まで戻った時点で制限を外す。"""
+        self._consecutive_errors = 0
+        if self._rate is None:
+            return
+        now = time.monotonic()
+        self._refill(now)
+        self._rate += self._peak * (now - self._adjusted_at) / self._recovery_seconds
+        self._adjusted_at = now
+        if self._rate >= self._peak:
+            self._rate = self._ceiling
+        self._publish()
+
+    async def call(
+        self, fn: Callable[[], Awaitable[T]], job_id: str | None = None
+    ) -> T:
+        """
+        上限の範囲内で `fn` を呼び出す。クォータ超過の場合はバックオフの後に再試行し、
+        待機の合計が `max_wait_seconds` を超える場合はその例外を送出する。
+        `fn` は呼び出しのたびに新しいコルーチンを返す関数を渡す。
+        """
+        deadline = time.monotonic() + self._max_wait
+        prefix = f"[{job_id}] " if job_id else ""
+        while True:
+            issued_at = await self._acquire()
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_quota_error(e):
+                    raise
+                backoff = self._on_quota_error(issued_at)
+                if time.monotonic() + backoff > deadline:
+                    _QUOTA_GIVE_UPS.inc(backend=self.backend)
+                    logger.error(
+                        f"{prefix}{self.backend} のクォータ超過が続いたため、"
+                        f"呼び出しを中止します: {e}"
+                    )
+                    raise
+                limit = self.requests_per_minute
+                logger.warning(
+                    f"{prefix}{self.backend} のクォータを超過したため、"
+                    f"{backoff:.1f}秒後に再試行します"
+                    f"（上限: {'無制限' if limit is None else f'{limit:.1f}回/分'}）。"
+                )
+                continue
+            self._on_success()
+            return result
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(backend: str) -> BackendRateLimiter:
+    """
+    設定に基づいて、バックエンド（speech, gemini, imagen, tts）ごとに
+    共有のBackendRateLimiterを生成・取得する。
+    """
+    settings = get_settings()
+    return BackendRateLimiter(
+        backend=backend,
+        requests_per_minute=getattr(settings, f"{backend}_requests_per_minute"),
+        burst=settings.rate_limit_burst,
+        decrease_factor=settings.rate_limit_decrease_factor,
+        recovery_seconds=settings.rate_limit_recovery_seconds,
+        initial_backoff_seconds=settings.rate_limit_initial_backoff_seconds,
+        max_backoff_seconds=settings.rate_limit_max_backoff_seconds,
+        max_wait_seconds=settings.rate_limit_max_wait_seconds,
+        window_seconds=settings.rate_limit_window_seconds,
+    )
+
+
+class RateLimitedLlm(BaseLlm):
+    """
+    Geminiへの呼び出しを `gemini` のレートリミッターに通すLLMのラッパー。
+    ADKのLlmAgentはモデルの呼び出しを内部で行うため、モデル自体を包んで制御する。
+    クォータ超過による再試行は、最初のレスポンスを受け取る前の失敗に限る。
+    リクエストにタイムアウト（`http_options.timeout`）が指定されている場合は、
+    レート制限の待ち時間を含めて、レスポンスの受信全体をその時間内に打ち切る。
+    """
+
+    llm: BaseLlm
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        async def open_response() -> tuple[AsyncGenerator, LlmResponse | None]:
+            responses = self.llm.generate_content_async(llm_request, stream=stream)
+            try:
+                return responses, await anext(responses)
+            except StopAsyncIteration:
+                return responses, None
+            except BaseException:
+                await responses.aclose()
+                raise
+
+        http_options = llm_request.config.http_options if llm_request.config else None
+        deadline = None
+        if http_options and http_options.timeout:
+            deadline = asyncio.get_running_loop().time() + http_options.timeout / 1000
+
+        # タイムアウトはyieldをまたがないよう、レスポンスを1つ受け取るごとに設定する
+        async with asyncio.timeout_at(deadline):
+            responses, first = await get_rate_limiter("gemini").call(open_response)
+        if first is None:
+            return
+        yield first
+        try:
+            while True:
+                async with asyncio.timeout_at(deadline):
+                    try:
+                        response = await anext(responses)
+                    except StopAsyncIteration:
+                        return
+                yield response
+        finally:
+            await responses.aclose()
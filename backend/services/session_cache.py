@@ -0,0 +1,100 @@
+import copy
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from google.adk.sessions import Session
+from services.metrics_service import get_metrics_registry
+
+_metrics = get_metrics_registry()
+_CACHE_HITS = _metrics.counter(
+    "coco_session_cache_hits_total", "セッションキャッシュから返したget_sessionの回数"
+)
+_CACHE_MISSES = _metrics.counter(
+    "coco_session_cache_misses_total", "Firestoreから読み込んだget_sessionの回数"
+)
+_CACHE_EVICTIONS = _metrics.counter(
+    "coco_session_cache_evictions_total",
+    "セッションキャッシュから破棄されたエントリ数",
+    ["reason"],
+)
+
+
+@dataclass
+class _Entry:
+    session: Session
+    expires_at: float
+
+
+class SessionCache:
+    """
+    FirestoreSessionService のインスタンスごとに持つ、
+    ライトスルーのセッションキャッシュ。
+
+    セッションIDをキーにLRUで保持し、`ttl_seconds` を過ぎたエントリは破棄する。
+    書き込みは常にFirestoreに反映した上でキャッシュにも適用されるため、
+    同じインスタンス内のジョブからの読み取りはFirestoreにアクセスせずに済む。
+    `last_update_time` が古いセッションでキャッシュを上書きすることはない。
+    呼び出し元による変更がキャッシュに波及しないよう、出し入れの際はコピーを使う。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, session_id: str) -> Session | None:
+        """キャッシュされたセッションのコピーを返す。ない場合や期限切れの場合はNone。"""
+        entry = self._entries.get(session_id)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            del self._entries[session_id]
+            _CACHE_EVICTIONS.inc(reason="expired")
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            _CACHE_MISSES.inc()
+            return None
+
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        _CACHE_HITS.inc()
+        return entry.session.model_copy(deep=True)
+
+    def put(self, session: Session) -> None:
+        """セッションをキャッシュする。キャッシュ済みのものより古い場合は無視する。"""
+        current = self._entries.get(session.id)
+        if current is not None and (
+            current.session.last_update_time > session.last_update_time
+        ):
+            return
+
+        self._entries[session.id] = _Entry(
+            session=session.model_copy(deep=True),
+            expires_at=time.monotonic() + self._ttl,
+        )
+        self._entries.move_to_end(session.id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            _CACHE_EVICTIONS.inc(reason="capacity")
+
+    def apply_state_delta(
+        self, session_id: str, state_delta: dict[str, Any], last_update_time: float
+    ) -> None:
+        """Firestoreに書き込んだstate_deltaを、キャッシュ済みのセッションにも適用する。"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        entry.session.state.update(copy.deepcopy(state_delta))
+        entry.session.last_update_time = max(
+            entry.session.last_update_time, last_update_time
+        )
+
+    def invalidate(self, session_id: str) -> None:
+        self._entries.pop(session_id, None)
@@ -7,6 +7,7 @@ from services.logging_service import get_logger
 from config import get_settings
 
 from .firestore_session_service import FirestoreSessionService
+from .session_cache import SessionCache
 
 settings = get_settings()
 logger = get_logger(__name__)
@@ -37,8 +38,19 @@ def create_session_service(db_client: AsyncClient | None = None) -> BaseSessionS
     if session_type == "firestore":
         logger.info("ADKセッションにFirestoreSessionServiceを使用します。")
         # Use a dedicated collection for ADK sessions to keep them separate.
+        cache = (
+            SessionCache(
+                max_entries=settings.session_cache_max_entries,
+                ttl_seconds=settings.session_cache_ttl_seconds,
+            )
+            if settings.session_cache_max_entries > 0
+            else None
+        )
         return FirestoreSessionService(
-            db_client=db_client or get_db_client(), collection_name="adk_sessions"
+            db_client=db_client or get_db_client(),
+            collection_name="adk_sessions",
+            lean_writes=settings.firestore_session_lean_writes,
+            cache=cache,
         )
 
     raise ValueError(f"Unsupported session service type: {session_type}")
@@ -0,0 +1,111 @@
+from functools import lru_cache
+from typing import Any
+
+from models.agent_models import ExplanationOutput, IllustrationResult, NarrationResult
+from pydantic import ValidationError
+from services.logging_service import get_logger
+from services.storage_service import get_storage_service
+
+logger = get_logger(__name__)
+
+# 各ステージが完了時にセッション状態に保存する成果物のキー
+STAGE_OUTPUT_KEYS = {
+    "TranscriberAgent": "transcribed_text",
+    "ExplainerAgent": "explanation_data",
+    "IllustratorAgent": "illustration",
+    "NarratorAgent": "narration",
+}
+
+# 各ステージが入力として使用する成果物を生成するステージ
+STAGE_DEPENDENCIES = {
+    "TranscriberAgent": (),
+    "ExplainerAgent": ("TranscriberAgent",),
+    "IllustratorAgent": ("ExplainerAgent",),
+    "NarratorAgent": ("ExplainerAgent",),
+}
+
+
+async def _blob_exists(gcs_uri: str) -> bool:
+    return await get_storage_service().get_blob_size(gcs_uri) > 0
+
+
+async def validate_stage_output(stage: str, value: Any) -> str | None:
+    """
+    セッション状態に保存されたステージの成果物を検証する。
+    再利用できる場合は None、できない場合はその理由を返す。
+    イラストと音声は、参照先のファイルが残っていることも確認する。
+    """
+    if not value:
+        return "成果物がありません"
+    try:
+        if stage == "TranscriberAgent":
+            if not isinstance(value, str) or not value.strip():
+                return "書き起こしテキストが空です"
+        elif stage == "ExplainerAgent":
+            ExplanationOutput.model_validate(value)
+        elif stage == "IllustratorAgent":
+            illustration = IllustrationResult.model_validate(value)
+            if not await _blob_exists(illustration.image_gcs_path):
+                return f"画像 {illustration.image_gcs_path} が見つかりません"
+        elif stage == "NarratorAgent":
+            narration = NarrationResult.model_validate(value)
+            if not await _blob_exists(narration.final_audio_gcs_path):
+                return f"音声 {narration.final_audio_gcs_path} が見つかりません"
+    except ValidationError as e:
+        return f"成果物の形式が不正です: {e.error_count()}件のエラー"
+    except Exception as e:
+        return f"成果物を確認できませんでした: {e}"
+    return None
+
+
+class StageCheckpoints:
+    """
+    ジョブの実行中に、今回の実行で成果物を（再）生成したステージを記録する。
+
+    セッション状態に保存済みの成果物は、それ自体が有効でも、入力となった上流のステージを
+    今回生成し直した場合は古い入力から作られたものになるため再利用できない。
+    記録は実行中のインスタンスのメモリにのみ保持し、ジョブの終了時に破棄する。
+    """
+
+    def __init__(self):
+        self._regenerated: dict[str, set[str]] = {}
+
+    def mark_regenerated(self, job_id: str, stage: str) -> None:
+        self._regenerated.setdefault(job_id, set()).add(stage)
+
+    def upstream_regenerated(self, job_id: str, stage: str) -> bool:
+        """ステージの入力となる上流のステージを、今回の実行で生成し直したかどうか。"""
+        regenerated = self._regenerated.get(job_id, set())
+        return any(dep in regenerated for dep in STAGE_DEPENDENCIES.get(stage, ()))
+
+    async def reusable_output(self, job_id: str, stage: str, state: dict) -> bool:
+        """
+        保存済みの成果物を再利用してステージをスキップできるかどうかを判定する。
+        再利用できない場合は、ステージを生成し直すものとして記録する。
+        """
+        output_key = STAGE_OUTPUT_KEYS[stage]
+        value = state.get(output_key)
+        if self.upstream_regenerated(job_id, stage):
+            reason = "上流のステージを生成し直しました"
+        else:
+            reason = await validate_stage_output(stage, value)
+        if reason is None:
+            return True
+
+        self.mark_regenerated(job_id, stage)
+        if value:
+            logger.info(
+                f"[{job_id}] 保存済みの '{output_key}' を再利用できないため、"
+                f"エージェント '{stage}' を再実行します: {reason}"
+            )
+        return False
+
+    def discard(self, job_id: str) -> None:
+        """ジョブの記録を破棄する。ジョブの終了時に呼び出す。"""
+        self._regenerated.pop(job_id, None)
+
+
+@lru_cache
+def get_stage_checkpoints() -> StageCheckpoints:
+    """プロセス全体で共有するStageCheckpointsを取得する。"""
+    return StageCheckpoints()
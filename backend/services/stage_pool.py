@@ -0,0 +1,174 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from enum import Enum
+from functools import lru_cache
+from typing import AsyncIterator
+
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+
+from config import get_settings
+
+logger = get_logger(__name__)
+
+_metrics = get_metrics_registry()
+_STAGE_WAIT_SECONDS = _metrics.histogram(
+    "coco_stage_wait_seconds",
+    "ジョブがステージのワーカーの空きを待った秒数",
+    ("stage",),
+)
+_STAGE_BUSY_SECONDS = _metrics.counter(
+    "coco_stage_busy_seconds_total",
+    "ステージのワーカーが処理に使った延べ秒数（増加率をワーカー数で割ると平均の使用率になる）",
+    ("stage",),
+)
+
+
+class PipelineStage(str, Enum):
+    """外部バックエンドごとに同時実行数を制御する、パイプラインのステージを定義するEnum"""
+
+    # Speech-to-Text
+    transcribe = "transcribe"
+    # Gemini
+    explain = "explain"
+    # Imagen
+    illustrate = "illustrate"
+    # Text-to-Speech
+    narrate = "narrate"
+    # Firestore（最終結果の書き込み）
+    write = "write"
+
+
+# 同期APIクライアントを共有のスレッドプール（BlockingCallExecutor）で呼び出すステージ
+BLOCKING_STAGES = (
+    PipelineStage.transcribe,
+    PipelineStage.illustrate,
+    PipelineStage.narrate,
+)
+
+
+class StagePool:
+    """
+    1つのステージのワーカー数の上限と、空きを待つジョブの待ち行列。
+    ワーカーの空きは到着順に割り当てる。
+    """
+
+    def __init__(self, stage: PipelineStage, workers: int):
+        self.stage = stage
+        self.workers = workers
+        self._semaphore = asyncio.Semaphore(workers)
+        self._waiting = 0
+        self._busy = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """ワーカーの空きを待って確保し、ブロックを抜けるまで保持する。"""
+        self._waiting += 1
+        started_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        _STAGE_WAIT_SECONDS.observe(
+            time.perf_counter() - started_at, stage=self.stage.value
+        )
+
+        self._busy += 1
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._busy -= 1
+            _STAGE_BUSY_SECONDS.inc(
+                time.perf_counter() - started_at, stage=self.stage.value
+            )
+            self._semaphore.release()
+
+    def stats(self) -> dict[str, int]:
+        """空きを待っているジョブ数、処理中のワーカー数、ワーカー数の上限を返す。"""
+        return {
+            "queue_length": self._waiting,
+            "busy": self._busy,
+            "workers": self.workers,
+        }
+
+
+class StagePools:
+    """
+    ステージごとに独立したワーカー数の上限を持つ、ステージ単位のパイプライン実行。
+
+    ジョブスケジューラはジョブ全体の同時実行数（処理中のジョブの窓）だけを制限し、
+    各ステージはそれぞれのバックエンドに合った数のワーカーで処理する。ジョブはステージ間の
+    待ち行列を順に進むため、あるジョブがイラストを生成している間に別のジョブの文字起こしや
+    解説生成が進み、遅いImagenの呼び出しがSpeechやGeminiの処理枠を占有することはない。
+    """
+
+    def __init__(self, workers: dict[PipelineStage, int]):
+        self._pools = {
+            stage: StagePool(stage, max(1, count)) for stage, count in workers.items()
+        }
+
+    def slot(self, stage: PipelineStage):
+        """指定したステージのワーカーを確保する非同期コンテキストマネージャを返す。"""
+        return self._pools[stage].slot()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """ステージごとの待ち行列の長さと処理中のワーカー数を返す。"""
+        return {stage.value: pool.stats() for stage, pool in self._pools.items()}
+
+
+def _stage_values(stats: dict[str, dict[str, int]], key: str) -> dict:
+    return {(stage,): float(values[key]) for stage, values in stats.items()}
+
+
+@lru_cache
+def get_stage_pools() -> StagePools:
+    """設定に基づいて共有のStagePoolsを生成・取得する。"""
+    settings = get_settings()
+    workers = {
+        PipelineStage.transcribe: settings.stage_transcribe_workers,
+        PipelineStage.explain: settings.stage_explain_workers,
+        PipelineStage.illustrate: settings.stage_illustrate_workers,
+        PipelineStage.narrate: settings.stage_narrate_workers,
+        PipelineStage.write: settings.stage_write_workers,
+    }
+    pools = StagePools(workers)
+
+    # 同期APIを呼び出すステージのワーカーが共有のスレッドを使い切ると、
+    # ステージごとに上限を分けても遅いステージが他のステージを待たせてしまう
+    blocking_workers = sum(workers[stage] for stage in BLOCKING_STAGES)
+    if blocking_workers > settings.blocking_executor_max_workers:
+        logger.warning(
+            "Blocking stages have %d workers in total, more than "
+            "blocking_executor_max_workers=%d",
+            blocking_workers,
+            settings.blocking_executor_max_workers,
+        )
+
+    _metrics.gauge(
+        "coco_stage_queue_length",
+        "ステージのワーカーの空きを待っているジョブ数",
+        ("stage",),
+        function=lambda: _stage_values(pools.stats(), "queue_length"),
+    )
+    _metrics.gauge(
+        "coco_stage_busy_workers",
+        "ステージで処理中のワーカー数",
+        ("stage",),
+        function=lambda: _stage_values(pools.stats(), "busy"),
+    )
+    _metrics.gauge(
+        "coco_stage_utilization",
+        "ステージのワーカーの使用率（処理中のワーカー数 / ワーカー数の上限）",
+        ("stage",),
+        function=lambda: {
+            (stage,): values["busy"] / values["workers"]
+            for stage, values in pools.stats().items()
+        },
+    )
+    logger.info(
+        "StagePools created (%s)",
+        ", ".join(f"{stage.value}={count}" for stage, count in workers.items()),
+    )
+    return pools
@@ -0,0 +1,97 @@
+import importlib
+import os
+import sys
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from types import ModuleType
+from typing import Any, Iterator
+
+
+def _process_uptime() -> float | None:
+    """
+    プロセスが起動してからの経過秒数を返す（Linuxのみ）。
+    インタプリタの起動やこのモジュールより前のimportにかかった時間も含めるために使う。
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # 2番目のフィールド（コマンド名）は空白を含みうるため、
+            # 最後の ')' 以降を分割する
+            fields = f.read().rpartition(")")[2].split()
+        with open("/proc/uptime") as f:
+            system_uptime = float(f.read().split()[0])
+        # starttime は22番目のフィールド（')' 以降では20番目）で、単位はクロックティック
+        started_at = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return system_uptime - started_at
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    """
+    インスタンスの起動処理の内訳を記録する。
+
+    起動フェーズ（import、パイプラインの構築など）ごとの所要時間と、
+    遅延importしたモジュールごとのimport時間を記録し、`/startup-profile` で公開する。
+    時刻はこのモジュールが最初にimportされた時点（またはプロセスの起動時点）を基準とする。
+    """
+
+    def __init__(self):
+        self._started_at = time.perf_counter()
+        uptime = _process_uptime()
+        # プロセスの起動からこのモジュールのimportまでの時間（取得できない場合は0）
+        self._offset = uptime if uptime is not None else 0.0
+        self._phases: dict[str, float] = {}
+        self._imports: dict[str, float] = {}
+        self._marks: dict[str, float] = {}
+        self._errors: dict[str, str] = {}
+
+    def elapsed(self) -> float:
+        """プロセスの起動からの経過秒数。"""
+        return self._offset + time.perf_counter() - self._started_at
+
+    def mark(self, name: str) -> None:
+        """起動処理の節目（リクエストの受付開始など）の時刻を記録する。最初の記録のみ保持する。"""
+        self._marks.setdefault(name, self.elapsed())
+
+    def fail(self, name: str, error: BaseException) -> None:
+        """起動処理 `name` の失敗を、その時刻とエラー内容とともに記録する。"""
+        self.mark(f"{name}_failed")
+        self._errors[name] = f"{type(error).__name__}: {error}"
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """ブロック内の処理を、起動フェーズ `name` の所要時間として記録する。"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases[name] = time.perf_counter() - started_at
+
+    def import_module(self, name: str) -> ModuleType:
+        """
+        モジュールをimportし、その所要時間を記録する。
+        すでにimport済みのモジュールは記録しない（他のモジュールのimportに含まれていたため）。
+        """
+        if name in sys.modules:
+            return sys.modules[name]
+        started_at = time.perf_counter()
+        module = importlib.import_module(name)
+        self._imports[name] = time.perf_counter() - started_at
+        return module
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "uptime_seconds": round(self.elapsed(), 4),
+            "profile_started_at_seconds": round(self._offset, 4),
+            "marks": {name: round(value, 4) for name, value in self._marks.items()},
+            "phases": {name: round(value, 4) for name, value in self._phases.items()},
+            "imports": {name: round(value, 4) for name, value in self._imports.items()},
+            "errors": dict(self._errors),
+        }
+
+
+@lru_cache
+def get_startup_profile() -> StartupProfile:
+    """プロセス全体で共有するStartupProfileを取得する。"""
+    return StartupProfile()
@@ -1,22 +1,70 @@
-import asyncio
 import logging
+import os
+import shutil
 import ssl
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Iterator, TypeVar
 
 import requests
+from dependencies import get_client_registry
+from google.api_core import exceptions as google_exceptions
 from google.cloud import storage
+from services.blocking_executor import BlockingCallExecutor
 from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
 from tenacity import (
+    AsyncRetrying,
+    RetryCallState,
     before_sleep_log,
-    retry,
     retry_if_exception,
     stop_after_attempt,
-    wait_exponential,
+    stop_after_delay,
+    wait_random_exponential,
 )
 from urllib3.exceptions import SSLError as UrllibSSLError
 
-storage_client = storage.Client()
+from config import StorageBackendType, get_settings
+
 logger = get_logger(__name__)
 
+T = TypeVar("T")
+
+_metrics = get_metrics_registry()
+_OPERATION_SECONDS = _metrics.histogram(
+    "coco_storage_operation_seconds",
+    "ストレージ操作ごとの処理時間（リトライを含む）",
+    ["backend", "operation"],
+)
+_OPERATION_ERRORS = _metrics.counter(
+    "coco_storage_operation_errors_total",
+    "リトライしても失敗したストレージ操作の数",
+    ["backend", "operation"],
+)
+_RETRIES = _metrics.counter(
+    "coco_storage_operation_retries_total",
+    "一時的なエラーによりリトライしたストレージ操作の回数",
+    ["backend", "operation"],
+)
+
+# GCSの再開可能アップロードのチャンクサイズは256KiBの倍数である必要がある
+_RESUMABLE_CHUNK_ALIGNMENT = 256 * 1024
+
+# リトライ対象とする一時的なエラー
+_TRANSIENT_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
 
 def is_ssl_error(exc: BaseException) -> bool:
     """
@@ -40,71 +88,442 @@ def is_ssl_error(exc: BaseException) -> bool:
     return False
 
 
-# tenacity の helper を使って RetryBase を作る
-gcs_retry_decorator = retry(
-    stop=stop_after_attempt(5),
-    wait=wait_exponential(multiplier=1, min=10, max=60),
-    retry=retry_if_exception(is_ssl_error),
-    before_sleep=before_sleep_log(logger, logging.WARNING),
-    reraise=True,
-)
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    tenacity の predicate 用。
+    SSLエラーや5xx/429など、リトライで回復しうるエラーかを判定する。
+    """
+    return is_ssl_error(exc) or isinstance(exc, _TRANSIENT_ERRORS)
+
+
+def parse_gcs_uri(gcs_uri: str) -> tuple[str, str]:
+    """GCS URI（例: 'gs://bucket-name/file-name'）をバケット名とBlob名に分解する。"""
+    bucket_name, _, blob_name = gcs_uri.removeprefix("gs://").partition("/")
+    return bucket_name, blob_name
+
+
+@dataclass
+class BlobInfo:
+    """一覧取得で返すオブジェクトのメタデータ。"""
+
+    name: str
+    size: int
+    time_created: datetime | None
+
+
+class BaseStorageBackend(ABC):
+    """
+    オブジェクトストレージの保存先の基底クラス。
+
+    メソッドはすべて同期APIで、StorageService が専用のスレッドプールで実行する。
+    オブジェクトが存在しない場合は `google.api_core.exceptions.NotFound` を送出する。
+    """
+
+    name: str
+
+    @abstractmethod
+    def upload(
+        self, bucket_name: str, blob_name: str, data: bytes, content_type: str
+    ) -> None:
+        """データをオブジェクトとして書き込む。"""
+
+    @abstractmethod
+    def copy(self, bucket_name: str, blob_name: str, new_name: str) -> None:
+        """同じバケット内でオブジェクトをコピーする。"""
+
+    @abstractmethod
+    def rename(self, bucket_name: str, blob_name: str, new_name: str) -> None:
+        """同じバケット内でオブジェクトを移動する。"""
+
+    @abstractmethod
+    def delete(self, bucket_name: str, blob_name: str) -> None:
+        """オブジェクトを削除する。"""
+
+    @abstractmethod
+    def get_size(self, bucket_name: str, blob_name: str) -> int | None:
+        """オブジェクトのサイズを返す。存在しない場合はNone。"""
+
+    @abstractmethod
+    def list(self, bucket_name: str, prefix: str) -> list[BlobInfo]:
+        """プレフィックスに一致するオブジェクトの一覧を返す。"""
+
+    @abstractmethod
+    def open_reader(self, bucket_name: str, blob_name: str, read_size: int) -> BinaryIO:
+        """オブジェクトを先頭から読み出すファイルオブジェクトを返す。"""
+
+
+class GcsStorageBackend(BaseStorageBackend):
+    """
+    Cloud Storageの保存先。クライアントは共有レジストリから取得する。
+
+    `resumable_threshold_bytes` 以上のデータは `resumable_chunk_bytes` ごとの
+    再開可能アップロードで送信し、途中で接続が切れてもデータ全体を送り直さずに済むようにする。
+    """
+
+    name = "gcs"
+
+    def __init__(self, resumable_threshold_bytes: int, resumable_chunk_bytes: int):
+        self._resumable_threshold = resumable_threshold_bytes
+        self._resumable_chunk = (
+            max(resumable_chunk_bytes // _RESUMABLE_CHUNK_ALIGNMENT, 1)
+            * _RESUMABLE_CHUNK_ALIGNMENT
+        )
+
+    @property
+    def _client(self) -> storage.Client:
+        return get_client_registry().storage
+
+    def upload(
+        self, bucket_name: str, blob_name: str, data: bytes, content_type: str
+    ) -> None:
+        blob = self._client.bucket(bucket_name).blob(blob_name)
+        if self._resumable_threshold > 0 and len(data) >= self._resumable_threshold:
+            blob.chunk_size = self._resumable_chunk
+        blob.upload_from_string(data, content_type=content_type)
+
+    def copy(self, bucket_name: str, blob_name: str, new_name: str) -> None:
+        bucket = self._client.bucket(bucket_name)
+        bucket.copy_blob(bucket.blob(blob_name), bucket, new_name)
+
+    def rename(self, bucket_name: str, blob_name: str, new_name: str) -> None:
+        bucket = self._client.bucket(bucket_name)
+        bucket.rename_blob(bucket.blob(blob_name), new_name)
+
+    def delete(self, bucket_name: str, blob_name: str) -> None:
+        self._client.bucket(bucket_name).blob(blob_name).delete()
+
+    def get_size(self, bucket_name: str, blob_name: str) -> int | None:
+        blob = self._client.bucket(bucket_name).get_blob(blob_name)
+        return (blob.size or 0) if blob is not None else None
+
+    def list(self, bucket_name: str, prefix: str) -> list[BlobInfo]:
+        return [
+            BlobInfo(
+                name=blob.name, size=blob.size or 0, time_created=blob.time_created
+            )
+            for blob in self._client.list_blobs(bucket_name, prefix=prefix)
+        ]
+
+    def open_reader(self, bucket_name: str, blob_name: str, read_size: int) -> BinaryIO:
+        blob = self._client.bucket(bucket_name).blob(blob_name)
+        return blob.open("rb", chunk_size=read_size)
+
+
+class LocalStorageBackend(BaseStorageBackend):
+    """
+    ローカルのファイルシステムを使う保存先（テストやローカル開発用）。
+    `{root_dir}/{bucket_name}/{blob_name}` にファイルとして保存し、
+    URIはGCSと同じ形式で返す。
+    """
+
+    name = "local"
+
+    def __init__(self, root_dir: str):
+        self._root = Path(root_dir)
+
+    def _path(self, bucket_name: str, blob_name: str) -> Path:
+        return self._root / bucket_name / blob_name
+
+    def _existing_path(self, bucket_name: str, blob_name: str) -> Path:
+        path = self._path(bucket_name, blob_name)
+        if not path.is_file():
+            raise google_exceptions.NotFound(
+                f"No such object: {bucket_name}/{blob_name}"
+            )
+        return path
+
+    def upload(
+        self, bucket_name: str, blob_name: str, data: bytes, content_type: str
+    ) -> None:
+        path = self._path(bucket_name, blob_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 読み込み中のファイルを壊さないよう、一時ファイルに書き込んでから置き換える
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def copy(self, bucket_name: str, blob_name: str, new_name: str) -> None:
+        source = self._existing_path(bucket_name, blob_name)
+        destination = self._path(bucket_name, new_name)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, destination)
+
+    def rename(self, bucket_name: str, blob_name: str, new_name: str) -> None:
+        source = self._existing_path(bucket_name, blob_name)
+        destination = self._path(bucket_name, new_name)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, destination)
+
+    def delete(self, bucket_name: str, blob_name: str) -> None:
+        self._existing_path(bucket_name, blob_name).unlink()
+
+    def get_size(self, bucket_name: str, blob_name: str) -> int | None:
+        path = self._path(bucket_name, blob_name)
+        return path.stat().st_size if path.is_file() else None
+
+    def list(self, bucket_name: str, prefix: str) -> list[BlobInfo]:
+        bucket_dir = self._root / bucket_name
+        if not bucket_dir.is_dir():
+            return []
+        blobs = []
+        for path in sorted(bucket_dir.rglob("*")):
+            name = path.relative_to(bucket_dir).as_posix()
+            if not path.is_file() or not name.startswith(prefix):
+                continue
+            stat = path.stat()
+            blobs.append(
+                BlobInfo(
+                    name=name,
+                    size=stat.st_size,
+                    time_created=datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+                )
+            )
+        return blobs
+
+    def open_reader(self, bucket_name: str, blob_name: str, read_size: int) -> BinaryIO:
+        return self._existing_path(bucket_name, blob_name).open("rb")
+
+
+class StorageService:
+    """
+    成果物の保存に使うオブジェクトストレージの非同期インターフェース。
+
+    保存先（GCSまたはローカル）の同期APIを、他の外部API呼び出しとは独立した専用の
+    スレッドプールで実行する。一時的なエラーはジッター付きの指数バックオフで
+    `retry_attempts` 回、最大 `retry_deadline_seconds` 秒までリトライし、
+    操作ごとの処理時間、リトライ回数、失敗数をメトリクスに記録する。
+    """
+
+    def __init__(
+        self,
+        backend: BaseStorageBackend,
+        executor: BlockingCallExecutor,
+        retry_attempts: int,
+        retry_initial_backoff_seconds: float,
+        retry_max_backoff_seconds: float,
+        retry_deadline_seconds: float,
+    ):
+        self.backend = backend
+        self._executor = executor
+        self._retry_attempts = max(retry_attempts, 1)
+        self._retry_initial_backoff = retry_initial_backoff_seconds
+        self._retry_max_backoff = retry_max_backoff_seconds
+        self._retry_deadline = retry_deadline_seconds
+
+    def _retrying(self, operation: str) -> AsyncRetrying:
+        log_retry = before_sleep_log(logger, logging.WARNING)
+
+        def before_sleep(retry_state: RetryCallState) -> None:
+            _RETRIES.inc(backend=self.backend.name, operation=operation)
+            log_retry(retry_state)
+
+        return AsyncRetrying(
+            stop=stop_after_attempt(self._retry_attempts)
+            | stop_after_delay(self._retry_deadline),
+            wait=wait_random_exponential(
+                multiplier=self._retry_initial_backoff, max=self._retry_max_backoff
+            ),
+            retry=retry_if_exception(is_transient_error),
+            before_sleep=before_sleep,
+            reraise=True,
+        )
+
+    async def _call(self, operation: str, fn: Callable[..., T], *args: Any) -> T:
+        """保存先の同期APIを専用のスレッドプールで実行し、リトライとメトリクスの記録を行う。"""
+        started_at = time.perf_counter()
+        try:
+            return await self._retrying(operation)(self._executor.run, fn, *args)
+        except Exception:
+            _OPERATION_ERRORS.inc(backend=self.backend.name, operation=operation)
+            raise
+        finally:
+            _OPERATION_SECONDS.observe(
+                time.perf_counter() - started_at,
+                backend=self.backend.name,
+                operation=operation,
+            )
+
+    async def upload_blob_from_memory(
+        self,
+        bucket_name: str,
+        destination_blob_name: str,
+        data: bytes,
+        content_type: str,
+    ) -> str:
+        """
+        メモリ上のバイトオブジェクトからバケットにデータをアップロードする。
+
+        Args:
+            bucket_name: バケットの名前。
+            destination_blob_name: バケット内のオブジェクトの希望の名前。
+            data: アップロードするデータ（バイトオブジェクト）。
+            content_type: データのコンテントタイプ（例: 'audio/mpeg'）。
+
+        Returns:
+            アップロードされたファイルのGCS URI（例: 'gs://bucket-name/file-name'）。
+        """
+        logger.info(
+            f"ファイルを {destination_blob_name} としてGCSバケット {bucket_name} にアップロードしています..."
+        )
+        await self._call(
+            "upload",
+            self.backend.upload,
+            bucket_name,
+            destination_blob_name,
+            data,
+            content_type,
+        )
+        gcs_path = f"gs://{bucket_name}/{destination_blob_name}"
+        logger.info(f"ファイルを {gcs_path} にアップロードしました。")
+        return gcs_path
+
+    async def rename_blob(self, bucket_name: str, blob_name: str, new_name: str) -> str:
+        """
+        同じバケット内でBlobの名前を変更（ファイル移動）する。
+
+        Returns:
+            名前変更後のファイルのGCS URI。
+        """
+        logger.info(
+            f"GCSバケット {bucket_name} 内で {blob_name} を {new_name} に移動しています..."
+        )
+        await self._call(
+            "rename", self.backend.rename, bucket_name, blob_name, new_name
+        )
+        logger.info(f"ファイルを {blob_name} から {new_name} に移動しました。")
+        return f"gs://{bucket_name}/{new_name}"
+
+    async def copy_blob(self, source_gcs_uri: str, destination_blob_name: str) -> str:
+        """
+        ファイルを、同じバケット内の別のパスにサーバーサイドでコピーする。
+
+        Returns:
+            コピー先のファイルのGCS URI。
+        """
+        bucket_name, blob_name = parse_gcs_uri(source_gcs_uri)
+        logger.info(
+            f"GCSバケット {bucket_name} 内で {blob_name} を {destination_blob_name} "
+            "にコピーしています..."
+        )
+        await self._call(
+            "copy", self.backend.copy, bucket_name, blob_name, destination_blob_name
+        )
+        logger.info(
+            f"ファイルを {blob_name} から {destination_blob_name} にコピーしました。"
+        )
+        return f"gs://{bucket_name}/{destination_blob_name}"
+
+    async def get_blob_size(self, gcs_uri: str) -> int:
+        """ファイルのサイズ（バイト数）を取得する。ファイルが存在しない場合は0。"""
+        size = await self._call(
+            "get_size", self.backend.get_size, *parse_gcs_uri(gcs_uri)
+        )
+        return size or 0
+
+    async def delete_blob(self, gcs_uri: str) -> None:
+        """ファイルを削除する。"""
+        await self._call("delete", self.backend.delete, *parse_gcs_uri(gcs_uri))
+        logger.info(f"ファイル {gcs_uri} を削除しました。")
+
+    async def list_blobs(self, bucket_name: str, prefix: str) -> list[BlobInfo]:
+        """プレフィックスに一致するファイルの一覧を取得する。"""
+        return await self._call("list", self.backend.list, bucket_name, prefix)
+
+    def iter_blob_chunks(
+        self,
+        bucket_name: str,
+        blob_name: str,
+        chunk_size: int,
+        read_size: int = 256 * 1024,
+    ) -> Iterator[bytes]:
+        """
+        Blobを先頭から `chunk_size` バイトずつ読み出すジェネレータ。
+        GCSへのリクエストは `read_size` バイト単位のレンジ読み込みで行う。
+        同期APIのため、イベントループ外のスレッドから利用すること。
+        """
+        started_at = time.perf_counter()
+        try:
+            with self.backend.open_reader(bucket_name, blob_name, read_size) as reader:
+                while chunk := reader.read(chunk_size):
+                    yield chunk
+        finally:
+            _OPERATION_SECONDS.observe(
+                time.perf_counter() - started_at,
+                backend=self.backend.name,
+                operation="read",
+            )
+
+    def shutdown(self) -> None:
+        """ストレージ操作用のスレッドプールを停止する。"""
+        self._executor.shutdown(wait=False)
+
+
+@lru_cache
+def get_storage_service() -> StorageService:
+    """設定に基づいて共有のStorageServiceを生成・取得する。"""
+    settings = get_settings()
+    backend: BaseStorageBackend
+    if settings.storage_backend == StorageBackendType.local:
+        backend = LocalStorageBackend(settings.storage_local_root)
+    else:
+        backend = GcsStorageBackend(
+            resumable_threshold_bytes=settings.storage_resumable_threshold_bytes,
+            resumable_chunk_bytes=settings.storage_resumable_chunk_bytes,
+        )
+    return StorageService(
+        backend=backend,
+        executor=BlockingCallExecutor(
+            max_workers=settings.storage_max_workers, name="storage"
+        ),
+        retry_attempts=settings.storage_retry_attempts,
+        retry_initial_backoff_seconds=settings.storage_retry_initial_backoff_seconds,
+        retry_max_backoff_seconds=settings.storage_retry_max_backoff_seconds,
+        retry_deadline_seconds=settings.storage_retry_deadline_seconds,
+    )
+
+
+# 既存の呼び出し元のための、共有StorageServiceへのショートカット
 
 
-@gcs_retry_decorator
 async def upload_blob_from_memory(
     bucket_name: str,
     destination_blob_name: str,
     data: bytes,
     content_type: str,
 ) -> str:
-    """
-    メモリ上のバイトオブジェクトからCloud Storageバケットにデータをアップロードする。
+    """共有StorageServiceの `upload_blob_from_memory` を呼び出す。"""
+    return await get_storage_service().upload_blob_from_memory(
+        bucket_name, destination_blob_name, data, content_type
+    )
 
-    Args:
-        bucket_name: GCSバケットの名前。
-        destination_blob_name: バケット内のオブジェクトの希望の名前。
-        data: アップロードするデータ（バイトオブジェクト）。
-        content_type: データのコンテントタイプ（例: 'audio/mpeg'）。
 
-    Returns:
-        アップロードされたファイルのGCS URI（例: 'gs://bucket-name/file-name'）。
-    """
-    logger.info(
-        f"ファイルを {destination_blob_name} としてGCSバケット {bucket_name} にアップロードしています..."
-    )
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
+async def rename_blob(bucket_name: str, blob_name: str, new_name: str) -> str:
+    """共有StorageServiceの `rename_blob` を呼び出す。"""
+    return await get_storage_service().rename_blob(bucket_name, blob_name, new_name)
 
-    # GCS クライアントは同期 API のため別スレッドで実行
-    await asyncio.to_thread(blob.upload_from_string, data, content_type=content_type)
 
-    gcs_path = f"gs://{bucket_name}/{destination_blob_name}"
-    logger.info(f"ファイルを {gcs_path} にアップロードしました。")
-    return gcs_path
+async def copy_blob(source_gcs_uri: str, destination_blob_name: str) -> str:
+    """共有StorageServiceの `copy_blob` を呼び出す。"""
+    return await get_storage_service().copy_blob(source_gcs_uri, destination_blob_name)
 
 
-@gcs_retry_decorator
-async def rename_blob(bucket_name: str, blob_name: str, new_name: str) -> str:
-    """
-    同じバケット内でBlobの名前を変更（ファイル移動）する。
+async def get_blob_size(gcs_uri: str) -> int:
+    """共有StorageServiceの `get_blob_size` を呼び出す。"""
+    return await get_storage_service().get_blob_size(gcs_uri)
 
-    Args:
-        bucket_name: GCSバケットの名前。
-        blob_name: 変更元のBlobの名前。
-        new_name: 新しいBlobの名前。
 
-    Returns:
-        名前変更後のファイルのGCS URI。
-    """
-    logger.info(
-        f"GCSバケット {bucket_name} 内で {blob_name} を {new_name} に移動しています..."
-    )
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
+async def delete_blob(gcs_uri: str) -> None:
+    """共有StorageServiceの `delete_blob` を呼び出す。"""
+    await get_storage_service().delete_blob(gcs_uri)
 
-    # 同様に別スレッドで実行
-    new_blob = await asyncio.to_thread(bucket.rename_blob, blob, new_name)
 
-    new_gcs_path = f"gs://{bucket_name}/{new_blob.name}"
-    logger.info(f"ファイルを {blob.name} から {new_blob.name} に移動しました。")
-    return new_gcs_path
+def iter_blob_chunks(
+    bucket_name: str,
+    blob_name: str,
+    chunk_size: int,
+    read_size: int = 256 * 1024,
+) -> Iterator[bytes]:
+    """共有StorageServiceの `iter_blob_chunks` を呼び出す。"""
+    return get_storage_service().iter_blob_chunks(
+        bucket_name, blob_name, chunk_size, read_size
+    )
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from google.api_core import exceptions as google_exceptions
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+from services.storage_service import get_storage_service
+
+logger = get_logger(__name__)
+
+_metrics = get_metrics_registry()
+_SWEPT = _metrics.counter(
+    "coco_temp_generations_swept_total",
+    "一時出力先に残っていたため削除されたImagenの生成画像の数",
+)
+
+# Imagenの一時出力先として使用する、生成画像バケット内のプレフィックス
+TEMP_GENERATIONS_PREFIX = "temp_generations/"
+
+
+class TempGenerationSweeper:
+    """
+    生成画像バケットの `temp_generations/` に残った画像を、定期的に削除する。
+
+    イラストを一時出力先に書き込んでから移動する方式では、移動前にジョブが失敗すると
+    画像が一時出力先に残る。作成から `max_age_seconds` 秒以上経過した画像は
+    どのジョブからも移動されないとみなして削除する。
+    """
+
+    def __init__(
+        self, bucket_name: str, interval_seconds: float, max_age_seconds: float
+    ):
+        self._bucket_name = bucket_name
+        self._interval = interval_seconds
+        self._max_age = timedelta(seconds=max_age_seconds)
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """定期的な削除を開始する。起動処理を遅らせないよう、最初の削除は1周期後に行う。"""
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(
+                self._run(), name="temp-generation-sweeper"
+            )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def sweep(self) -> int:
+        """期限を過ぎた一時出力を削除し、削除した数を返す。"""
+        cutoff = datetime.now(timezone.utc) - self._max_age
+        storage = get_storage_service()
+        swept = 0
+        for blob in await storage.list_blobs(
+            self._bucket_name, TEMP_GENERATIONS_PREFIX
+        ):
+            if blob.time_created is None or blob.time_created > cutoff:
+                continue
+            try:
+                await storage.delete_blob(f"gs://{self._bucket_name}/{blob.name}")
+            except google_exceptions.NotFound:
+                # 移動または他のインスタンスによる削除と競合した場合
+                continue
+            swept += 1
+        _SWEPT.inc(swept)
+        return swept
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                swept = await self.sweep()
+            except Exception as e:
+                logger.warning(f"一時出力先の画像の削除に失敗しました: {e}")
+                continue
+            if swept:
+                logger.info(
+                    f"一時出力先に残っていた画像を {swept} 件削除しました "
+                    f"(gs://{self._bucket_name}/{TEMP_GENERATIONS_PREFIX})"
+                )
@@ -0,0 +1,178 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterator
+
+from services.metrics_service import get_metrics_registry
+
+_metrics = get_metrics_registry()
+_AGENT_DURATION = _metrics.histogram(
+    "coco_agent_duration_seconds", "エージェント（ステージ）ごとの処理時間", ["agent"]
+)
+_AGENT_EXTERNAL_WAIT = _metrics.histogram(
+    "coco_agent_external_wait_seconds",
+    "エージェント内で外部APIの応答を待っていた時間",
+    ["agent", "backend"],
+)
+_AGENT_LOCAL_OVERHEAD = _metrics.histogram(
+    "coco_agent_local_overhead_seconds",
+    "エージェントの処理時間のうち外部API待ち以外の時間",
+    ["agent"],
+)
+_JOB_DURATION = _metrics.histogram(
+    "coco_job_duration_seconds",
+    "パイプライン全体（ジョブ単位）のエンドツーエンドの処理時間",
+)
+
+
+@dataclass
+class _StageTiming:
+    started_at: float
+    duration: float | None = None
+    external_wait: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class _JobTiming:
+    started_at: float
+    stages: dict[str, _StageTiming] = field(default_factory=dict)
+    # (stage, backend) ごとの外部API呼び出しの開始時刻
+    pending_external: dict[tuple[str, str], float] = field(default_factory=dict)
+
+
+class JobTimingTracker:
+    """
+    ジョブごと・ステージ（エージェント）ごとの処理時間を記録するトラッカー。
+
+    before/after_agent_callback からステージの開始・終了を、各エージェントから
+    外部API（Speech, Gemini, Imagen, TTS, GCS）の待ち時間を記録し、
+    Prometheusメトリクスとジョブごとの内訳の両方に反映する。
+    """
+
+    def __init__(self):
+        self._jobs: dict[str, _JobTiming] = {}
+        self._lock = threading.Lock()
+
+    def _job(self, job_id: str) -> _JobTiming:
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._jobs[job_id] = _JobTiming(started_at=time.perf_counter())
+        return job
+
+    def start_stage(self, job_id: str, stage: str) -> None:
+        """ステージの開始時刻を記録する。"""
+        with self._lock:
+            self._job(job_id).stages[stage] = _StageTiming(
+                started_at=time.perf_counter()
+            )
+
+    def end_stage(self, job_id: str, stage: str) -> float | None:
+        """ステージの終了を記録し、処理時間（秒）を返す。開始が未記録の場合はNone。"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            timing = job.stages.get(stage) if job else None
+            if timing is None:
+                return None
+            timing.duration = time.perf_counter() - timing.started_at
+            external = dict(timing.external_wait)
+
+        _AGENT_DURATION.observe(timing.duration, agent=stage)
+        for backend, seconds in external.items():
+            _AGENT_EXTERNAL_WAIT.observe(seconds, agent=stage, backend=backend)
+        _AGENT_LOCAL_OVERHEAD.observe(
+            max(timing.duration - sum(external.values()), 0.0), agent=stage
+        )
+        return timing.duration
+
+    def add_external_wait(
+        self, job_id: str, stage: str, backend: str, seconds: float
+    ) -> None:
+        """
+        ステージ内の外部API待ち時間を加算する。
+        計測を終えたジョブ（完了後に成果物を補完する処理など）の待ち時間は記録しない。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            timing = job.stages.get(stage)
+            if timing is None:
+                timing = job.stages[stage] = _StageTiming(
+                    started_at=time.perf_counter()
+                )
+            timing.external_wait[backend] = (
+                timing.external_wait.get(backend, 0.0) + seconds
+            )
+
+    def begin_external(self, job_id: str, stage: str, backend: str) -> None:
+        """コールバックなど、開始と終了が別の場所にある外部API呼び出しの開始を記録する。"""
+        with self._lock:
+            self._job(job_id).pending_external[(stage, backend)] = time.perf_counter()
+
+    def end_external(self, job_id: str, stage: str, backend: str) -> None:
+        """`begin_external` で開始した外部API呼び出しの終了を記録する。"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            started_at = (
+                job.pending_external.pop((stage, backend), None) if job else None
+            )
+        if started_at is not None:
+            self.add_external_wait(
+                job_id, stage, backend, time.perf_counter() - started_at
+            )
+
+    @contextmanager
+    def external_call(self, job_id: str, stage: str, backend: str) -> Iterator[None]:
+        """`with` ブロック内の外部API呼び出しの待ち時間を記録する。"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_external_wait(
+                job_id, stage, backend, time.perf_counter() - started_at
+            )
+
+    def finish_job(self, job_id: str) -> dict | None:
+        """
+        ジョブの計測を終了し、エンドツーエンドの処理時間をメトリクスに記録する。
+
+        Returns:
+            Firestoreのジョブドキュメントに書き込める形式のタイミング内訳。
+            ジョブが未記録の場合はNone。
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            return None
+
+        total = time.perf_counter() - job.started_at
+        _JOB_DURATION.observe(total)
+
+        stages = {}
+        for stage, timing in job.stages.items():
+            if timing.duration is None:
+                continue
+            external = sum(timing.external_wait.values())
+            stages[stage] = {
+                "durationSeconds": round(timing.duration, 4),
+                "externalWaitSeconds": round(external, 4),
+                "localOverheadSeconds": round(max(timing.duration - external, 0.0), 4),
+                "externalWaitByBackend": {
+                    backend: round(seconds, 4)
+                    for backend, seconds in timing.external_wait.items()
+                },
+            }
+        return {"totalSeconds": round(total, 4), "stages": stages}
+
+    def discard(self, job_id: str) -> None:
+        """失敗したジョブなど、完了しなかったジョブの計測データを破棄する。"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+
+@lru_cache
+def get_job_timing_tracker() -> JobTimingTracker:
+    """プロセス全体で共有するJobTimingTrackerを取得する。"""
+    return JobTimingTracker()
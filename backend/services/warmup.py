@@ -0,0 +1,200 @@
+"""
+インスタンスのウォームアップ。
+
+共有クライアントの生成に加えて、各バックエンドに副作用のないリクエストを1回ずつ送り、
+gRPC/HTTPチャネルの確立、認証トークンの取得、TLSハンドシェイクを最初のジョブより前に済ませる。
+"""
+
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable
+
+from agents.illustrator_agent.config import IMAGEN_MODEL_ID
+from agents.narrator_agent.config import VOICE_SELECTION_PARAMS
+from google.adk.models import Gemini
+from google.api_core import exceptions as google_exceptions
+from google.cloud import firestore
+from google.genai import errors as genai_errors
+from google.genai import types
+from services.blocking_executor import run_blocking
+from services.client_registry import ClientRegistry
+from services.logging_service import get_logger
+from services.metrics_service import get_metrics_registry
+from services.storage_service import get_storage_service
+
+from config import get_settings
+
+logger = get_logger(__name__)
+
+_metrics = get_metrics_registry()
+_WARMUP_SECONDS = _metrics.gauge(
+    "coco_warmup_seconds",
+    "直近のウォームアップで、バックエンドごとにクライアントの生成と最初のリクエストにかかった秒数",
+    ("backend",),
+)
+_WARMUP_FAILURES = _metrics.counter(
+    "coco_warmup_failures_total",
+    "ウォームアップのリクエストがバックエンドに到達しなかった回数",
+    ("backend",),
+)
+
+# ウォームアップで読み取る、存在しないことを前提としたドキュメントとオブジェクトの名前
+WARMUP_DOCUMENT_ID = "_warmup"
+WARMUP_BLOB_NAME = "_warmup"
+
+
+@dataclass
+class WarmupResult:
+    """1つのバックエンドのウォームアップ結果。"""
+
+    backend: str
+    seconds: float
+    # バックエンドから応答があったかどうか（権限不足などのエラー応答でも、
+    # チャネルと認証は確立している）
+    ok: bool
+    skipped: bool = False
+    detail: str | None = None
+
+
+def _reached_backend(exc: Exception) -> bool:
+    """
+    例外が、バックエンドまで到達した上でのエラー応答（4xx）かどうかを判定する。
+    認証エラーはトークンの取得に失敗しているため、到達していないものとして扱う。
+    """
+    if isinstance(exc, google_exceptions.Unauthenticated):
+        return False
+    if isinstance(exc, google_exceptions.ClientError):
+        return True
+    return isinstance(exc, genai_errors.ClientError) and exc.code != 401
+
+
+class Warmer:
+    """
+    共有クライアントごとにウォームアップ用のリクエストを送る。
+    すべてのバックエンドを並行してウォームアップし、それぞれの所要時間を報告する。
+    """
+
+    def __init__(
+        self,
+        clients: ClientRegistry,
+        db_client: firestore.AsyncClient,
+        timeout_seconds: float,
+        storage_connections: int,
+    ):
+        self._clients = clients
+        self._db_client = db_client
+        self._timeout = timeout_seconds
+        self._storage_connections = storage_connections
+        self._settings = get_settings()
+
+    async def _warm_speech(self) -> None:
+        # 文字起こしと同じロケーションのRecognizerを1件だけ一覧する
+        parent = f"projects/{self._settings.google_cloud_project}/locations/global"
+        await run_blocking(
+            lambda: self._clients.speech.list_recognizers(
+                request={"parent": parent, "page_size": 1}, timeout=self._timeout
+            )
+        )
+
+    async def _warm_tts(self) -> None:
+        await run_blocking(
+            lambda: self._clients.tts.list_voices(
+                language_code=VOICE_SELECTION_PARAMS.language_code,
+                timeout=self._timeout,
+            )
+        )
+
+    async def _warm_genai(self) -> None:
+        # イラスト生成に使うモデルのメタデータを取得する
+        config = types.GetModelConfig(
+            http_options=types.HttpOptions(timeout=int(self._timeout * 1000))
+        )
+        await run_blocking(
+            lambda: self._clients.genai.models.get(model=IMAGEN_MODEL_ID, config=config)
+        )
+
+    async def _warm_gemini(self) -> str | None:
+        llm = await run_blocking(lambda: self._clients.gemini)
+        if not isinstance(llm, Gemini):
+            return f"{type(llm).__name__} は対象外です"
+        # ADKはGeminiの呼び出しに非同期クライアントを使うため、
+        # 同じクライアントで接続する
+        api_client = await run_blocking(lambda: llm.api_client)
+        await api_client.aio.models.get(model=llm.model)
+        return None
+
+    async def _warm_firestore(self) -> None:
+        await (
+            self._db_client.collection(self._settings.firestore_collection)
+            .document(WARMUP_DOCUMENT_ID)
+            .get()
+        )
+
+    async def _warm_storage(self) -> None:
+        # 複数のリクエストを同時に送り、接続プールに複数の接続を確立しておく
+        gcs_uri = f"gs://{self._settings.generated_image_bucket}/{WARMUP_BLOB_NAME}"
+        storage_service = get_storage_service()
+        await asyncio.gather(
+            *(
+                storage_service.get_blob_size(gcs_uri)
+                for _ in range(max(1, self._storage_connections))
+            )
+        )
+
+    async def _run(
+        self,
+        backend: str,
+        warm: Callable[[], Awaitable[str | None]],
+        client_timeout: bool = False,
+    ) -> WarmupResult:
+        """
+        1つのバックエンドをウォームアップする。
+        `client_timeout` がTrueの場合は、クライアントに渡したタイムアウトで打ち切る。
+        同期クライアントはワーカースレッドで応答を待つため、`wait_for` で打ち切っても
+        スレッドは応答まで残り続ける。
+        """
+        started_at = time.perf_counter()
+        ok, skipped, detail = True, False, None
+        try:
+            warming = warm()
+            if not client_timeout:
+                warming = asyncio.wait_for(warming, timeout=self._timeout)
+            skip_reason = await warming
+            if skip_reason is not None:
+                skipped, detail = True, skip_reason
+        except asyncio.TimeoutError:
+            ok, detail = False, f"{self._timeout}秒以内に応答がありませんでした"
+        except Exception as e:
+            ok, detail = _reached_backend(e), f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - started_at
+
+        _WARMUP_SECONDS.set(seconds, backend=backend)
+        if not ok:
+            _WARMUP_FAILURES.inc(backend=backend)
+            logger.warning(f"{backend} のウォームアップに失敗しました: {detail}")
+        return WarmupResult(
+            backend=backend,
+            seconds=round(seconds, 4),
+            ok=ok,
+            skipped=skipped,
+            detail=detail,
+        )
+
+    async def warm_up(self) -> dict:
+        """すべてのバックエンドをウォームアップし、バックエンドごとの結果と全体の所要時間を返す。"""
+        started_at = time.perf_counter()
+        results = await asyncio.gather(
+            self._run("speech", self._warm_speech, client_timeout=True),
+            self._run("tts", self._warm_tts, client_timeout=True),
+            self._run("genai", self._warm_genai, client_timeout=True),
+            self._run("gemini", self._warm_gemini),
+            self._run("firestore", self._warm_firestore),
+            self._run("storage", self._warm_storage),
+        )
+        total_seconds = time.perf_counter() - started_at
+        logger.info(f"ウォームアップが完了しました（{total_seconds:.2f}秒）。")
+        return {
+            "total_seconds": round(total_seconds, 4),
+            "backends": {result.backend: asdict(result) for result in results},
+        }
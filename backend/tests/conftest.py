@@ -0,0 +1,28 @@
+# Settings の必須項目をダミー値で補完する（既存の環境変数が優先）
+import bench  # noqa: F401
+import pytest
+from bench.fake_firestore import FakeFirestoreClient
+from bench.fakes import FakeBackendConfig
+from services.blocking_executor import BlockingCallExecutor
+from services.storage_service import LocalStorageBackend, StorageService
+
+
+@pytest.fixture
+def firestore_client() -> FakeFirestoreClient:
+    """遅延なしで応答するフェイクのFirestoreクライアント。"""
+    return FakeFirestoreClient(FakeBackendConfig(setup_latency=0.0))
+
+
+@pytest.fixture
+def local_storage(tmp_path):
+    """一時ディレクトリに保存するStorageService。"""
+    storage = StorageService(
+        backend=LocalStorageBackend(str(tmp_path)),
+        executor=BlockingCallExecutor(max_workers=2, name="test-storage"),
+        retry_attempts=1,
+        retry_initial_backoff_seconds=0.0,
+        retry_max_backoff_seconds=0.0,
+        retry_deadline_seconds=1.0,
+    )
+    yield storage
+    storage.shutdown()
@@ -0,0 +1,28 @@
+import pytest
+from services.answer_cache import normalize_question
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        # 句読点・記号・空白の有無
+        ("そらはなんであおいの？", "そらはなんであおいの"),
+        ("そらは、なんで　あおいの!?", "そらはなんであおいの"),
+        # 全角・半角の英数字とカタカナ
+        ("ＡＢＣってなに？", "abcってなに"),
+        ("ｶﾀﾂﾑﾘはどこにいるの", "カタツムリはどこにいるの"),
+        ("１＋１は？", "11は"),
+    ],
+)
+def test_variants_normalize_to_the_same_key(a, b):
+    assert normalize_question(a) == normalize_question(b)
+
+
+def test_different_questions_stay_different():
+    assert normalize_question("そらはなんであおいの") != normalize_question(
+        "うみはなんであおいの"
+    )
+
+
+def test_only_punctuation_normalizes_to_empty():
+    assert normalize_question(" 、。？！\n") == ""
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from services.explanation_stream import IncrementalJsonObjectParser
+
+DOCUMENT = {
+    "child_explanation": 'そらが "あおい" のはね、\nひかりがちらばるから。',
+    "parent_hint": "レイリー散乱",
+    "nested": {"list": [1, {"a": "}"}], "empty": {}},
+    "number": -1.5e3,
+    "flag": True,
+    "nothing": None,
+}
+
+
+def _feed_all(chunks: list[str]) -> tuple[list, IncrementalJsonObjectParser]:
+    parser = IncrementalJsonObjectParser()
+    fields = []
+    for chunk in chunks:
+        fields.extend(parser.feed(chunk))
+    return fields, parser
+
+
+def test_whole_document():
+    fields, parser = _feed_all([json.dumps(DOCUMENT, ensure_ascii=False)])
+    assert fields == list(DOCUMENT.items())
+    assert parser.done
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_split_at_any_position(size):
+    text = json.dumps(DOCUMENT, ensure_ascii=False, indent=2)
+    chunks = [text[i : i + size] for i in range(0, len(text), size)]
+    fields, parser = _feed_all(chunks)
+    assert fields == list(DOCUMENT.items())
+    assert parser.done
+
+
+def test_field_is_returned_as_soon_as_it_is_complete():
+    parser = IncrementalJsonObjectParser()
+    assert parser.feed('{"parent_hint": "ヒ') == []
+    assert parser.feed('ント", "child_') == [("parent_hint", "ヒント")]
+    # 数値は区切り文字が届くまで確定しない
+    assert parser.feed('explanation": 12') == []
+    assert parser.feed("3}") == [("child_explanation", 123)]
+    assert parser.done
+
+
+def test_escaped_quotes_and_backslashes():
+    value = 'a\\"b\\\\'
+    fields, _ = _feed_all(['{"k": "', value[:2], value[2:], '"}'])
+    assert fields == [("k", 'a"b\\')]
+
+
+def test_empty_object():
+    fields, parser = _feed_all(["  { ", " }"])
+    assert fields == []
+    assert parser.done
+
+
+def test_input_after_the_object_is_ignored():
+    fields, parser = _feed_all(['{"a": 1}', '{"b": 2}'])
+    assert fields == [("a", 1)]
+    assert parser.done
+
+
+@pytest.mark.parametrize("text", ['["a"]', '{"a" 1}', '{"a": 1 "b": 2}', "{a: 1}"])
+def test_invalid_input(text):
+    with pytest.raises(ValueError):
+        IncrementalJsonObjectParser().feed(text)
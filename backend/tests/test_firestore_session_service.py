@@ -0,0 +1,60 @@
+import asyncio
+
+from google.adk.events import Event, EventActions
+from services.firestore_session_service import FirestoreSessionService
+from services.session_cache import SessionCache
+
+APP = "app"
+USER = "user"
+
+
+def _service(firestore_client) -> FirestoreSessionService:
+    return FirestoreSessionService(
+        firestore_client,
+        lean_writes=True,
+        cache=SessionCache(max_entries=10, ttl_seconds=60.0),
+    )
+
+
+def _event(event_id: str, **state_delta) -> Event:
+    return Event(
+        id=event_id,
+        author="agent",
+        actions=EventActions(state_delta=state_delta),
+    )
+
+
+async def _state(service: FirestoreSessionService, session_id: str) -> dict:
+    session = await service.get_session(
+        app_name=APP, user_id=USER, session_id=session_id
+    )
+    return session.state
+
+
+def test_state_delta_is_applied_to_the_cache(firestore_client):
+    async def scenario():
+        service = _service(firestore_client)
+        session = await service.create_session(app_name=APP, user_id=USER)
+        await service.append_event(session, _event("e1", answer="42"))
+        firestore_client.reset_counts()
+        assert await _state(service, session.id) == {"answer": "42"}
+        assert firestore_client.counts_by_collection() == {}
+
+    asyncio.run(scenario())
+
+
+def test_existing_event_evicts_the_cached_session(firestore_client):
+    async def scenario():
+        service = _service(firestore_client)
+        session = await service.create_session(app_name=APP, user_id=USER)
+        # 応答が失われた書き込みのように、イベントとstate_deltaはFirestoreにだけある
+        path = f"adk_sessions/{session.id}"
+        data = firestore_client.read(path)
+        data["state"] = {"answer": "42"}
+        firestore_client.seed(path, data)
+        firestore_client.seed(f"{path}/events/e1", {"id": "e1"})
+
+        await service.append_event(session, _event("e1", answer="42"))
+        assert await _state(service, session.id) == {"answer": "42"}
+
+    asyncio.run(scenario())
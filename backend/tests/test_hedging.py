@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+from services.hedging import HedgedCaller
+
+
+def _hedger(**overrides) -> HedgedCaller:
+    options = dict(
+        backend="test", enabled=True, percentile=90, min_samples=3, window_size=10
+    )
+    options.update(overrides)
+    return HedgedCaller(**options)
+
+
+def _backend(latencies: list[float]):
+    """呼び出しごとに `latencies` の順に応答時間が変わるバックエンド。"""
+    calls = []
+
+    async def fn():
+        index = len(calls)
+        calls.append(index)
+        await asyncio.sleep(latencies[min(index, len(latencies) - 1)])
+        return index
+
+    return fn, calls
+
+
+def _warm_up(hedger: HedgedCaller, latency: float = 0.01) -> None:
+    """ヘッジの待ち時間が決まるまで、速い応答を観測させる。"""
+
+    async def fast():
+        await asyncio.sleep(latency)
+
+    async def run():
+        for _ in range(3):
+            await hedger.call(fast)
+
+    asyncio.run(run())
+
+
+def test_no_hedge_until_min_samples():
+    hedger = _hedger()
+    assert hedger.hedge_delay() is None
+    fn, calls = _backend([0.05])
+    assert asyncio.run(hedger.call(fn)) == 0
+    assert calls == [0]
+    assert hedger.stats()["hedged"] == 0
+
+
+def test_disabled_does_not_record_or_hedge():
+    hedger = _hedger(enabled=False)
+    _warm_up(hedger)
+    assert hedger.hedge_delay() is None
+    assert hedger.stats()["requests"] == 0
+
+
+def test_hedge_delay_follows_the_percentile():
+    hedger = _hedger(percentile=50, min_samples=1)
+
+    async def run():
+        for latency in (0.01, 0.02, 0.2):
+            await hedger.call(lambda latency=latency: asyncio.sleep(latency))
+
+    asyncio.run(run())
+    assert hedger.hedge_delay() == pytest.approx(0.02, abs=0.01)
+
+
+def test_slow_primary_is_hedged_and_second_wins():
+    hedger = _hedger()
+    _warm_up(hedger)
+    fn, calls = _backend([1.0, 0.01])
+    assert asyncio.run(hedger.call(fn)) == 1
+    assert calls == [0, 1]
+    assert hedger.stats()["hedged"] == 1
+    assert hedger.stats()["wins"] == 1
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = _hedger()
+    _warm_up(hedger, latency=0.05)
+    fn, calls = _backend([0.01])
+    assert asyncio.run(hedger.call(fn)) == 0
+    assert calls == [0]
+
+
+def test_can_hedge_false_waits_for_primary():
+    hedger = _hedger()
+    _warm_up(hedger)
+    fn, calls = _backend([0.1, 0.01])
+    checked = []
+
+    def can_hedge() -> bool:
+        checked.append(None)
+        return False
+
+    assert asyncio.run(hedger.call(fn, can_hedge=can_hedge)) == 0
+    assert calls == [0]
+    assert len(checked) == 1
+    assert hedger.stats()["hedged"] == 0
+
+
+def test_failed_attempt_falls_back_to_the_other():
+    hedger = _hedger()
+    _warm_up(hedger)
+    calls = []
+
+    async def fn():
+        calls.append(None)
+        if len(calls) == 1:
+            await asyncio.sleep(0.1)
+            raise RuntimeError("primary failed")
+        await asyncio.sleep(0.2)
+        return "secondary"
+
+    assert asyncio.run(hedger.call(fn)) == "secondary"
+
+
+def test_both_failing_raises_the_primary_error():
+    hedger = _hedger()
+    _warm_up(hedger)
+    calls = []
+
+    async def fn():
+        calls.append(None)
+        attempt = len(calls)
+        await asyncio.sleep(0.1)
+        raise RuntimeError(f"attempt {attempt}")
+
+    with pytest.raises(RuntimeError, match="attempt 1"):
+        asyncio.run(hedger.call(fn))
+    assert len(calls) == 2
+
+
+def test_losing_attempt_is_cancelled():
+    hedger = _hedger()
+    _warm_up(hedger)
+    cancelled = []
+
+    async def fn():
+        if not cancelled:
+            cancelled.append(False)
+            try:
+                await asyncio.sleep(1.0)
+            except asyncio.CancelledError:
+                cancelled[0] = True
+                raise
+        return "fast"
+
+    async def run():
+        result = await hedger.call(fn)
+        # キャンセルが届くまで1回イベントループを回す
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "fast"
+    assert cancelled == [True]
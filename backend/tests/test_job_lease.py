@@ -0,0 +1,242 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from models.agent_models import JobNotResumableError
+from services.job_lease import (
+    JobLeaseManager,
+    LeaseOutcome,
+    interrupt_job,
+    reopen_job,
+)
+
+COLLECTION = "jobs"
+
+
+def _manager(client, owner: str = "me", **overrides) -> JobLeaseManager:
+    options = dict(ttl_seconds=30, renew_interval_seconds=10)
+    options.update(overrides)
+    return JobLeaseManager(client, COLLECTION, owner=owner, **options)
+
+
+def _expires_in(seconds: float) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+def _job(client, job_id: str) -> dict | None:
+    return client.read(f"{COLLECTION}/{job_id}")
+
+
+def test_claim_new_job(firestore_client):
+    lease = asyncio.run(_manager(firestore_client).claim("job"))
+    assert lease.outcome == LeaseOutcome.claimed
+    assert lease.acquired
+    assert lease.attempt == 1
+    assert _job(firestore_client, "job")["lease"]["owner"] == "me"
+
+
+@pytest.mark.parametrize("status", ["completed", "error"])
+def test_finished_job_is_not_run(firestore_client, status):
+    firestore_client.seed(f"{COLLECTION}/job", {"status": status})
+    lease = asyncio.run(_manager(firestore_client).claim("job"))
+    assert lease.outcome == LeaseOutcome.finished
+    assert not lease.acquired
+
+
+def test_job_leased_by_another_instance_is_not_run(firestore_client):
+    firestore_client.seed(
+        f"{COLLECTION}/job",
+        {
+            "status": "processing",
+            "lease": {"owner": "other", "expiresAt": _expires_in(30)},
+        },
+    )
+    lease = asyncio.run(_manager(firestore_client).claim("job"))
+    assert lease.outcome == LeaseOutcome.in_flight
+
+
+def test_expired_lease_is_reclaimed(firestore_client):
+    firestore_client.seed(
+        f"{COLLECTION}/job",
+        {
+            "status": "processing",
+            "lease": {"owner": "other", "expiresAt": _expires_in(-1), "attempt": 1},
+        },
+    )
+    lease = asyncio.run(_manager(firestore_client).claim("job"))
+    assert lease.outcome == LeaseOutcome.reclaimed
+    assert lease.attempt == 2
+    assert _job(firestore_client, "job")["lease"]["owner"] == "me"
+
+
+def test_duplicate_delivery_to_the_same_instance(firestore_client):
+    manager = _manager(firestore_client)
+
+    async def run():
+        first = await manager.claim("job")
+        second = await manager.claim("job")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.acquired
+    assert second.outcome == LeaseOutcome.in_flight
+
+
+def test_renew_fails_after_takeover(firestore_client):
+    manager = _manager(firestore_client)
+
+    async def run():
+        await manager.claim("job")
+        renewed = await manager.renew("job")
+        firestore_client.seed(
+            f"{COLLECTION}/job",
+            {"lease": {"owner": "other", "expiresAt": _expires_in(30)}},
+        )
+        return renewed, await manager.renew("job")
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_hold_keeps_the_lease_on_success(firestore_client):
+    manager = _manager(firestore_client)
+
+    async def run():
+        async with manager.hold("job") as lease:
+            assert lease.acquired
+        # 正常終了時はジョブが終了ステータスを書き込むため、リースは残す
+        return await manager.claim("job")
+
+    assert asyncio.run(run()).outcome == LeaseOutcome.reclaimed
+
+
+def test_hold_releases_the_lease_on_error(firestore_client):
+    manager = _manager(firestore_client)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            async with manager.hold("job"):
+                raise RuntimeError("boom")
+
+    asyncio.run(run())
+    assert "lease" not in _job(firestore_client, "job")
+
+
+def test_hold_stops_the_job_when_the_lease_is_taken_over(firestore_client):
+    manager = _manager(firestore_client, renew_interval_seconds=0.01)
+    steps = []
+
+    async def run():
+        async with manager.hold("job") as lease:
+            firestore_client.seed(
+                f"{COLLECTION}/job",
+                {"lease": {"owner": "other", "expiresAt": _expires_in(30)}},
+            )
+            for step in range(100):
+                await asyncio.sleep(0.01)
+                steps.append(step)
+        return lease
+
+    lease = asyncio.run(run())
+    assert lease.lost
+    assert len(steps) < 100
+    # 引き継いだインスタンスのリースは解放しない
+    assert _job(firestore_client, "job")["lease"]["owner"] == "other"
+
+
+def test_hold_propagates_shutdown_cancellation(firestore_client):
+    manager = _manager(firestore_client)
+
+    async def run():
+        async def job():
+            async with manager.hold("job"):
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(job())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert "lease" not in _job(firestore_client, "job")
+
+
+def _seed_job(client, **fields) -> None:
+    client.seed(
+        f"{COLLECTION}/job",
+        {"userId": "user", "objectName": "user/job.wav", **fields},
+    )
+
+
+def test_reopen_failed_job(firestore_client):
+    _seed_job(
+        firestore_client,
+        status="error",
+        errorMessage="boom",
+        lease={"owner": "other", "expiresAt": _expires_in(30)},
+    )
+    data = asyncio.run(reopen_job(firestore_client, COLLECTION, "job"))
+    assert data["objectName"] == "user/job.wav"
+    job = _job(firestore_client, "job")
+    assert job["status"] == "initializing"
+    assert "errorMessage" not in job
+    assert "lease" not in job
+
+
+@pytest.mark.parametrize(
+    "fields, reason",
+    [
+        (None, "not_found"),
+        ({"status": "completed"}, "completed"),
+        (
+            {
+                "status": "processing",
+                "lease": {"owner": "other", "expiresAt": _expires_in(30)},
+            },
+            "in_flight",
+        ),
+        ({"status": "error", "objectName": None}, "missing_source"),
+    ],
+)
+def test_reopen_refuses(firestore_client, fields, reason):
+    if fields is not None:
+        _seed_job(firestore_client, **fields)
+    with pytest.raises(JobNotResumableError) as excinfo:
+        asyncio.run(reopen_job(firestore_client, COLLECTION, "job"))
+    assert excinfo.value.reason == reason
+
+
+def test_reopen_stalled_job_with_expired_lease(firestore_client):
+    _seed_job(
+        firestore_client,
+        status="processing",
+        lease={"owner": "other", "expiresAt": _expires_in(-1)},
+    )
+    asyncio.run(reopen_job(firestore_client, COLLECTION, "job"))
+    assert _job(firestore_client, "job")["status"] == "initializing"
+
+
+def test_interrupt_job(firestore_client):
+    _seed_job(firestore_client, status="processing")
+    assert asyncio.run(interrupt_job(firestore_client, COLLECTION, "job", "stopped"))
+    job = _job(firestore_client, "job")
+    assert job["status"] == "error"
+    assert job["errorMessage"] == "stopped"
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"status": "completed"},
+        {
+            "status": "processing",
+            "lease": {"owner": "other", "expiresAt": _expires_in(30)},
+        },
+    ],
+)
+def test_interrupt_job_leaves_finished_or_leased_jobs(firestore_client, fields):
+    _seed_job(firestore_client, **fields)
+    assert not asyncio.run(
+        interrupt_job(firestore_client, COLLECTION, "job", "stopped")
+    )
+    assert _job(firestore_client, "job")["status"] == fields["status"]
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from services import firestore_service
+from services.firestore_service import JobUpdateBuffer
+
+JOB_ID = "job"
+
+
+class _FlakyWriter:
+    """`_update_job` の代わりに、最初の `failures` 回だけ失敗して書き込みを記録する。"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.attempts = 0
+        self.writes: list[dict] = []
+
+    async def __call__(self, db, job_id: str, payload: dict) -> None:
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise RuntimeError("unavailable")
+        self.writes.append(payload)
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    def install(failures: int) -> _FlakyWriter:
+        flaky = _FlakyWriter(failures)
+        monkeypatch.setattr(firestore_service, "_update_job", flaky)
+        monkeypatch.setattr(firestore_service, "_RETRY_MIN_DELAY_SECONDS", 0.01)
+        return flaky
+
+    return install
+
+
+def test_updates_are_coalesced(writer):
+    flaky = writer(failures=0)
+
+    async def scenario():
+        buffer = JobUpdateBuffer(debounce_seconds=0.05, max_delay_seconds=1.0)
+        await buffer.update(object(), JOB_ID, {"a": 1})
+        await buffer.update(object(), JOB_ID, {"b": 2})
+        await asyncio.sleep(0.1)
+        assert flaky.writes == [{"a": 1, "b": 2}]
+        # 書き込み済みの値は再送しない
+        await buffer.update(object(), JOB_ID, {"a": 1}, immediate=True)
+        assert flaky.writes == [{"a": 1, "b": 2}]
+
+    asyncio.run(scenario())
+
+
+def test_failed_write_is_retried_by_the_timer(writer):
+    flaky = writer(failures=1)
+
+    async def scenario():
+        buffer = JobUpdateBuffer(debounce_seconds=0.05, max_delay_seconds=1.0)
+        with pytest.raises(RuntimeError):
+            await buffer.update(object(), JOB_ID, {"a": 1}, immediate=True)
+        await buffer.update(object(), JOB_ID, {"b": 2})
+        await asyncio.sleep(0.15)
+        assert flaky.writes == [{"a": 1, "b": 2}]
+
+    asyncio.run(scenario())
+
+
+def test_retry_is_not_later_than_max_delay(writer):
+    flaky = writer(failures=1)
+
+    async def scenario():
+        buffer = JobUpdateBuffer(debounce_seconds=0.2, max_delay_seconds=0.25)
+        await buffer.update(object(), JOB_ID, {"a": 1})
+        # 0.2秒後の書き込みが失敗し、再試行は最初の更新から0.25秒後に行われる
+        await asyncio.sleep(0.32)
+        assert flaky.writes == [{"a": 1}]
+
+    asyncio.run(scenario())
+
+
+def test_close_cancels_the_retry(writer):
+    flaky = writer(failures=2)
+
+    async def scenario():
+        buffer = JobUpdateBuffer(debounce_seconds=0.05, max_delay_seconds=1.0)
+        with pytest.raises(RuntimeError):
+            await buffer.update(object(), JOB_ID, {"a": 1}, immediate=True)
+        await buffer.close(JOB_ID)
+        await asyncio.sleep(0.15)
+        assert flaky.attempts == 2
+        assert flaky.writes == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+from services.rate_limiter import BackendRateLimiter, is_quota_error
+
+
+def _limiter(**overrides) -> BackendRateLimiter:
+    options = dict(
+        backend="test",
+        requests_per_minute=0,
+        burst=5,
+        decrease_factor=0.5,
+        recovery_seconds=60.0,
+        initial_backoff_seconds=0.01,
+        max_backoff_seconds=0.02,
+        max_wait_seconds=1.0,
+        window_seconds=60.0,
+    )
+    options.update(overrides)
+    return BackendRateLimiter(**options)
+
+
+def _failing(times: int):
+    """最初の `times` 回はクォータ超過で失敗し、その後は成功する呼び出し。"""
+    calls = []
+
+    async def fn():
+        calls.append(None)
+        if len(calls) <= times:
+            raise google_exceptions.TooManyRequests("quota exceeded")
+        return len(calls)
+
+    return fn, calls
+
+
+async def _ok():
+    return "ok"
+
+
+def test_is_quota_error():
+    assert is_quota_error(google_exceptions.TooManyRequests("quota"))
+    assert is_quota_error(google_exceptions.ResourceExhausted("quota"))
+    assert not is_quota_error(google_exceptions.InternalServerError("boom"))
+    assert not is_quota_error(ValueError("boom"))
+
+
+def test_unlimited_until_quota_error():
+    limiter = _limiter()
+
+    async def run():
+        await asyncio.gather(*(limiter.call(_ok) for _ in range(50)))
+
+    asyncio.run(run())
+    assert limiter.requests_per_minute is None
+
+
+def test_burst_then_quota_error_uses_observed_period():
+    # 起動直後のバーストの後にクォータ超過を受け取っても、
+    # 上限を観測期間全体（60秒）で割った値まで下げない
+    limiter = _limiter()
+    fn, calls = _failing(times=1)
+
+    async def run():
+        for _ in range(20):
+            await limiter.call(_ok)
+        return await limiter.call(fn)
+
+    assert asyncio.run(run()) == 2
+    assert len(calls) == 2
+    # 21回/1秒（観測期間の下限）の半分
+    assert limiter.requests_per_minute == pytest.approx(21 * 60 * 0.5, rel=0.1)
+
+
+def test_observed_rate_is_bounded_by_window():
+    limiter = _limiter(window_seconds=10.0)
+    now = 1000.0
+    # 30秒前から1秒ごとに送った30件のうち、直近10秒間の分だけを数える
+    limiter._issued.extend(now - 30 + i for i in range(30))
+    assert limiter._observed_rate(now) == pytest.approx(1.0, rel=0.1)
+    limiter._issued.clear()
+    assert limiter._observed_rate(now) == 0.0
+
+
+def test_quota_error_decreases_configured_limit():
+    limiter = _limiter(requests_per_minute=600, burst=100, recovery_seconds=3600)
+    fn, _ = _failing(times=1)
+    asyncio.run(limiter.call(fn))
+    # 下げた直後の1回の成功ではほとんど戻らない
+    assert limiter.requests_per_minute == pytest.approx(300, rel=0.05)
+
+
+def test_limit_recovers_to_ceiling():
+    limiter = _limiter(requests_per_minute=600, burst=100, recovery_seconds=0.05)
+    fn, _ = _failing(times=1)
+
+    async def run():
+        await limiter.call(fn)
+        await asyncio.sleep(0.1)
+        await limiter.call(_ok)
+
+    asyncio.run(run())
+    assert limiter.requests_per_minute == pytest.approx(600)
+
+
+def test_gives_up_after_max_wait():
+    limiter = _limiter(
+        requests_per_minute=600,
+        burst=100,
+        initial_backoff_seconds=0.05,
+        max_backoff_seconds=0.05,
+        max_wait_seconds=0.1,
+    )
+    fn, calls = _failing(times=100)
+    with pytest.raises(google_exceptions.TooManyRequests):
+        asyncio.run(limiter.call(fn))
+    assert 1 < len(calls) < 100
+
+
+def test_other_errors_are_not_retried():
+    limiter = _limiter()
+    calls = []
+
+    async def fn():
+        calls.append(None)
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(limiter.call(fn))
+    assert len(calls) == 1
+    assert limiter.requests_per_minute is None
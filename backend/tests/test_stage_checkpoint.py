@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from services import stage_checkpoint
+from services.stage_checkpoint import StageCheckpoints
+
+BUCKET = "bench-generated-image"
+IMAGE = f"gs://{BUCKET}/user/job/image.png"
+AUDIO = f"gs://{BUCKET}/user/job/audio.mp3"
+
+EXPLANATION = {
+    "child_explanation": "そらがあおいのはね、ひかりがちらばるから。",
+    "parent_hint": "レイリー散乱",
+    "illustration_prompt": "青い空",
+    "child_explanation_ssml": "<speak>そらがあおいのはね</speak>",
+    "needs_clarification": False,
+}
+
+
+@pytest.fixture(autouse=True)
+def storage(local_storage, monkeypatch):
+    monkeypatch.setattr(stage_checkpoint, "get_storage_service", lambda: local_storage)
+    return local_storage
+
+
+def _state(**overrides) -> dict:
+    state = {
+        "transcribed_text": "そらはなんであおいの",
+        "explanation_data": EXPLANATION,
+        "illustration": {"job_id": "job", "image_gcs_path": IMAGE},
+        "narration": {"job_id": "job", "final_audio_gcs_path": AUDIO},
+    }
+    state.update(overrides)
+    return state
+
+
+def _upload(storage, gcs_uri: str) -> None:
+    blob_name = gcs_uri.removeprefix(f"gs://{BUCKET}/")
+    asyncio.run(
+        storage.upload_blob_from_memory(BUCKET, blob_name, b"data", "image/png")
+    )
+
+
+def _reusable(checkpoints: StageCheckpoints, stage: str, state: dict) -> bool:
+    return asyncio.run(checkpoints.reusable_output("job", stage, state))
+
+
+def test_valid_outputs_are_reused(storage):
+    _upload(storage, IMAGE)
+    _upload(storage, AUDIO)
+    checkpoints = StageCheckpoints()
+    for stage in stage_checkpoint.STAGE_OUTPUT_KEYS:
+        assert _reusable(checkpoints, stage, _state()), stage
+
+
+@pytest.mark.parametrize(
+    "stage, overrides",
+    [
+        ("TranscriberAgent", {"transcribed_text": "  "}),
+        ("ExplainerAgent", {"explanation_data": {"child_explanation": "a"}}),
+        ("IllustratorAgent", {"illustration": None}),
+        ("NarratorAgent", {"narration": {"job_id": "job"}}),
+    ],
+)
+def test_missing_or_invalid_outputs_are_regenerated(stage, overrides):
+    checkpoints = StageCheckpoints()
+    assert not _reusable(checkpoints, stage, _state(**overrides))
+
+
+def test_output_whose_file_is_gone_is_regenerated(storage):
+    _upload(storage, AUDIO)
+    checkpoints = StageCheckpoints()
+    assert not _reusable(checkpoints, "IllustratorAgent", _state())
+    assert _reusable(checkpoints, "NarratorAgent", _state())
+
+
+def test_downstream_stages_rerun_after_upstream_is_regenerated(storage):
+    _upload(storage, IMAGE)
+    _upload(storage, AUDIO)
+    checkpoints = StageCheckpoints()
+    state = _state(explanation_data=None)
+    assert _reusable(checkpoints, "TranscriberAgent", state)
+    assert not _reusable(checkpoints, "ExplainerAgent", state)
+    # 解説を生成し直したため、保存済みのイラストと音声は古い解説から作られている
+    assert not _reusable(checkpoints, "IllustratorAgent", _state())
+    assert not _reusable(checkpoints, "NarratorAgent", _state())
+
+
+def test_discard_forgets_regenerated_stages(storage):
+    _upload(storage, IMAGE)
+    checkpoints = StageCheckpoints()
+    checkpoints.mark_regenerated("job", "ExplainerAgent")
+    assert checkpoints.upstream_regenerated("job", "IllustratorAgent")
+    checkpoints.discard("job")
+    assert not checkpoints.upstream_regenerated("job", "IllustratorAgent")
+    assert _reusable(checkpoints, "IllustratorAgent", _state())
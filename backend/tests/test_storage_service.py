@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+import requests
+from google.api_core import exceptions as google_exceptions
+from services.blocking_executor import BlockingCallExecutor
+from services.storage_service import (
+    GcsStorageBackend,
+    LocalStorageBackend,
+    StorageService,
+    is_transient_error,
+)
+
+BUCKET = "bucket"
+
+
+@pytest.fixture
+def backend(tmp_path) -> LocalStorageBackend:
+    return LocalStorageBackend(str(tmp_path))
+
+
+class _FlakyBackend(LocalStorageBackend):
+    """`upload` が最初の `failures` 回、`error` で失敗する保存先。"""
+
+    def __init__(self, root_dir: str, error: Exception, failures: int):
+        super().__init__(root_dir)
+        self.error = error
+        self.failures = failures
+        self.attempts = 0
+
+    def upload(self, bucket_name, blob_name, data, content_type):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error
+        super().upload(bucket_name, blob_name, data, content_type)
+
+
+def _service(backend, **overrides) -> StorageService:
+    options = dict(
+        retry_attempts=3,
+        retry_initial_backoff_seconds=0.0,
+        retry_max_backoff_seconds=0.0,
+        retry_deadline_seconds=10.0,
+    )
+    options.update(overrides)
+    return StorageService(
+        backend=backend,
+        executor=BlockingCallExecutor(max_workers=1, name="test-storage"),
+        **options,
+    )
+
+
+def _upload(service: StorageService) -> str:
+    try:
+        return asyncio.run(
+            service.upload_blob_from_memory(BUCKET, "a/b.txt", b"data", "text/plain")
+        )
+    finally:
+        service.shutdown()
+
+
+def test_local_round_trip(backend):
+    backend.upload(BUCKET, "a/b.txt", b"hello", "text/plain")
+    assert backend.get_size(BUCKET, "a/b.txt") == 5
+    backend.copy(BUCKET, "a/b.txt", "c/d.txt")
+    backend.rename(BUCKET, "a/b.txt", "a/e.txt")
+    assert backend.get_size(BUCKET, "a/b.txt") is None
+    with backend.open_reader(BUCKET, "c/d.txt", read_size=1) as reader:
+        assert reader.read() == b"hello"
+    backend.delete(BUCKET, "a/e.txt")
+    assert backend.get_size(BUCKET, "a/e.txt") is None
+
+
+@pytest.mark.parametrize(
+    "operation",
+    [
+        lambda b: b.copy(BUCKET, "missing", "other"),
+        lambda b: b.rename(BUCKET, "missing", "other"),
+        lambda b: b.delete(BUCKET, "missing"),
+        lambda b: b.open_reader(BUCKET, "missing", read_size=1),
+    ],
+    ids=["copy", "rename", "delete", "open_reader"],
+)
+def test_local_missing_object_raises_not_found(backend, operation):
+    with pytest.raises(google_exceptions.NotFound):
+        operation(backend)
+
+
+def test_local_list_filters_by_prefix(backend):
+    for name in ("temp_generations/1.png", "temp_generations/2.png", "user/1.png"):
+        backend.upload(BUCKET, name, b"x", "image/png")
+    blobs = backend.list(BUCKET, "temp_generations/")
+    assert [blob.name for blob in blobs] == [
+        "temp_generations/1.png",
+        "temp_generations/2.png",
+    ]
+    assert all(blob.size == 1 and blob.time_created for blob in blobs)
+    assert backend.list("other-bucket", "") == []
+
+
+def test_get_blob_size_of_missing_object_is_zero(local_storage):
+    assert asyncio.run(local_storage.get_blob_size(f"gs://{BUCKET}/missing")) == 0
+
+
+def test_transient_errors_are_retried(tmp_path):
+    backend = _FlakyBackend(
+        str(tmp_path), google_exceptions.ServiceUnavailable("busy"), failures=2
+    )
+    assert _upload(_service(backend)) == f"gs://{BUCKET}/a/b.txt"
+    assert backend.attempts == 3
+    assert backend.get_size(BUCKET, "a/b.txt") == 4
+
+
+def test_retries_stop_after_the_attempt_budget(tmp_path):
+    backend = _FlakyBackend(
+        str(tmp_path), google_exceptions.ServiceUnavailable("busy"), failures=10
+    )
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        _upload(_service(backend))
+    assert backend.attempts == 3
+
+
+def test_retries_stop_at_the_deadline(tmp_path):
+    backend = _FlakyBackend(
+        str(tmp_path), google_exceptions.ServiceUnavailable("busy"), failures=1000
+    )
+    service = _service(
+        backend,
+        retry_attempts=100,
+        retry_initial_backoff_seconds=0.05,
+        retry_max_backoff_seconds=0.05,
+        retry_deadline_seconds=0.2,
+    )
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        _upload(service)
+    assert 1 < backend.attempts < 100
+
+
+@pytest.mark.parametrize(
+    "error",
+    [google_exceptions.Forbidden("denied"), ValueError("bad data")],
+    ids=["forbidden", "value_error"],
+)
+def test_non_transient_errors_are_not_retried(tmp_path, error):
+    backend = _FlakyBackend(str(tmp_path), error, failures=10)
+    with pytest.raises(type(error)):
+        _upload(_service(backend))
+    assert backend.attempts == 1
+
+
+def test_ssl_error_in_the_chain_is_transient():
+    try:
+        try:
+            raise requests.exceptions.SSLError("bad record mac")
+        except requests.exceptions.SSLError as e:
+            raise RuntimeError("upload failed") from e
+    except RuntimeError as e:
+        assert is_transient_error(e)
+    assert not is_transient_error(RuntimeError("upload failed"))
+
+
+class _RecordingBlob:
+    def __init__(self, uploads: list):
+        self._uploads = uploads
+        self.chunk_size = None
+
+    def upload_from_string(self, data, content_type=None):
+        self._uploads.append((len(data), self.chunk_size))
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.uploads = []
+
+    def bucket(self, bucket_name):
+        return self
+
+    def blob(self, blob_name):
+        return _RecordingBlob(self.uploads)
+
+
+def test_large_uploads_are_resumable(monkeypatch):
+    client = _RecordingClient()
+    monkeypatch.setattr(GcsStorageBackend, "_client", property(lambda self: client))
+    # チャンクサイズは256KiBの倍数に切り下げる（最小256KiB）
+    backend = GcsStorageBackend(
+        resumable_threshold_bytes=1024, resumable_chunk_bytes=300 * 1024
+    )
+    backend.upload(BUCKET, "small", b"x" * 1023, "audio/mpeg")
+    backend.upload(BUCKET, "large", b"x" * 1024, "audio/mpeg")
+    assert client.uploads == [(1023, None), (1024, 256 * 1024)]
+
+
+def test_resumable_upload_can_be_disabled(monkeypatch):
+    client = _RecordingClient()
+    monkeypatch.setattr(GcsStorageBackend, "_client", property(lambda self: client))
+    backend = GcsStorageBackend(resumable_threshold_bytes=0, resumable_chunk_bytes=0)
+    backend.upload(BUCKET, "large", b"x" * 1024 * 1024, "audio/mpeg")
+    assert client.uploads == [(1024 * 1024, None)]